@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import hashlib
+import io
+import os
+from SocketServer import ThreadingMixIn
+import subprocess
+import tarfile
+import threading
+import time
+
+
+__all__ = (
+    'create_archive',
+    'generate_repo',
+    'ArchiveServer',
+)
+
+
+FORMULA_TEMPLATE = '''#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from procyon.pkg.models import Formula as BaseFormula
+
+
+class Formula(BaseFormula):
+    name = %(name)r
+    info = %(info)r
+    version = %(version)r
+    url = %(url)r
+    md5sum = %(md5sum)r
+'''
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'procyon',
+    'GIT_AUTHOR_EMAIL': 'procyon@example.com',
+    'GIT_COMMITTER_NAME': 'procyon',
+    'GIT_COMMITTER_EMAIL': 'procyon@example.com',
+}
+
+
+def get_package_name(i):
+    return 'pkg%06d' % i
+
+
+def create_archive(size):
+    """Returns content of tar.gz archive with one file of passed size filled
+    with random bytes, so archive size is close to passed size.
+    """
+    content = os.urandom(size)
+    buf = io.BytesIO()
+
+    with tarfile.open(fileobj=buf, mode='w:gz') as arc:
+        info = tarfile.TarInfo('data.bin')
+        info.size = len(content)
+        info.mtime = time.time()
+        arc.addfile(info, io.BytesIO(content))
+
+    return buf.getvalue()
+
+
+def generate_repo(path, size, url, md5sum):
+    """Generates git repo with passed number of static formulas, archive url
+    of every formula is passed url followed by package name.
+    """
+    os.makedirs(path)
+
+    for i in range(size):
+        name = get_package_name(i)
+        with open(os.path.join(path, '%s.py' % name), 'wb') as f:
+            f.write((FORMULA_TEMPLATE % {
+                'name': str(name),
+                'info': str('Synthetic package number %d' % i),
+                'version': str('1.%d' % (i % 10)),
+                'url': str('%s%s.tar.gz' % (url, name)),
+                'md5sum': str(md5sum),
+            }).encode('utf-8'))
+
+    env = dict(os.environ, **GIT_ENV)
+    for args in (('init', '-q'), ('add', '-A'), ('commit', '-q', '-m', 'Formulas')):
+        subprocess.check_call(('git',) + args, cwd=path, env=env)
+
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-gzip')
+        self.send_header('Content-Length', str(len(self.server.archive)))
+        self.end_headers()
+        self.wfile.write(self.server.archive)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ArchiveServer(ThreadingMixIn, HTTPServer):
+    """Local HTTP server which serves the same archive for every path after
+    passed latency in seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self, archive, latency=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), ArchiveRequestHandler)
+        self.archive = archive
+        self.md5sum = hashlib.md5(archive).hexdigest()
+        self.latency = latency
+        self.thread = None
+
+    def handle_error(self, request, client_address):
+        # NOTE: clients close keep-alive connections at exit
+        pass
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Measures startup time of procyon commands. Every command is run in a new
+interpreter with separate procyon directory, so numbers include imports,
+settings loading and database opening. Every command is run lazily as it is
+run by client and eagerly, where everything which was done on import before
+settings, database and heavy modules were loaded lazily is done first, so
+eager timings are baseline of lazy ones. Medians of both are reported.
+
+    python benchmarks/startup.py --repeat 20
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# NOTE: work which was done on import of procyon before it was deferred
+EAGER_PRELUDE = '; '.join((
+    'import procyon',
+    'procyon.settings.load()',
+    'procyon.settings.REPO_PATH',
+    'from procyon.pkg.models import database',
+    'database.connect()',
+    'import tarfile, tempfile, zipfile',
+    'import procyon.pkg.archives, procyon.pkg.download',
+    'import procyon.repo.logic',
+))
+
+COMMANDS = (
+    ('import', 'import procyon'),
+    ('import core', 'import procyon.core'),
+    ('list installed', 'from procyon import core; core.freeze()'),
+    ('list outdated', 'from procyon import core; core.outdated()'),
+)
+
+
+def prepare_procyon_path():
+    procyon_path = tempfile.mkdtemp(prefix='procyon-startup-')
+    repo_path = os.path.join(procyon_path, 'formulas')
+    os.makedirs(repo_path)
+
+    with open(os.path.join(procyon_path, 'settings.json'), 'w') as f:
+        json.dump({'REMOTE_REPO': 'https://example.com/formulas.git'}, f)
+
+    return procyon_path
+
+
+def run_command(code, env):
+    started = time.time()
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+    return time.time() - started
+
+
+def run_timings(code, env, repeat):
+    return sorted(run_command(code, env) for _ in range(repeat))
+
+
+def run_benchmark(repeat):
+    """Returns list of '(name, eager_timings, lazy_timings)' tuples with
+    sorted timings of every command.
+    """
+    procyon_path = prepare_procyon_path()
+    env = dict(os.environ, PYTHONPATH=PROJECT_PATH, PROCYON_PATH=procyon_path)
+
+    try:
+        # NOTE: interpreter startup itself is the same in both modes
+        python = run_timings('pass', env, repeat)
+        results = [('python', python, python)]
+        for name, code in COMMANDS:
+            results.append((name, run_timings('%s; %s' % (EAGER_PRELUDE, code), env, repeat),
+                run_timings(code, env, repeat)))
+    finally:
+        shutil.rmtree(procyon_path)
+
+    return results
+
+
+def get_median(timings):
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures startup time of procyon commands.')
+    parser.add_argument('--repeat', type=int, default=10, help='runs of every command')
+    args = parser.parse_args()
+
+    print('%-16s %10s %10s %10s %10s %8s' % (
+        'command', 'eager, ms', 'lazy, ms', 'lazy min', 'lazy max', 'speedup'))
+    for name, eager, lazy in run_benchmark(max(1, args.repeat)):
+        print('%-16s %10.1f %10.1f %10.1f %10.1f %7.2fx' % (
+            name, get_median(eager), get_median(lazy), lazy[0] * 1000, lazy[-1] * 1000,
+            get_median(eager) / get_median(lazy)))
+
+
+if __name__ == '__main__':
+    main()
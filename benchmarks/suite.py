@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Measures procyon commands on synthetic formula repos. Archives are served
+by local HTTP server with configurable size and latency, so results do not
+depend on network. Every repo size is measured in separate interpreter with
+its own procyon directory, results are written as JSON.
+
+    python -m benchmarks.suite --sizes 100,10000 --archive-size 1048576 --latency 20
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import create_archive, generate_repo, get_package_name, ArchiveServer
+
+
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = '100,10000,100000'
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def get_result(size, operation, timings, **extra):
+    timings = sorted(timings)
+    result = {
+        'size': size,
+        'operation': operation,
+        'timings': timings,
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'max': timings[-1],
+    }
+    result.update(extra)
+    return result
+
+
+def measure(function, repeat=1, before=None):
+    """Returns list of timings and result of the last call of passed
+    function, 'before' function is called before every call and is not
+    measured.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.time()
+        result = function()
+        timings.append(time.time() - started)
+    return timings, result
+
+
+def count_errors(results, status):
+    return len([name for name, result_status in results if result_status != status])
+
+
+def run_size(size, options):
+    """Returns list of results for repo with passed size, must be called in
+    fresh interpreter because procyon settings and database are global.
+    """
+    path = tempfile.mkdtemp(prefix='procyon-benchmark-')
+    os.environ['PROCYON_PATH'] = os.path.join(path, 'procyon')
+    server = ArchiveServer(create_archive(options.archive_size), options.latency / 1000.0)
+    server.start()
+
+    try:
+        repo_path = os.path.join(path, 'formulas')
+        timings, _ = measure(lambda: generate_repo(repo_path, size, server.url, server.md5sum))
+        results = [get_result(size, 'generate', timings)]
+
+        os.makedirs(os.environ['PROCYON_PATH'])
+        with open(os.path.join(os.environ['PROCYON_PATH'], 'settings.json'), 'wb') as f:
+            json.dump({
+                'REMOTE_REPO': 'file://%s' % repo_path,
+                'REPO_PATH': repo_path,
+                'INSTALL_PATH': os.path.join(path, 'install'),
+                'ARCHIVES_CACHE_SIZE': options.archives_cache_size,
+            }, f)
+
+        results.extend(run_commands(size, options))
+    finally:
+        server.stop()
+        shutil.rmtree(path)
+
+    return results
+
+
+def run_commands(size, options):
+    from procyon import core
+    from procyon.pkg.catalog import get_catalog_path
+    from procyon.pkg.models import database, Package, InstallationStatuses
+    from procyon.pkg.session import get_session
+
+    def remove_catalog():
+        if os.path.exists(get_catalog_path()):
+            os.remove(get_catalog_path())
+
+    results = []
+    repeat = options.repeat
+
+    log('%d formulas: cache' % size)
+    timings, _ = measure(core.cache, options.cold_repeat, before=remove_catalog)
+    results.append(get_result(size, 'cache (cold)', timings))
+    timings, available = measure(core.cache, repeat)
+    results.append(get_result(size, 'cache', timings, packages=len(available)))
+
+    log('%d formulas: search' % size)
+    query = get_package_name(0)[:-2]
+    timings, found = measure(lambda: core.search(query), repeat)
+    results.append(get_result(size, 'search', timings, found=len(found)))
+
+    log('%d formulas: outdated' % size)
+    installed = [get_package_name(i) for i in range(min(size, options.installed))]
+    with database.transaction():
+        for name in installed:
+            Package.create(name=name, formula_name='%s.py' % name, version='1.0')
+    timings, outdated = measure(core.outdated, repeat)
+    results.append(get_result(size, 'outdated', timings, installed=len(installed), outdated=len(outdated)))
+    with database.transaction():
+        Package.delete().where(Package.name << installed).execute()
+
+    log('%d formulas: install and uninstall' % size)
+    names = [get_package_name(i) for i in range(min(size, options.install_count))]
+    install_timings, uninstall_timings = [], []
+    install_errors = uninstall_errors = 0
+    for _ in range(repeat):
+        timings, installed = measure(lambda: core.install(names))
+        install_timings.extend(timings)
+        install_errors += count_errors(installed, InstallationStatuses.INSTALL_OK)
+
+        timings, uninstalled = measure(lambda: core.uninstall(names))
+        uninstall_timings.extend(timings)
+        uninstall_errors += count_errors(uninstalled, InstallationStatuses.UNINSTALL_OK)
+    results.append(get_result(size, 'install', install_timings,
+        packages=len(names), archive_size=options.archive_size, latency=options.latency, errors=install_errors))
+    results.append(get_result(size, 'uninstall', uninstall_timings, packages=len(names), errors=uninstall_errors))
+    get_session().close()
+
+    return results
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(('git', 'rev-parse', 'HEAD'), cwd=PROJECT_PATH).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Measures procyon commands on synthetic formula repos.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated numbers of formulas')
+    parser.add_argument('--archive-size', type=int, default=1024 * 1024, help='archive size in bytes')
+    parser.add_argument('--latency', type=float, default=0, help='archive server latency in milliseconds')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of every command')
+    parser.add_argument('--cold-repeat', type=int, default=1, help='runs of cache command without catalog')
+    parser.add_argument('--installed', type=int, default=1000, help='installed packages for outdated command')
+    parser.add_argument('--install-count', type=int, default=10, help='packages installed by one command')
+    parser.add_argument('--archives-cache-size', type=int, default=0, help='archives cache size, 0 disables cache')
+    parser.add_argument('--output', help='file for JSON results, stdout is used by default')
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    options = get_arguments()
+
+    if options.size is not None:
+        json.dump(run_size(options.size, options), sys.stdout)
+        return
+
+    results = []
+    for size in [int(size) for size in options.sizes.split(',') if size]:
+        log('%d formulas: generating repo' % size)
+        args = [sys.executable, '-m', 'benchmarks.suite', '--size', str(size)] + sys.argv[1:]
+        env = dict(os.environ, PYTHONPATH=PROJECT_PATH)
+        results.extend(json.loads(subprocess.check_output(args, env=env, cwd=PROJECT_PATH).decode('utf-8')))
+
+    report = {
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {
+            'archive_size': options.archive_size,
+            'latency': options.latency,
+            'repeat': options.repeat,
+            'installed': options.installed,
+            'install_count': options.install_count,
+            'archives_cache_size': options.archives_cache_size,
+        },
+        'results': results,
+    }
+
+    if options.output:
+        with open(options.output, 'wb') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
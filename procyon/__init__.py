@@ -43,55 +43,118 @@ default_settings = {
     # repo settings
     'REPO_PATH': '',
     'REMOTE_REPO': '',
+    'REPO_CLONE_DEPTH': 1,
+    'REPO_SPARSE_CHECKOUT': False,
+
+    # daemon settings
+    'DAEMON_SOCKET_NAME': 'daemon.sock',
 
     # packaging settings
     'PACKAGES_DB_NAME': 'packges.db',
+    'CATALOG_NAME': 'catalog.json',
     'INSTALL_PATH': '',
+    'DOWNLOAD_WORKERS': 4,
+    'DOWNLOAD_SEGMENTS': 4,
+    'SEGMENTED_DOWNLOAD_SIZE': 64 * 1024 * 1024,
+    'MAX_HOST_CONNECTIONS': 4,
+    'DOWNLOAD_TIMEOUT': 60,
+    'MIRRORS_STATS_NAME': 'mirrors.json',
+    'HEDGE_REQUESTS': False,
+    'HEDGE_PERCENTILE': 95,
+    'STREAM_EXTRACT': False,
+    'EXTRACT_WORKERS': 2,
+    'PIPELINE_QUEUE_SIZE': 4,
+    'MAX_EXTRACT_SIZE': 16 * 1024 * 1024 * 1024,
+    'MAX_EXTRACT_MEMBERS': 1000000,
+    'ARCHIVES_CACHE_NAME': 'archives',
+    'ARCHIVES_CACHE_SIZE': 1024 * 1024 * 1024,
+    'VERIFY_WORKERS': 0,
+    'STORE_MODE': False,
+    'STORE_NAME': 'store',
+    'KEEP_VERSIONS': 2,
+    'BUNDLE_FORMULAS_NAME': 'bundle_formulas',
 }
 
 
-if not os.path.exists(default_settings['PROCYON_PATH']):
-    os.makedirs(default_settings['PROCYON_PATH'])
+def get_procyon_path():
+    return os.environ.get('PROCYON_PATH') or default_settings['PROCYON_PATH']
 
-settings_path = os.path.join(default_settings['PROCYON_PATH'], 'settings.json')
-if not os.path.exists(settings_path):
-    settings_to_file = default_settings.copy()
-    del settings_to_file['PROCYON_PATH']
 
-    f = open(settings_path, 'wb')
-    json.dump(settings_to_file, f)
-    f.close()
-else:
-    f = open(settings_path, 'rb')
-    try:
-        settings_from_file = json.load(f)
-    except ValueError as e:
-        raise e
-    f.close()
+def get_settings_path():
+    return os.path.join(get_procyon_path(), 'settings.json')
 
-    default_settings.update(**settings_from_file)
 
+def load_settings():
+    """Returns dictionary with default settings updated with settings from
+    settings file, settings file with default settings is created if it does
+    not exist.
+    """
+    loaded_settings = default_settings.copy()
+    loaded_settings['PROCYON_PATH'] = get_procyon_path()
 
-class Settings:
-    def __init__(self):
-        for k, v in default_settings.items():
-            setattr(self, k, v)
+    if not os.path.exists(loaded_settings['PROCYON_PATH']):
+        os.makedirs(loaded_settings['PROCYON_PATH'])
 
+    settings_path = get_settings_path()
+    if not os.path.exists(settings_path):
+        settings_to_file = default_settings.copy()
+        del settings_to_file['PROCYON_PATH']
 
-settings = Settings()
+        f = open(settings_path, 'wb')
+        json.dump(settings_to_file, f)
+        f.close()
+    else:
+        f = open(settings_path, 'rb')
+        try:
+            settings_from_file = json.load(f)
+        except ValueError as e:
+            raise e
+        f.close()
+
+        loaded_settings.update(**settings_from_file)
+
+    return loaded_settings
 
-if not settings.REMOTE_REPO:
-    warnings.showwarning(
-        'Missed remote repository parameter',
-        UserWarning,
-        settings_path,
-        1
-    )
-    sys.exit(1)
-
-if not getattr(settings, 'REPO_PATH', None):
-    git_name = settings.REMOTE_REPO.split('/')[-1]
+
+def get_repo_path(remote_repo):
+    if not remote_repo:
+        warnings.showwarning(
+            'Missed remote repository parameter',
+            UserWarning,
+            get_settings_path(),
+            1
+        )
+        sys.exit(1)
+
+    git_name = remote_repo.split('/')[-1]
     repo_name = git_name.split('.')[0]
-    settings.REPO_PATH = os.path.join(settings.PROCYON_PATH, repo_name)
+    return os.path.join(get_procyon_path(), repo_name)
+
 
-sys.path.append(settings.REPO_PATH)
+class Settings(object):
+    """Settings are loaded from settings file on first access, so importing
+    procyon has no side effects. Settings assigned before loading are kept.
+    Repo path is computed from remote repo on first access if it is not set.
+    """
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        if not self.__dict__.get('_loaded'):
+            self.load()
+            return getattr(self, name)
+
+        if name == 'REPO_PATH':
+            self.REPO_PATH = get_repo_path(self.REMOTE_REPO)
+            return self.REPO_PATH
+
+        raise AttributeError(name)
+
+    def load(self):
+        self._loaded = True
+        for k, v in load_settings().items():
+            if k not in self.__dict__ and not (k == 'REPO_PATH' and not v):
+                setattr(self, k, v)
+
+
+settings = Settings()
@@ -25,84 +25,146 @@
 
 from __future__ import unicode_literals
 
-from procyon.repo.logic import update_repo
 from procyon.pkg.logic import get_available_packages, get_installed_packages
 from procyon.pkg.logic import get_available_packages_by_name, get_outdated_packages
-from procyon.pkg.logic import install_package, uninstall_package
+from procyon.pkg.logic import install_packages, uninstall_packages, upgrade_packages, verify_packages
+from procyon.pkg.logic import rollback_packages, install_packages_async
+from procyon.pkg.logic import create_bundle, install_bundle
+from procyon.pkg.logic import update_available_packages
+from procyon.tracing import traced
 
 
 __all__ = (
     'help',
     'freeze',
     'cache',
+    'clean',
     'outdated',
     'search',
     'update',
     'install',
+    'install_async',
     'uninstall',
     'upgrade',
+    'rollback',
+    'verify',
+    'bundle_create',
+    'bundle_install',
 )
 
 
+@traced('core.help')
 def help():
     """Show available commands.
     """
     pass
 
 
+@traced('core.freeze')
 def freeze():
     """Output all currently installed packages (exact versions).
     """
     return get_installed_packages()
 
 
+@traced('core.cache')
 def cache():
     """Output all available to install packages.
     """
     return get_available_packages()
 
 
+@traced('core.clean')
+def clean():
+    """Remove all cached archives.
+    """
+    from procyon.pkg.archives import clean_archives
+
+    return clean_archives()
+
+
+@traced('core.outdated')
 def outdated():
     """Output all outdated packages.
     """
     return get_outdated_packages()
 
 
+@traced('core.search')
 def search(package):
     """Search packages.
     """
     return get_available_packages_by_name(name=package)
 
 
+@traced('core.update')
 def update():
     """Update packages index.
     """
-    return update_repo()
+    # NOTE: GitPython is heavy, it is imported only for repo update
+    from procyon.repo.logic import update_repo
+
+    successful, before_hexsha, after_hexsha = update_repo()
+    changes = None
+    if successful:
+        changes = update_available_packages(before_hexsha, after_hexsha)
+    return successful, before_hexsha, after_hexsha, changes
 
 
+@traced('core.install')
 def install(packages=[]):
     """Install packages.
     """
-    installed = []
-    for package in packages:
-        installed.append((package, install_package(package)))
-    return installed
+    return install_packages(packages)
 
 
+@traced('core.install_async')
+def install_async(packages=[]):
+    """Start installation of packages in background. Returns future, its
+    'result' method waits for the same result as 'install' returns.
+    """
+    return install_packages_async(packages)
+
+
+@traced('core.uninstall')
 def uninstall(packages=[]):
     """Uninstall packages.
     """
-    uninstalled = []
-    for package in packages:
-        uninstalled.append((package, uninstall_package(package)))
-    return uninstalled
+    return uninstall_packages(packages)
+
+
+@traced('core.upgrade')
+def upgrade(packages=[]):
+    """Upgrade packages, all outdated packages are upgraded if packages are
+    not passed.
+    """
+    return upgrade_packages(packages)
+
+
+@traced('core.rollback')
+def rollback(packages=[]):
+    """Switch packages back to previous installed version.
+    """
+    return rollback_packages(packages)
+
+
+@traced('core.verify')
+def verify(packages=[]):
+    """Check files of packages, all installed packages are checked if
+    packages are not passed.
+    """
+    return verify_packages(packages)
+
+
+@traced('core.bundle_create')
+def bundle_create(path, packages=[]):
+    """Write bundle file with packages, their dependencies and archives.
+    """
+    return create_bundle(packages, path)
 
 
-def upgrade(packages=[]):  # TODO: strange method, fix it
-    """Upgrade package.
+@traced('core.bundle_install')
+def bundle_install(path):
+    """Install packages from bundle file without network access.
     """
-    uninstalled = uninstall(packages)
-    installed = []
-    if not uninstalled:
-        installed = install(uninstalled)
-    return installed
+    return install_bundle(path)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+import json
+import os
+import signal
+import socket
+from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+import sys
+import threading
+
+from procyon import settings as procyon_settings
+
+
+__all__ = (
+    'DaemonError',
+    'DaemonClient',
+    'get_core',
+    'serve',
+)
+
+
+COMMANDS = (
+    'freeze',
+    'cache',
+    'clean',
+    'outdated',
+    'search',
+    'update',
+    'install',
+    'uninstall',
+    'upgrade',
+    'rollback',
+    'verify',
+    'bundle_create',
+    'bundle_install',
+)
+
+
+class DaemonError(Exception):
+    pass
+
+
+def get_socket_path():
+    return os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.DAEMON_SOCKET_NAME)
+
+
+# NOTE: JSON has no tuples, sets and datetimes, they are sent as tagged objects
+# and decoded back, so results are the same as results of core module. Other
+# values which JSON does not support are sent as strings.
+TUPLE_TAG = '__tuple__'
+SET_TAG = '__set__'
+DATETIME_TAG = '__datetime__'
+DATETIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+
+def encode_value(value):
+    if isinstance(value, dict):
+        return dict((key, encode_value(item)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, tuple):
+        return {TUPLE_TAG: [encode_value(item) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        return {SET_TAG: [encode_value(item) for item in sorted(value)]}
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    return value
+
+
+def decode_object(obj):
+    if len(obj) != 1:
+        return obj
+    if TUPLE_TAG in obj:
+        return tuple(obj[TUPLE_TAG])
+    if SET_TAG in obj:
+        return set(obj[SET_TAG])
+    if DATETIME_TAG in obj:
+        for datetime_format in DATETIME_FORMATS:
+            try:
+                return datetime.strptime(obj[DATETIME_TAG], datetime_format)
+            except ValueError:
+                pass
+    return obj
+
+
+def serialize(value):
+    return '%s' % value
+
+
+def encode_message(message):
+    return json.dumps(encode_value(message), default=serialize) + '\n'
+
+
+def decode_message(line):
+    return json.loads(line, object_hook=decode_object)
+
+
+class RequestCoalescer(object):
+    """Runs function once for identical concurrent requests, all callers
+    waiting for the same request get result of the first one.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+
+    def call(self, key, function):
+        with self.lock:
+            call = self.running.get(key)
+            owner = call is None
+            if owner:
+                call = self.running[key] = {'done': threading.Event()}
+
+        if not owner:
+            call['done'].wait()
+            return call['result']
+
+        try:
+            call['result'] = function()
+        finally:
+            with self.lock:
+                del self.running[key]
+            call['done'].set()
+
+        return call['result']
+
+
+class DaemonServer(ThreadingMixIn, UnixStreamServer):
+    """Serves core commands on unix socket. Commands are executed one at a time
+    because they share database connection, identical requests waiting for
+    execution are coalesced.
+    """
+    daemon_threads = True
+
+    def __init__(self, path):
+        UnixStreamServer.__init__(self, path, DaemonRequestHandler)
+        self.coalescer = RequestCoalescer()
+        self.execute_lock = threading.Lock()
+
+    def server_bind(self):
+        # NOTE: socket is created accessible for owner only, umask is restored after bind
+        umask = os.umask(0o177)
+        try:
+            UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def execute(self, command, args):
+        from procyon import core
+
+        if command not in COMMANDS:
+            return encode_message({'error': 'Unknown command: %s' % command})
+
+        with self.execute_lock:
+            try:
+                result = getattr(core, command)(*args)
+            except Exception as e:
+                return encode_message({'error': '%s: %s' % (type(e).__name__, e)})
+        return encode_message({'result': result})
+
+
+class DaemonRequestHandler(StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            try:
+                request = decode_message(line)
+                command, args = request['command'], list(request.get('args', []))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                response = encode_message({'error': 'Bad request'})
+            else:
+                key = json.dumps([command, encode_value(args)], sort_keys=True, default=serialize)
+                response = self.server.coalescer.call(key, lambda: self.server.execute(command, args))
+
+            self.wfile.write(response.encode('utf-8'))
+            self.wfile.flush()
+
+
+class DaemonClient(object):
+    """Calls core commands in running daemon, commands are available as
+    methods with the same arguments. Raises 'socket.error' if daemon is not
+    running.
+    """
+    def __init__(self, path=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path or get_socket_path())
+        except socket.error:
+            self.sock.close()
+            raise
+        self.rfile = self.sock.makefile('rb')
+        self.wfile = self.sock.makefile('wb')
+
+    def call(self, command, *args):
+        self.wfile.write(encode_message({'command': command, 'args': args}).encode('utf-8'))
+        self.wfile.flush()
+
+        line = self.rfile.readline()
+        if not line:
+            raise DaemonError('Daemon closed connection')
+
+        response = decode_message(line)
+        if 'error' in response:
+            raise DaemonError(response['error'])
+        return response['result']
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+    def __getattr__(self, name):
+        if name not in COMMANDS:
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
+
+
+def get_core():
+    """Returns client of running daemon or core module if daemon is not
+    running.
+    """
+    try:
+        return DaemonClient()
+    except socket.error:
+        from procyon import core
+        return core
+
+
+def is_running(path):
+    try:
+        DaemonClient(path).close()
+    except socket.error:
+        return False
+    return True
+
+
+def serve():
+    """Serves core commands on unix socket until interrupted. Catalog and
+    installed packages are kept in memory and reloaded when repo or database
+    are changed, HTTP connections are reused between commands.
+    """
+    from procyon.pkg.logic import set_memory_cache
+
+    path = get_socket_path()
+    if os.path.exists(path):
+        if is_running(path):
+            raise DaemonError('Daemon is already running')
+        # NOTE: socket of crashed daemon is left
+        os.remove(path)
+
+    set_memory_cache(True)
+    server = DaemonServer(path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+        set_memory_cache(False)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+import threading
+
+from procyon import settings as procyon_settings
+from procyon.pkg.download import Archive, hash_archive
+
+
+__all__ = (
+    'get_download_path',
+    'get_cached_archive',
+    'cache_archive',
+    'verify_archive',
+    'release_archive',
+    'clean_archives',
+)
+
+
+META_SUFFIX = '.json'
+KEY_LENGTH = 40
+
+lock = threading.Lock()
+# NOTE: counts of users of cached archives, archives in use are not evicted
+pinned = {}
+
+
+def get_archives_path():
+    return os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.ARCHIVES_CACHE_NAME)
+
+
+def is_cache_enabled():
+    return int(procyon_settings.ARCHIVES_CACHE_SIZE) > 0
+
+
+def get_archive_key(url, md5sum):
+    return hashlib.sha1(('%s\0%s' % (url, md5sum or '')).encode('utf-8')).hexdigest()
+
+
+def is_archive_key(name):
+    return len(name) == KEY_LENGTH and all(c in '0123456789abcdef' for c in name)
+
+
+def get_download_path(md5sum=None):
+    """Returns directory for downloaded archives, so archives can be moved
+    to cache without copying, or 'None' if cache is disabled. Archives without
+    md5sum are not cached, they may be changed at the same url.
+    """
+    if not is_cache_enabled() or not md5sum:
+        return None
+
+    archives_path = get_archives_path()
+    if not os.path.exists(archives_path):
+        os.makedirs(archives_path)
+    return archives_path
+
+
+def remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def pin_archive(path):
+    pinned[path] = pinned.get(path, 0) + 1
+
+
+def unpin_archive(path):
+    count = pinned.pop(path, 0) - 1
+    if count > 0:
+        pinned[path] = count
+
+
+def get_cached_archive(url, md5sum=None):
+    """Returns cached 'Archive' downloaded from passed url if its stored
+    checksum matches passed one else 'None'. Archives without md5sum are never
+    returned from cache. Returned archive becomes most recently used and it is
+    not evicted until it is passed to 'release_archive'.
+    """
+    if not is_cache_enabled() or not md5sum:
+        return None
+
+    path = os.path.join(get_archives_path(), get_archive_key(url, md5sum))
+    with lock:
+        try:
+            with open(path + META_SUFFIX, 'rb') as f:
+                meta = json.load(f)
+            archive = Archive(path, meta['type'], meta['md5sum'])
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+        if archive.md5sum != md5sum:
+            remove_files(path, path + META_SUFFIX)
+            return None
+
+        pin_archive(path)
+    return archive
+
+
+def cache_archive(url, archive, md5sum=None):
+    """Moves downloaded archive to cache and evicts least recently used
+    archives which are not in use if cache exceeds its size. Returns cached
+    'Archive' which is not evicted until it is passed to 'release_archive', or
+    passed one if cache is disabled or md5sum is not passed.
+    """
+    if not is_cache_enabled() or not md5sum:
+        return archive
+
+    archives_path = get_archives_path()
+    path = os.path.join(archives_path, get_archive_key(url, md5sum))
+    meta = {
+        'url': url,
+        'type': archive.type,
+        'md5sum': archive.md5sum,
+    }
+
+    with lock:
+        try:
+            if not os.path.exists(archives_path):
+                os.makedirs(archives_path)
+            os.rename(archive.path, path)
+            with open(path + META_SUFFIX, 'wb') as f:
+                json.dump(meta, f)
+        except (IOError, OSError):
+            return archive
+
+        pin_archive(path)
+        evict_archives(int(procyon_settings.ARCHIVES_CACHE_SIZE))
+
+    return Archive(path, archive.type, archive.md5sum)
+
+
+def verify_archive(archive):
+    """Returns 'True' if content of archive matches its md5sum. Downloaded
+    archives are hashed while they are downloaded, so only cached archives are
+    hashed again, cached archive is removed if it is changed. Mapped archives
+    are always hashed.
+    """
+    if archive.mapping is not None:
+        return hash_archive(archive).hexdigest() == archive.md5sum
+
+    if os.path.dirname(archive.path) != get_archives_path():
+        return True
+
+    if hash_archive(archive).hexdigest() == archive.md5sum:
+        return True
+
+    remove_files(archive.path, archive.path + META_SUFFIX)
+    return False
+
+
+def release_archive(archive):
+    """Removes archive after installation if archive is not cached or
+    mapped. Cached archive may be evicted again, archives which were kept in
+    use over cache size are evicted here.
+    """
+    if archive.mapping is not None:
+        return
+
+    if os.path.dirname(archive.path) != get_archives_path():
+        remove_files(archive.path)
+        return
+
+    with lock:
+        unpin_archive(archive.path)
+        evict_archives(int(procyon_settings.ARCHIVES_CACHE_SIZE))
+
+
+def list_archives():
+    archives_path = get_archives_path()
+    try:
+        names = os.listdir(archives_path)
+    except OSError:
+        return []
+
+    archives = []
+    for name in names:
+        if not is_archive_key(name):
+            continue
+        path = os.path.join(archives_path, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        archives.append((stat.st_mtime, stat.st_size, path))
+    return archives
+
+
+def evict_archives(size):
+    archives = sorted(list_archives())
+    total = sum(archive_size for mtime, archive_size, path in archives)
+
+    for mtime, archive_size, path in archives:
+        if total <= size:
+            break
+        if path in pinned:
+            continue
+        remove_files(path, path + META_SUFFIX)
+        total -= archive_size
+
+
+def clean_archives():
+    """Removes all cached archives which are not in use. Returns count of
+    removed archives.
+    """
+    with lock:
+        archives = [path for mtime, archive_size, path in list_archives() if path not in pinned]
+        for path in archives:
+            remove_files(path, path + META_SUFFIX)
+    return len(archives)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+from contextlib import closing
+from io import BytesIO
+import json
+import mmap
+import os
+import tarfile
+
+from procyon.pkg.download import Archive, get_archive_size
+
+
+__all__ = (
+    'BundleError',
+    'Bundle',
+    'write_bundle',
+)
+
+
+BUNDLE_VERSION = 1
+
+META_NAME = 'bundle.json'
+FORMULAS_DIR = 'formulas'
+ARCHIVES_DIR = 'archives'
+
+
+class BundleError(Exception):
+    pass
+
+
+class MappedSlice(object):
+    """Part of memory mapped file, 'open' returns new file object which reads
+    this part.
+    """
+    def __init__(self, mapping, offset, size):
+        self.mapping = mapping
+        self.offset = offset
+        self.size = size
+
+    def open(self):
+        return SliceReader(self)
+
+
+class SliceReader(object):
+    """Read only file object over 'MappedSlice', data is sliced from mapping,
+    so archives are read without copying them to temporary files.
+    """
+    def __init__(self, mapped_slice):
+        self.mapping = mapped_slice.mapping
+        self.start = mapped_slice.offset
+        self.size = mapped_slice.size
+        self.position = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = max(0, min(size, self.size - self.position))
+        start = self.start + self.position
+        self.position += size
+        return self.mapping[start:start + size]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError('Invalid seek offset: %d' % offset)
+        self.position = offset
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        pass
+
+
+def get_archive_name(md5sum):
+    return '%s/%s' % (ARCHIVES_DIR, md5sum)
+
+
+def get_formula_name(formula_name):
+    return '%s/%s' % (FORMULAS_DIR, formula_name)
+
+
+def is_formula_name(name):
+    return name.endswith('.py') and '/' not in name and not name.startswith('.')
+
+
+def add_file(arc, name, path):
+    info = arc.gettarinfo(path, name)
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    with open(path, 'rb') as f:
+        arc.addfile(info, f)
+
+
+def write_bundle(path, names, packages, formula_paths, archives):
+    """Writes bundle file with passed requested names, packages data with
+    formula name, version and dependencies of every package, formula files
+    and archives, where 'formula_paths' maps formula names to paths and
+    'archives' maps package names to 'Archive' tuples. Bundle is not
+    compressed tar file, so its archives can be memory mapped.
+    """
+    meta = {
+        'version': BUNDLE_VERSION,
+        'names': list(names),
+        'packages': {},
+    }
+    for name, data in packages.items():
+        archive = archives[name]
+        meta['packages'][name] = dict(data, archive={
+            'type': archive.type,
+            'md5sum': archive.md5sum,
+            'size': get_archive_size(archive),
+        })
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with closing(tarfile.open(tmp_path, 'w', format=tarfile.PAX_FORMAT)) as arc:
+            data = json.dumps(meta, indent=2, sort_keys=True).encode('utf-8')
+            info = tarfile.TarInfo(META_NAME)
+            info.size = len(data)
+            arc.addfile(info, BytesIO(data))
+
+            for formula_name, formula_path in sorted(formula_paths.items()):
+                add_file(arc, get_formula_name(formula_name), formula_path)
+
+            added = set()
+            for name, archive in sorted(archives.items()):
+                if archive.md5sum not in added:
+                    added.add(archive.md5sum)
+                    add_file(arc, get_archive_name(archive.md5sum), archive.path)
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class Bundle(object):
+    """Bundle file opened for installation, whole file is memory mapped and
+    archives are read from it through 'MappedSlice'. Raises 'BundleError' if
+    file is not a bundle.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.mapping = None
+        self.members = {}
+
+        try:
+            self.file = open(path, 'rb')
+            with closing(tarfile.open(fileobj=self.file, mode='r:')) as arc:
+                for member in arc:
+                    if member.isfile():
+                        self.members[member.name] = (member.offset_data, member.size)
+            self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            meta = json.loads(self.read(META_NAME).decode('utf-8'))
+        except (EnvironmentError, ValueError, KeyError, tarfile.TarError) as e:
+            self.close()
+            raise BundleError('Bad bundle %s: %s' % (path, e))
+
+        try:
+            if meta['version'] != BUNDLE_VERSION:
+                raise BundleError('Unsupported bundle version: %s' % meta['version'])
+            self.names = list(meta['names'])
+            self.packages = dict(meta['packages'])
+        except (KeyError, TypeError, ValueError) as e:
+            self.close()
+            raise BundleError('Bad bundle %s: %s' % (path, e))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get_slice(self, name):
+        offset, size = self.members[name]
+        return MappedSlice(self.mapping, offset, size)
+
+    def read(self, name):
+        return self.get_slice(name).open().read()
+
+    def get_available_packages(self):
+        """Returns dictionary with bundled packages in format of available
+        packages.
+        """
+        return dict((name, dict((key, value) for key, value in data.items() if key != 'archive'))
+            for name, data in self.packages.items())
+
+    def get_archive(self, name):
+        """Returns mapped 'Archive' of package with passed name or 'None' if
+        it is not bundled.
+        """
+        try:
+            data = self.packages[name]['archive']
+            member_name = get_archive_name(data['md5sum'])
+            mapped_slice = self.get_slice(member_name)
+        except (KeyError, TypeError):
+            return None
+        return Archive('%s:%s' % (self.path, member_name), data['type'], data['md5sum'], mapped_slice)
+
+    def get_formula_names(self):
+        prefix = FORMULAS_DIR + '/'
+        return sorted(name[len(prefix):] for name in self.members
+            if name.startswith(prefix) and is_formula_name(name[len(prefix):]))
+
+    def extract_formulas(self, path, overwrite=True):
+        """Writes bundled formula files to passed directory, existing files
+        are kept if 'overwrite' is not passed. Returns list of written formula
+        names.
+        """
+        written = []
+        for formula_name in self.get_formula_names():
+            formula_path = os.path.join(path, formula_name)
+            if overwrite or not os.path.exists(formula_path):
+                with open(formula_path, 'wb') as f:
+                    f.write(self.read(get_formula_name(formula_name)))
+                written.append(formula_name)
+        return written
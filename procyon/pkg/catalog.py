@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import json
+import os
+
+from procyon import settings as procyon_settings
+from procyon.pkg.index import build_index
+
+
+__all__ = (
+    'get_catalog_path',
+    'read_catalog',
+    'write_catalog',
+)
+
+
+# NOTE: increase when catalog format changes, old catalogs will be rebuilt
+CATALOG_VERSION = 5
+
+
+# NOTE: last read catalog is kept in memory until catalog file is changed
+loaded_catalog = {}
+
+
+def get_catalog_path():
+    return os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.CATALOG_NAME)
+
+
+def get_catalog_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+def read_catalog(hexsha):
+    """Returns dictionary with available packages, its search index and
+    formulas declaring every package name stored in catalog if catalog was
+    built for passed repo hexsha else 'None'. Catalog file is parsed only if
+    it was changed since last read.
+    """
+    catalog_path = get_catalog_path()
+    stamp = get_catalog_stamp(catalog_path)
+    if stamp is None or loaded_catalog.get('path') != catalog_path or loaded_catalog.get('stamp') != stamp:
+        loaded_catalog.clear()
+        catalog_hexsha, catalog = load_catalog(catalog_path)
+        if catalog is None:
+            return None
+        loaded_catalog.update(path=catalog_path, stamp=stamp, hexsha=catalog_hexsha, catalog=catalog)
+
+    return loaded_catalog['catalog'] if loaded_catalog['hexsha'] == hexsha else None
+
+
+def load_catalog(catalog_path):
+    """Returns '(hexsha, catalog)' tuple with parsed catalog file and repo
+    hexsha it was built for, catalog is 'None' if file is broken or outdated.
+    """
+    try:
+        with open(catalog_path, 'rb') as f:
+            catalog = json.load(f)
+    except (IOError, ValueError):
+        return None, None
+
+    try:
+        if catalog['version'] != CATALOG_VERSION:
+            return None, None
+        hexsha, packages, index, declared = catalog['hexsha'], catalog['packages'], catalog['index'], catalog['declared']
+    except (KeyError, TypeError):
+        return None, None
+
+    if not isinstance(packages, dict) or not isinstance(index, dict):
+        return None, None
+    if declared is not None and not isinstance(declared, dict):
+        return None, None
+
+    return hexsha, {
+        'packages': packages,
+        'index': index,
+        'declared': declared,
+    }
+
+
+def write_catalog(hexsha, packages, index=None, declared=None):
+    """Stores available packages, its search index and formulas declaring
+    every package name to catalog for passed repo hexsha, index is built if
+    not passed. Returns 'True' if operation successful else 'False'.
+    """
+    catalog = {
+        'version': CATALOG_VERSION,
+        'hexsha': hexsha,
+        'packages': packages,
+        'index': index if index is not None else build_index(packages),
+        'declared': declared,
+    }
+
+    # NOTE: read catalog may be patched by caller, it is parsed again after write
+    loaded_catalog.clear()
+
+    catalog_path = get_catalog_path()
+    tmp_path = '%s.%d.tmp' % (catalog_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            json.dump(catalog, f)
+        os.rename(tmp_path, catalog_path)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+    return True
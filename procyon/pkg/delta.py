@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from procyon.pkg.download import ZIP_ARCHIVE, TAR_ARCHIVE, CHUNK_SIZE, ExtractError, BadFileTypeError, is_within
+from procyon.pkg.download import hash_link
+from procyon.pkg.manifest import build_manifest, get_file_path, remove_manifest_files
+
+
+__all__ = (
+    'open_archive',
+    'iter_limited',
+    'apply_delta',
+    'staging_writer',
+)
+
+
+# NOTE: members of this size are kept in memory while they are compared, so
+# changed members are not read from archive twice
+SPOOL_SIZE = 1024 * 1024
+
+
+class ArchiveMember(object):
+    """Regular file or symbolic link from zip or tar archive, 'open' returns
+    file object with member content. Mode is 'None' if archive does not keep
+    permissions.
+    """
+    def __init__(self, path, size, open_member, linkname=None, mode=None):
+        self.path = path
+        self.size = size
+        self.open = open_member
+        self.linkname = linkname
+        self.mode = mode
+
+
+def normalize_member_path(name):
+    path = posixpath.normpath(name.replace('\\', '/'))
+    if path.startswith('/') or path == '..' or path.startswith('../'):
+        raise ExtractError('Member is outside of extraction path: %s' % name)
+    return path
+
+
+def iter_zip_members(arc):
+    for info in arc.infolist():
+        if info.filename.endswith('/'):
+            continue
+        yield ArchiveMember(normalize_member_path(info.filename), info.file_size,
+            lambda info=info: arc.open(info), mode=(info.external_attr >> 16) & 0o7777 or None)
+
+
+def iter_tar_members(arc):
+    # NOTE: hard links have no size in tar, they have size of linked member
+    sizes = {}
+    for member in arc:
+        if member.issym():
+            yield ArchiveMember(normalize_member_path(member.name), 0, None, member.linkname)
+        elif member.isfile() or member.islnk():
+            path = normalize_member_path(member.name)
+            size = sizes.get(posixpath.normpath(member.linkname), member.size) if member.islnk() else member.size
+            sizes[path] = size
+            yield ArchiveMember(path, size, lambda member=member: arc.extractfile(member), mode=member.mode)
+
+
+def iter_limited(members, name, max_size=None, max_members=None):
+    """Yields passed archive members, raises 'ExtractError' if they exceed
+    limits of extracted size or members count.
+    """
+    size, count = 0, 0
+    for member in members:
+        size += member.size
+        count += 1
+        if max_members is not None and count > max_members:
+            raise ExtractError('Too many members in archive: %s' % name)
+        if max_size is not None and size > max_size:
+            raise ExtractError('Too large archive: %s' % name)
+        yield member
+
+
+def open_archive(archive):
+    """Returns '(arc, members)' tuple with opened archive and iterator over
+    its files. Raises 'BadFileTypeError' if archive can not be opened.
+    """
+    fileobj = archive.mapping.open() if archive.mapping is not None else None
+    try:
+        if archive.type == ZIP_ARCHIVE:
+            arc = zipfile.ZipFile(fileobj or archive.path)
+            return arc, iter_zip_members(arc)
+        elif archive.type == TAR_ARCHIVE:
+            arc = tarfile.open(archive.path, fileobj=fileobj)
+            return arc, iter_tar_members(arc)
+    except (zipfile.BadZipfile, tarfile.ReadError):
+        pass
+    raise BadFileTypeError(archive.path)
+
+
+def read_unchanged(member, md5sum):
+    """Returns '(unchanged, chunks)' tuple, where chunks is list with member
+    content if it was changed and is small enough to be kept in memory.
+    """
+    md5 = hashlib.md5()
+    chunks, size = [], 0
+    f = member.open()
+    try:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+            size += len(chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+                if size > SPOOL_SIZE:
+                    chunks = None
+    finally:
+        f.close()
+
+    if md5.hexdigest() == md5sum:
+        return True, None
+    return False, chunks
+
+
+def prepare_target(root, path):
+    """Makes parent directories for passed path, files and links which are
+    in place of parent directories or directory in place of path are removed.
+    """
+    parent = root
+    for part in path.split('/')[:-1]:
+        parent = os.path.join(parent, part)
+        if os.path.islink(parent) or (os.path.lexists(parent) and not os.path.isdir(parent)):
+            os.remove(parent)
+        if not os.path.exists(parent):
+            os.mkdir(parent)
+
+    target = get_file_path(root, path)
+    if not is_within(target, root):
+        raise ExtractError('Member is outside of extraction path: %s' % path)
+    if os.path.isdir(target) and not os.path.islink(target):
+        shutil.rmtree(target)
+    return target
+
+
+def write_member(member, target, staging_dir, chunks=None):
+    """Writes member (or its passed content chunks) to temporary file which
+    replaces target. Returns md5sum of written content.
+    """
+    md5 = hashlib.md5()
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir)
+    src = member.open() if chunks is None else None
+    try:
+        if src is not None:
+            chunks = iter(lambda: src.read(CHUNK_SIZE), b'')
+        with os.fdopen(fd, 'wb') as dst:
+            for chunk in chunks:
+                md5.update(chunk)
+                dst.write(chunk)
+        if member.mode is not None:
+            os.chmod(tmp_path, member.mode)
+        os.rename(tmp_path, target)
+    finally:
+        if src is not None:
+            src.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return md5.hexdigest()
+
+
+def staging_writer(staging_dir):
+    """Returns function which writes member to passed target through
+    temporary file in staging directory.
+    """
+    return lambda member, target, chunks=None: write_member(member, target, staging_dir, chunks)
+
+
+def write_link(member, target, root):
+    if not is_within(os.path.join(os.path.dirname(target), member.linkname), root):
+        raise ExtractError('Link is outside of extraction path: %s' % member.path)
+    if os.path.lexists(target):
+        os.remove(target)
+    os.symlink(member.linkname, target)
+
+
+def apply_delta(archive, root, manifest, write, max_size=None, max_members=None):
+    """Updates files in passed directory to content of archive, where
+    manifest is list of '(path, size, md5sum)' tuples of installed files.
+    Member is compared with installed file only if their sizes are equal, so
+    unchanged files are only read from archive. Added and changed files are
+    written by passed 'write(member, target, chunks)' function which returns
+    md5sum of written file, files missed in archive are removed. Manifest is built from directory if it is not passed.
+    Returns '(manifest, written, removed)' tuple with new manifest and counts
+    of written and removed files.
+    """
+    if manifest is None:
+        manifest = build_manifest(root) if os.path.isdir(root) else []
+    installed = dict((path, (size, md5sum)) for path, size, md5sum in manifest)
+
+    if not os.path.exists(root):
+        os.makedirs(root)
+
+    arc, members = open_archive(archive)
+    new_manifest, written = {}, 0
+    try:
+        for member in iter_limited(members, archive.path, max_size, max_members):
+            target = get_file_path(root, member.path)
+
+            if member.linkname is not None:
+                md5sum = hash_link(member.linkname)
+                if installed.get(member.path) != (0, md5sum) or not os.path.islink(target):
+                    write_link(member, prepare_target(root, member.path), root)
+                    written += 1
+                new_manifest[member.path] = (0, md5sum)
+                continue
+
+            chunks = None
+            expected = installed.get(member.path)
+            if expected is not None and expected[0] == member.size and \
+                    os.path.isfile(target) and not os.path.islink(target) and \
+                    os.path.getsize(target) == member.size:
+                unchanged, chunks = read_unchanged(member, expected[1])
+                if unchanged:
+                    new_manifest[member.path] = expected
+                    continue
+
+            md5sum = write(member, prepare_target(root, member.path), chunks)
+            new_manifest[member.path] = (member.size, md5sum)
+            written += 1
+    except (zipfile.BadZipfile, zipfile.LargeZipFile, tarfile.TarError) as e:
+        raise ExtractError(str(e))
+    finally:
+        arc.close()
+
+    removed = [path for path in installed if path not in new_manifest]
+    remove_manifest_files(root, removed)
+
+    return sorted((path, size, md5sum) for path, (size, md5sum) in new_manifest.iteritems()), written, len(removed)
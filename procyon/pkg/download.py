@@ -0,0 +1,645 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from contextlib import closing
+import hashlib
+import httplib
+import json
+import os
+import posixpath
+from Queue import Queue, Empty
+import tarfile
+import tempfile
+import threading
+import time
+
+from procyon import settings as procyon_settings
+from procyon.pkg.mirrors import get_mirror_stats
+from procyon.pkg.session import get_session
+from procyon.tracing import span
+
+
+__all__ = (
+    'Archive',
+    'DownloadError',
+    'BadFileTypeError',
+    'ChecksumError',
+    'ExtractError',
+    'NotStreamableError',
+    'fetch',
+    'stream_extract',
+    'sniff_archive_type',
+)
+
+
+CHUNK_SIZE = 64 * 1024
+HEADER_SIZE = 512
+
+ZIP_ARCHIVE = 'zip'
+TAR_ARCHIVE = 'tar'
+
+PARTIAL_SUFFIX = '.part'
+SEGMENTS_SUFFIX = '.segments'
+
+HTTP_PARTIAL_CONTENT = 206
+HTTP_BAD_REQUEST = 400
+HTTP_RANGE_NOT_SATISFIABLE = 416
+
+
+# NOTE: mapping is set for archives read from memory mapped file, its 'open'
+# returns file object reading archive content and its 'size' is archive size
+Archive = namedtuple('Archive', ('path', 'type', 'md5sum', 'mapping'))
+Archive.__new__.__defaults__ = (None,)
+
+
+class DownloadError(IOError):
+    pass
+
+
+class BadFileTypeError(DownloadError):
+    pass
+
+
+class ChecksumError(DownloadError):
+    pass
+
+
+class RangeError(DownloadError):
+    pass
+
+
+class NotStreamableError(DownloadError):
+    pass
+
+
+class ExtractError(Exception):
+    pass
+
+
+def sniff_archive_type(header):
+    """Returns archive type detected by magic bytes of passed file header or
+    'None' if header does not belong to zip or (compressed) tar archive.
+    """
+    if header.startswith(b'PK\x03\x04') or header.startswith(b'PK\x05\x06'):
+        return ZIP_ARCHIVE
+    # NOTE: compressed data is checked to be a tar archive during extraction
+    if header.startswith(b'\x1f\x8b') or header.startswith(b'BZh'):
+        return TAR_ARCHIVE
+    if header[257:262] == b'ustar':
+        return TAR_ARCHIVE
+    return None
+
+
+def check_archive_type(url, header):
+    archive_type = sniff_archive_type(header)
+    if archive_type is None:
+        raise BadFileTypeError(url)
+    return archive_type
+
+
+def read_header(f):
+    header = b''
+    while len(header) < HEADER_SIZE:
+        chunk = f.read(HEADER_SIZE - len(header))
+        if not chunk:
+            break
+        header += chunk
+    return header
+
+
+def copy_stream(src, dst, md5=None, size=None):
+    """Copies passed stream (or passed count of bytes) to file and updates
+    passed hash object with every copied chunk. Returns count of copied bytes.
+    """
+    copied = 0
+    while size is None or copied < size:
+        chunk = src.read(CHUNK_SIZE if size is None else min(CHUNK_SIZE, size - copied))
+        if not chunk:
+            break
+        if md5 is not None:
+            md5.update(chunk)
+        dst.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
+def hash_file(path):
+    md5 = hashlib.md5()
+    with span('checksum', path=path) as checksum_span:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                md5.update(chunk)
+            checksum_span.set(bytes=f.tell())
+    return md5
+
+
+def hash_archive(archive):
+    """Returns md5 of archive content, mapped archives are hashed without
+    copying.
+    """
+    if archive.mapping is None:
+        return hash_file(archive.path)
+
+    md5 = hashlib.md5()
+    with span('checksum', path=archive.path, bytes=archive.mapping.size):
+        f = archive.mapping.open()
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5
+
+
+def get_archive_size(archive):
+    if archive.mapping is not None:
+        return archive.mapping.size
+    return os.path.getsize(archive.path)
+
+
+def open_url(url, headers=None):
+    """Returns response for passed url, response connection is taken from
+    shared session. Raises 'RangeError' if requested range can not be
+    satisfied and 'DownloadError' on other errors.
+    """
+    try:
+        response = get_session().get(url, headers)
+    except (IOError, httplib.HTTPException, ValueError) as e:
+        raise DownloadError(str(e))
+
+    code = response.getcode()
+    if code >= HTTP_BAD_REQUEST:
+        response.close()
+        if code == HTTP_RANGE_NOT_SATISFIABLE:
+            raise RangeError('HTTP Error %d: %s' % (code, url))
+        raise DownloadError('HTTP Error %d: %s' % (code, url))
+
+    return response
+
+
+def get_response_length(response):
+    try:
+        return int(response.getheader('Content-Length'))
+    except (TypeError, ValueError):
+        return None
+
+
+def accepts_ranges(response):
+    return response.getheader('Accept-Ranges', '').lower() == 'bytes'
+
+
+def is_partial_response(response):
+    return response.getcode() == HTTP_PARTIAL_CONTENT
+
+
+def get_partial_path(url, md5sum, dirname):
+    key = hashlib.sha1(('%s\0%s' % (url, md5sum or '')).encode('utf-8')).hexdigest()
+    return os.path.join(dirname or tempfile.gettempdir(), 'procyon-%s%s' % (key, PARTIAL_SUFFIX))
+
+
+def remove_partial(path):
+    for p in (path, path + SEGMENTS_SUFFIX):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def plan_segments(length, count):
+    """Returns list of '[start, end, downloaded]' segments covering passed
+    length.
+    """
+    size = -(-length // count)
+    return [[start, min(start + size, length), 0] for start in range(0, length, size)]
+
+
+def download_segment(url, path, segment, response=None):
+    start, end, downloaded = segment
+    if response is None:
+        response = open_url(url, {'Range': 'bytes=%d-%d' % (start + downloaded, end - 1)})
+        if not is_partial_response(response):
+            response.close()
+            raise RangeError(url)
+
+    with closing(response):
+        with open(path, 'r+b') as f:
+            f.seek(start + downloaded)
+            while segment[2] < end - start:
+                copied = copy_stream(response, f, size=end - start - segment[2])
+                if not copied:
+                    raise DownloadError('Connection closed before segment end: %s' % url)
+                segment[2] += copied
+
+
+def is_segment_done(segment):
+    start, end, downloaded = segment
+    return start + downloaded >= end
+
+
+def download_segments(url, path, segments, first=None):
+    """Downloads passed segments of archive in parallel, first segment may be
+    passed with already opened response as '(segment, response)' tuple. If
+    download fails segments state is stored near partial file, so download
+    may be resumed. Returns '(archive_type, md5sum)' tuple.
+    """
+    errors = []
+
+    def download(segment, response=None):
+        try:
+            download_segment(url, path, segment, response)
+        except (IOError, httplib.HTTPException) as e:
+            errors.append(e)
+
+    threads = []
+    for segment in segments:
+        if is_segment_done(segment) or (first is not None and segment is first[0]):
+            continue
+        thread = threading.Thread(target=download, args=(segment,))
+        thread.start()
+        threads.append(thread)
+
+    if first is not None:
+        download(*first)
+    for thread in threads:
+        thread.join()
+
+    segments_path = path + SEGMENTS_SUFFIX
+    if any(isinstance(e, RangeError) for e in errors):
+        remove_partial(path)
+        raise RangeError(url)
+    elif errors:
+        with open(segments_path, 'wb') as f:
+            json.dump(segments, f)
+        raise DownloadError(str(errors[0]))
+    elif os.path.exists(segments_path):
+        os.remove(segments_path)
+
+    with open(path, 'rb') as f:
+        archive_type = check_archive_type(url, read_header(f))
+    return archive_type, hash_file(path).hexdigest()
+
+
+def read_segments(path):
+    try:
+        with open(path + SEGMENTS_SUFFIX, 'rb') as f:
+            segments = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if not isinstance(segments, list) or not all(isinstance(s, list) and len(s) == 3 for s in segments):
+        return None
+    return segments
+
+
+def get_segments_count(length):
+    if length is None or length < int(procyon_settings.SEGMENTED_DOWNLOAD_SIZE):
+        return 1
+    return max(1, min(int(procyon_settings.DOWNLOAD_SEGMENTS), length // HEADER_SIZE))
+
+
+def timed_open(url, headers=None):
+    """Opens passed url like 'open_url' and records latency or failure of
+    its host to mirror stats.
+    """
+    start = time.time()
+    try:
+        response = open_url(url, headers)
+    except RangeError:
+        raise
+    except DownloadError:
+        get_mirror_stats().record_failure(url)
+        raise
+    get_mirror_stats().record_latency(url, time.time() - start)
+    return response
+
+
+def close_responses(results, count):
+    for i in range(count):
+        url, response, error = results.get()
+        if response is not None:
+            response.close()
+
+
+def open_hedged(urls, headers=None):
+    """Opens first of passed urls. If hedged requests are enabled and first
+    url does not respond in 'HEDGE_PERCENTILE' of its latency, the same
+    request is sent to second url and first received response is used,
+    another one is closed. Returns '(url, response)' tuple.
+    """
+    delay = None
+    if len(urls) > 1 and procyon_settings.HEDGE_REQUESTS:
+        delay = get_mirror_stats().get_hedge_delay(urls[0])
+    if delay is None:
+        return urls[0], timed_open(urls[0], headers)
+
+    results = Queue()
+
+    def request(url):
+        try:
+            results.put((url, timed_open(url, headers), None))
+        except DownloadError as e:
+            results.put((url, None, e))
+
+    def start(url):
+        thread = threading.Thread(target=request, args=(url,))
+        thread.daemon = True
+        thread.start()
+
+    start(urls[0])
+    started = 1
+    try:
+        url, response, error = results.get(timeout=delay)
+    except Empty:
+        with span('hedge', url=urls[1], delay=delay):
+            start(urls[1])
+        started = 2
+        url, response, error = results.get()
+
+    received = 1
+    while response is None and received < started:
+        url, response, error = results.get()
+        received += 1
+    if response is None:
+        raise error
+
+    if received < started:
+        # NOTE: slower response is closed when it is received
+        thread = threading.Thread(target=close_responses, args=(results, started - received))
+        thread.daemon = True
+        thread.start()
+
+    return url, response
+
+
+def download_archive(urls, path):
+    """Downloads archive to partial file in one pass: data is hashed while
+    received and archive type is detected by first bytes, so download is
+    aborted as soon as bad file type is detected. Download is resumed if
+    partial file exists, large archives are downloaded by parallel segments
+    if server accepts ranges. Archive is downloaded from first of passed
+    urls (or second one if request is hedged), throughput or failure of used
+    url is recorded to mirror stats. Returns '(url, archive_type, md5sum)'
+    tuple.
+    """
+    start = time.time()
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    url = urls[0]
+
+    try:
+        if os.path.exists(path + SEGMENTS_SUFFIX):
+            segments = read_segments(path)
+            if segments and os.path.exists(path):
+                archive_type, md5sum = download_segments(url, path, segments)
+                get_mirror_stats().record_transfer(url, os.path.getsize(path) - offset, time.time() - start)
+                return url, archive_type, md5sum
+            remove_partial(path)
+            offset = 0
+
+        try:
+            url, response = open_hedged(urls, {'Range': 'bytes=%d-' % offset} if offset else None)
+        except RangeError:
+            remove_partial(path)
+            offset = 0
+            url, response = open_hedged(urls)
+        archive_type, md5sum = download_response(url, path, offset, response)
+    except (IOError, httplib.HTTPException):
+        get_mirror_stats().record_failure(url)
+        raise
+
+    get_mirror_stats().record_transfer(url, os.path.getsize(path) - offset, time.time() - start)
+    return url, archive_type, md5sum
+
+
+def download_response(url, path, offset, response):
+    with closing(response):
+        length = get_response_length(response)
+
+        if offset and is_partial_response(response):
+            with open(path, 'rb') as f:
+                archive_type = check_archive_type(url, read_header(f))
+            md5 = hash_file(path)
+            header = b''
+            mode = 'ab'
+        else:
+            header = read_header(response)
+            archive_type = check_archive_type(url, header)
+            md5 = hashlib.md5(header)
+            mode = 'wb'
+
+            count = get_segments_count(length)
+            if count > 1 and accepts_ranges(response):
+                with open(path, 'wb') as f:
+                    f.write(header)
+                    f.truncate(length)
+                segments = plan_segments(length, count)
+                segments[0][2] = len(header)
+                return download_segments(url, path, segments, (segments[0], response))
+
+        with open(path, mode) as f:
+            f.write(header)
+            copied = len(header) + copy_stream(response, f, md5)
+
+    if length is not None and copied < length:
+        raise DownloadError('Connection closed before download end: %s' % url)
+
+    return archive_type, md5.hexdigest()
+
+
+def fetch(url, md5sum=None, dirname=None, mirrors=()):
+    """Downloads archive from passed url to passed directory (or temporary
+    directory) and checks its type and md5sum. Interrupted downloads are
+    resumed on next fetch. If mirrors of url are passed, archive is
+    downloaded from the fastest one and next mirror is used if download
+    fails. Returns 'Archive' with path, type and md5sum of downloaded file.
+    """
+    path = get_partial_path(url, md5sum, dirname)
+    urls = [url] + [mirror for mirror in mirrors if mirror != url]
+    stats = get_mirror_stats()
+
+    try:
+        for attempt in range(len(urls)):
+            try:
+                return fetch_archive(stats.rank(urls), path, md5sum)
+            except DownloadError:
+                # NOTE: failed mirror is ranked last, so next attempt uses another one
+                if attempt == len(urls) - 1:
+                    raise
+    finally:
+        stats.save()
+
+
+def fetch_archive(urls, path, md5sum):
+    resumed = os.path.exists(path)
+
+    try:
+        url, archive_type, archive_md5sum = download_archive(urls, path)
+    except BadFileTypeError:
+        remove_partial(path)
+        raise
+    except DownloadError:
+        raise
+    except (IOError, OSError, httplib.HTTPException) as e:
+        raise DownloadError(str(e))
+
+    if md5sum and archive_md5sum != md5sum:
+        remove_partial(path)
+        if resumed:
+            # NOTE: partial file may be downloaded from previous archive version
+            return fetch_archive(urls, path, md5sum)
+        get_mirror_stats().record_failure(url)
+        raise ChecksumError(url)
+
+    archive_path = path[:-len(PARTIAL_SUFFIX)]
+    os.rename(path, archive_path)
+
+    return Archive(archive_path, archive_type, archive_md5sum)
+
+
+class HashingReader(object):
+    """File-like wrapper for response which hashes data while it is read,
+    already read header is returned first.
+    """
+    def __init__(self, response, header):
+        self.response = response
+        self.header = header
+        self.md5 = hashlib.md5(header)
+        self.size = len(header)
+
+    def read(self, size=-1):
+        if self.header:
+            if size is None or size < 0:
+                size = len(self.header)
+            chunk, self.header = self.header[:size], self.header[size:]
+            return chunk
+
+        chunk = self.response.read(size if size is not None and size >= 0 else None)
+        self.md5.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+
+def is_within(path, directory):
+    directory = os.path.join(os.path.realpath(directory), '')
+    return os.path.realpath(path).startswith(directory)
+
+
+def check_member(path, member):
+    target = os.path.join(path, member.name)
+    if not is_within(target, path):
+        raise ExtractError('Member is outside of extraction path: %s' % member.name)
+    if member.issym() and not is_within(os.path.join(os.path.dirname(target), member.linkname), path):
+        raise ExtractError('Link is outside of extraction path: %s' % member.name)
+    if member.islnk() and not is_within(os.path.join(path, member.linkname), path):
+        raise ExtractError('Link is outside of extraction path: %s' % member.name)
+
+
+def hash_link(linkname):
+    return hashlib.md5(linkname.encode('utf-8') if isinstance(linkname, unicode) else linkname).hexdigest()
+
+
+def extract_member(arc, member, path, manifest):
+    """Extracts member of tar stream to passed path and adds its '(size,
+    md5sum)' to manifest, content of regular file is hashed while it is
+    written. Directories and special files are not added to manifest.
+    """
+    name = posixpath.normpath(member.name)
+    if not member.isfile():
+        arc.extract(member, path)
+        if member.issym():
+            manifest[name] = (0, hash_link(member.linkname))
+        elif member.islnk():
+            target = os.path.join(path, *name.split('/'))
+            manifest[name] = manifest.get(posixpath.normpath(member.linkname)) or \
+                (os.path.getsize(target), hash_file(target).hexdigest())
+        return
+
+    target = os.path.join(path, *name.split('/'))
+    if not os.path.isdir(os.path.dirname(target)):
+        os.makedirs(os.path.dirname(target))
+    if os.path.islink(target):
+        os.remove(target)
+
+    md5 = hashlib.md5()
+    with open(target, 'wb') as dst:
+        size = copy_stream(arc.extractfile(member), dst, md5)
+    os.chmod(target, member.mode)
+    os.utime(target, (member.mtime, member.mtime))
+    manifest[name] = (size, md5.hexdigest())
+
+
+def stream_extract(url, path, md5sum=None, max_size=None, max_members=None):
+    """Extracts tar archive to passed path while it is downloaded, archive is
+    hashed on the fly and is not stored on disk. Raises 'NotStreamableError'
+    if archive is not a tar archive (nothing is extracted), 'ExtractError' if
+    archive is broken or exceeds limits of extracted size or members count.
+    Extracted files are not removed on errors. Returns '(md5sum, manifest)'
+    tuple with md5sum of archive and list of '(path, size, md5sum)' tuples of
+    extracted files, files are hashed while they are written.
+    """
+    try:
+        return extract_response(url, path, md5sum, max_size, max_members)
+    except (DownloadError, ExtractError):
+        raise
+    except (IOError, OSError, httplib.HTTPException) as e:
+        raise DownloadError(str(e))
+    finally:
+        get_mirror_stats().save()
+
+
+def extract_response(url, path, md5sum, max_size, max_members):
+    response = timed_open(url)
+    with closing(response):
+        header = read_header(response)
+        archive_type = check_archive_type(url, header)
+        if archive_type != TAR_ARCHIVE:
+            raise NotStreamableError(url)
+
+        reader = HashingReader(response, header)
+        manifest = {}
+        size, members = 0, 0
+        try:
+            with closing(tarfile.open(fileobj=reader, mode='r|*')) as arc:
+                for member in arc:
+                    size += member.size
+                    members += 1
+                    if max_members is not None and members > max_members:
+                        raise ExtractError('Too many members in archive: %s' % url)
+                    if max_size is not None and size > max_size:
+                        raise ExtractError('Too large archive: %s' % url)
+
+                    check_member(path, member)
+                    extract_member(arc, member, path, manifest)
+        except tarfile.TarError as e:
+            raise ExtractError(str(e))
+
+        while reader.read(CHUNK_SIZE):
+            pass
+
+    length = get_response_length(response)
+    if length is not None and reader.size < length:
+        raise DownloadError('Connection closed before download end: %s' % url)
+
+    if md5sum and reader.md5.hexdigest() != md5sum:
+        raise ChecksumError(url)
+
+    return reader.md5.hexdigest(), sorted((name, size, md5) for name, (size, md5) in manifest.iteritems())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import re
+
+
+__all__ = (
+    'prepare_name',
+    'build_index',
+    'add_to_index',
+    'remove_from_index',
+    'search_index',
+)
+
+
+NGRAM_SIZE = 3
+# NOTE: shorter substrings are indexed too, short queries are answered by their posting lists
+INDEX_NGRAM_SIZES = tuple(range(1, NGRAM_SIZE + 1))
+
+
+def prepare_name(name):
+    return re.sub(r'[-_/\[ \]]', '', str(name).lower())
+
+
+def get_ngrams(prepared_name, sizes=(NGRAM_SIZE,)):
+    return set(prepared_name[i:i + size] for size in sizes for i in range(len(prepared_name) - size + 1))
+
+
+def build_index(package_names):
+    """Returns search index for passed package names. Index contains prepared
+    names with its packages and posting lists of prepared names for every
+    name trigram and every shorter substring.
+    """
+    index = {
+        'names': {},
+        'ngrams': {},
+    }
+    for package_name in package_names:
+        add_to_index(index, package_name)
+    return index
+
+
+def add_to_index(index, package_name):
+    prepared_name = prepare_name(package_name)
+
+    packages = index['names'].setdefault(prepared_name, [])
+    if package_name in packages:
+        return
+    packages.append(package_name)
+
+    if len(packages) == 1:
+        for ngram in get_ngrams(prepared_name, INDEX_NGRAM_SIZES):
+            index['ngrams'].setdefault(ngram, []).append(prepared_name)
+
+
+def remove_from_index(index, package_name):
+    prepared_name = prepare_name(package_name)
+
+    packages = index['names'].get(prepared_name, [])
+    if package_name not in packages:
+        return
+    packages.remove(package_name)
+
+    if packages:
+        return
+    del index['names'][prepared_name]
+
+    for ngram in get_ngrams(prepared_name, INDEX_NGRAM_SIZES):
+        posting = index['ngrams'].get(ngram, [])
+        if prepared_name in posting:
+            posting.remove(prepared_name)
+        if not posting:
+            index['ngrams'].pop(ngram, None)
+
+
+def search_containing(index, name):
+    """Returns prepared names which contain passed prepared name.
+    """
+    if not name:
+        return list(index['names'])
+    if len(name) < NGRAM_SIZE:
+        return list(index['ngrams'].get(name, []))
+
+    postings = []
+    for ngram in get_ngrams(name):
+        posting = index['ngrams'].get(ngram)
+        if not posting:
+            return []
+        postings.append(posting)
+    postings.sort(key=len)
+
+    candidates = set(postings[0])
+    for posting in postings[1:]:
+        candidates.intersection_update(posting)
+        if not candidates:
+            return []
+
+    return [prepared_name for prepared_name in candidates if name in prepared_name]
+
+
+def search_contained(index, name):
+    """Returns prepared names which are contained in passed prepared name.
+    """
+    names = index['names']
+    found = set()
+    for i in range(len(name) + 1):
+        for j in range(i, len(name) + 1):
+            if name[i:j] in names:
+                found.add(name[i:j])
+    return found
+
+
+def search_index(index, name):
+    """Returns set of package names which prepared name contains prepared
+    search name or is contained in it.
+    """
+    name = prepare_name(name)
+
+    found = set()
+    for prepared_name in set(search_containing(index, name)) | search_contained(index, name):
+        found.update(index['names'][prepared_name])
+    return found
@@ -25,11 +25,28 @@
 
 from __future__ import unicode_literals
 
+from datetime import datetime
+import hashlib
+import json
+from multiprocessing.pool import ThreadPool
 import os.path
-import re
+from Queue import Queue
+import shutil
+import sys
+import tempfile
 
 from procyon import settings as procyon_settings
-from procyon.pkg.models import Package, InstallationStatuses
+from procyon.pkg.catalog import read_catalog, write_catalog
+from procyon.pkg.index import build_index, add_to_index, remove_from_index, search_index
+from procyon.pkg.manifest import verify_manifests
+from procyon.pkg.models import Package, PackageVersion, InstalledFile, InstallationStatuses, Formula
+from procyon.pkg.models import get_install_dir, get_version_dir, activate_version, remove_version_dir
+from procyon.pkg.models import insert_many
+from procyon.pkg.parser import parse_formula
+from procyon.pkg.resolver import resolve_install, resolve_uninstall, drop_failed
+from procyon.pkg.versions import version_key, iter_version_keys, merge_outdated
+from procyon.repo.files import get_repo_hexsha, is_repo_configured, FILE_DELETED
+from procyon.tracing import span
 
 
 __all__ = (
@@ -37,49 +54,285 @@ __all__ = (
     'get_available_packages_by_name',
     'get_installed_packages',
     'get_outdated_packages',
+    'update_available_packages',
     'install_package',
+    'install_packages',
+    'pipeline_install_packages',
+    'install_packages_async',
+    'create_bundle',
+    'install_bundle',
     'uninstall_package',
+    'uninstall_packages',
     'upgrade_package',
+    'upgrade_packages',
+    'rollback_packages',
+    'verify_packages',
+    'set_memory_cache',
 )
 
 
+# NOTE: long running processes keep catalog and installed packages in memory
+memory_cache = None
+
+
+def set_memory_cache(enabled):
+    """Enables or disables keeping of catalog and installed packages in
+    memory. Catalog is reloaded when repo hexsha is changed, installed
+    packages are reloaded when database is changed.
+    """
+    global memory_cache
+    memory_cache = {} if enabled else None
+
+
+def get_available_catalog():
+    """Returns dictionary with available to install packages from repo and
+    its search index. Catalog built for current repo hexsha is used, catalog
+    is rebuilt if repo was changed or catalog is broken.
+    """
+    hexsha = get_catalog_key(get_repo_hexsha())
+    cache = memory_cache
+    if cache is not None and hexsha and cache.get('catalog_hexsha') == hexsha:
+        return cache['catalog']
+
+    with span('catalog', hexsha=hexsha) as catalog_span:
+        catalog = read_catalog(hexsha) if hexsha else None
+        catalog_span.set(cached=catalog is not None)
+
+        if catalog is None:
+            declared = {}
+            available = scan_available_packages(declared)
+            catalog = {
+                'packages': available,
+                'index': build_index(available),
+                'declared': declared,
+            }
+            if hexsha:
+                write_catalog(hexsha, catalog['packages'], catalog['index'], catalog['declared'])
+
+    if cache is not None and hexsha:
+        cache.update(catalog_hexsha=hexsha, catalog=catalog)
+
+    return catalog
+
+
+def get_bundle_formulas_path():
+    return os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.BUNDLE_FORMULAS_NAME)
+
+
+def list_formula_files(path):
+    try:
+        return sorted(name for name in os.listdir(path) if is_formula_file(name))
+    except OSError:
+        return []
+
+
+def get_catalog_key(hexsha):
+    """Returns key of catalog built for passed repo hexsha, key is changed
+    when formulas are added by bundles.
+    """
+    formulas_path = get_bundle_formulas_path()
+    stamp = []
+    for modulename in list_formula_files(formulas_path):
+        try:
+            stat = os.stat(os.path.join(formulas_path, modulename))
+        except OSError:
+            continue
+        stamp.append('%s:%d:%r' % (modulename, stat.st_size, stat.st_mtime))
+
+    if not hexsha or not stamp:
+        return hexsha
+    return '%s-%s' % (hexsha, hashlib.sha1('\0'.join(stamp).encode('utf-8')).hexdigest())
+
+
 def get_available_packages():
     """Returns dictionary with available to install packages from repo.
     """
+    return get_available_catalog()['packages']
+
+
+def scan_available_packages(declared=None):
+    """Returns dictionary with available to install packages, every formula
+    from repo and formulas added by bundles are loaded. Packages from repo
+    shadow packages from bundles. Formulas declaring every package name are
+    added to passed 'declared' dictionary in order of precedence.
+    """
     available = {}
 
-    for modulename in os.listdir(procyon_settings.REPO_PATH):
-        if modulename != '__init__.py' and modulename.endswith('.py'):
+    with span('scan') as scan_span:
+        # NOTE: packages installed from bundles are managed without cloned repo
+        repo_files = list_formula_files(procyon_settings.REPO_PATH) if is_repo_configured() else []
+        bundle_files = [modulename for modulename in list_formula_files(get_bundle_formulas_path())
+            if modulename not in repo_files]
+        for modulename in repo_files + bundle_files:
             package_name, package_data = get_package_data(modulename)
 
             if package_name and package_data:
                 available.setdefault(package_name, package_data)
+                if declared is not None:
+                    declared.setdefault(package_name, []).append(modulename)
+        scan_span.set(packages=len(available))
 
     return available
 
 
+def is_formula_file(path):
+    return path != '__init__.py' and path.endswith('.py') and os.path.dirname(path) == ''
+
+
+def get_available_packages_changes(before, after):
+    """Returns dictionary with added, removed and updated packages, where
+    'before' and 'after' are dictionaries with packages versions.
+    """
+    changes = {
+        'added': {},
+        'removed': {},
+        'updated': {},
+    }
+
+    for package_name, version in after.iteritems():
+        if package_name not in before:
+            changes['added'][package_name] = version
+        elif before[package_name] != version:
+            changes['updated'][package_name] = (before[package_name], version)
+
+    for package_name, version in before.iteritems():
+        if package_name not in after:
+            changes['removed'][package_name] = version
+
+    return changes
+
+
+def get_formula_order(modulename):
+    # NOTE: formulas from repo shadow formulas added by bundles
+    return get_formula_dir(modulename) is not None, modulename
+
+
+def patch_available_packages(available, changed, declared):
+    """Applies list of '(status, path)' repo changes to dictionary with
+    available packages and dictionary with formulas declaring every package
+    name in place. Only changed formulas are loaded, unchanged formulas are
+    loaded only if they declare package which changed formula does not
+    declare anymore. Returns dictionary with added, removed and updated
+    packages.
+    """
+    changed = [(status, path) for status, path in changed if is_formula_file(path)]
+    paths = set(path for status, path in changed)
+
+    affected = set(package_name for package_name, package_data in available.iteritems()
+        if package_data.get('formula_name') in paths)
+    for package_name, modulenames in declared.items():
+        if paths.intersection(modulenames):
+            affected.add(package_name)
+            declared[package_name] = [modulename for modulename in modulenames if modulename not in paths]
+
+    loaded = {}
+    for status, modulename in changed:
+        if status == FILE_DELETED or modulename in loaded:
+            continue
+
+        package_name, package_data = get_package_data(modulename)
+        if package_name and package_data:
+            loaded[modulename] = package_data
+            declared.setdefault(package_name, []).append(modulename)
+            affected.add(package_name)
+
+    before, after = {}, {}
+    for package_name in affected:
+        modulenames = sorted(declared.pop(package_name, []), key=get_formula_order)
+        if modulenames:
+            declared[package_name] = modulenames
+
+        current = available.get(package_name)
+        if current is not None:
+            if current.get('formula_name') not in paths and modulenames[:1] == [current.get('formula_name')]:
+                continue
+            before[package_name] = available.pop(package_name).get('version')
+
+        for modulename in modulenames:
+            package_data = loaded.get(modulename)
+            if package_data is None:
+                loaded_name, package_data = get_package_data(modulename)
+                if loaded_name != package_name:
+                    continue
+            if package_data:
+                available[package_name] = package_data
+                after[package_name] = package_data.get('version')
+                break
+
+    return get_available_packages_changes(before, after)
+
+
+def get_changed_files(before_hexsha, after_hexsha):
+    # NOTE: GitPython is imported only when repo is updated
+    from procyon.repo.logic import get_changed_files as get_repo_changed_files
+
+    return get_repo_changed_files(before_hexsha, after_hexsha)
+
+
+def update_available_packages(before_hexsha, after_hexsha):
+    """Updates catalog after repo update and returns dictionary with added,
+    removed and updated packages. Catalog built for previous repo hexsha is
+    patched with changed formulas and formulas declaring the same package
+    names only, otherwise catalog is rebuilt.
+    """
+    catalog = read_catalog(get_catalog_key(before_hexsha))
+    if catalog is None or before_hexsha == after_hexsha:
+        get_available_catalog()
+        return get_available_packages_changes({}, {})
+
+    available, index, declared = catalog['packages'], catalog['index'], catalog['declared']
+
+    changed = get_changed_files(before_hexsha, after_hexsha) if declared is not None else None
+    if changed is not None:
+        changes = patch_available_packages(available, changed, declared)
+        for package_name in changes['removed']:
+            remove_from_index(index, package_name)
+        for package_name in changes['added']:
+            add_to_index(index, package_name)
+    else:
+        before = dict((name, data.get('version')) for name, data in available.iteritems())
+        declared = {}
+        available = scan_available_packages(declared)
+        after = dict((name, data.get('version')) for name, data in available.iteritems())
+        changes = get_available_packages_changes(before, after)
+        index = build_index(available)
+    write_catalog(get_catalog_key(after_hexsha), available, index, declared)
+
+    return changes
+
+
 def get_available_packages_by_name(name):
     """Returns dictionary with available to install packages from repo with
     specified package name.
     """
-    def prepare_name(name):
-        return re.sub(r'[-_/\[ \]]', '', str(name).lower())
+    catalog = get_available_catalog()
+    packages = catalog['packages']
 
-    name = prepare_name(name)
     available = {}
 
-    for package_name, package_data in get_available_packages().iteritems():
-        prepared_pkg_name = prepare_name(package_name)
-
-        if name in prepared_pkg_name or prepared_pkg_name in name:
-            available.setdefault(package_name, package_data)
+    for package_name in search_index(catalog['index'], name):
+        available.setdefault(package_name, packages[package_name])
 
     return available
 
 
+def get_database_version():
+    """Returns value which is changed on every commit to packages database by
+    this or other connection.
+    """
+    conn = Package._meta.database.get_conn()
+    return conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes
+
+
 def get_installed_packages():
     """Returns dictionary with all installed packages.
     """
+    cache = memory_cache
+    if cache is not None:
+        version = get_database_version()
+        if cache.get('installed_version') == version:
+            return dict((name, dict(data)) for name, data in cache['installed'].iteritems())
+
     installed = {}
 
     for entry in Package.select():
@@ -89,58 +342,98 @@ def get_installed_packages():
             'updated_at': entry.updated_at,
         })
 
+    if cache is not None:
+        cache.update(installed_version=version, installed=dict((name, dict(data)) for name, data in installed.iteritems()))
+
     return installed
 
 
 def is_outdated(available_version, installed_version):
-    available_version_list, installed_version_list = available_version.split('.'), installed_version.split('.')
-    i, n = 0, min(len(available_version_list), len(installed_version_list))
-    while i < n:
-        if int(available_version_list[i]) > int(installed_version_list[i]):
-            return True
-        elif int(available_version_list[i]) < int(installed_version_list[i]):
-            return False
-        i += 1
-    if len(available_version_list) > len(installed_version_list):
-        return True
-    return False
+    return version_key(available_version) > version_key(installed_version)
 
 
 def get_outdated_packages():
-    """Returns dictionary with outdated installed packages.
+    """Returns dictionary with outdated installed packages. Outdated packages
+    are found by merging installed and available versions sorted by name.
     """
     installed = get_installed_packages()
     available = get_available_packages()
 
     outdated = {}
 
-    for package_name, package_data in installed.iteritems():
-        available_version = available.get(package_name, {}).get('version', None)
-        installed_version = package_data.get('version')
-
-        if available_version and is_outdated(available_version, installed_version):
-            package_data.update({
-                'available_version': available_version,
-            })
-            outdated.setdefault(package_name, package_data)
+    for package_name in merge_outdated(iter_version_keys(installed), iter_version_keys(available)):
+        package_data = installed[package_name]
+        package_data.update({
+            'available_version': available[package_name]['version'],
+        })
+        outdated.setdefault(package_name, package_data)
 
     return outdated
 
 
-def import_formula_module(modulename):
+def import_formula_module(modulename, repo_path=None):
+    if repo_path is None:
+        if procyon_settings.REPO_PATH not in sys.path:
+            sys.path.append(procyon_settings.REPO_PATH)
+        return import_formula(modulename)
+
+    # NOTE: formulas from passed directory shadow formulas from repo
+    sys.path.insert(0, repo_path)
+    try:
+        return import_formula(modulename)
+    finally:
+        sys.path.remove(repo_path)
+
+
+def import_formula(modulename):
     absolute_modulename = modulename.split('.')[0]
+    # NOTE: formula modules are not cached, repo may be updated between imports
+    sys.modules.pop(absolute_modulename, None)
     try:
         formula = __import__(absolute_modulename).Formula()
         return formula if formula.check_items() else None
     except (AttributeError, ImportError):
         return None
+    finally:
+        sys.modules.pop(absolute_modulename, None)
+
+
+def get_formula_dir(modulename):
+    """Returns bundle formulas directory if passed formula file was added by
+    bundle and repo has no file with the same name else 'None'.
+    """
+    formulas_path = get_bundle_formulas_path()
+    if not os.path.exists(os.path.join(formulas_path, modulename)):
+        return None
+    if is_repo_configured() and os.path.exists(os.path.join(procyon_settings.REPO_PATH, modulename)):
+        return None
+    return formulas_path
+
+
+def load_formula(modulename, repo_path=None):
+    """Returns formula object for passed formula file name from repo, bundle
+    formulas directory or passed directory. Static formulas are parsed without
+    execution, dynamic formulas are imported.
+    """
+    repo_path = repo_path or get_formula_dir(modulename)
+    if repo_path is None and not is_repo_configured():
+        return None
+    attrs = parse_formula(os.path.join(repo_path or procyon_settings.REPO_PATH, modulename))
+    if attrs is None:
+        return import_formula_module(modulename, repo_path)
+
+    formula = Formula()
+    for name, value in attrs.items():
+        setattr(formula, name, value)
+
+    return formula if formula.check_items() else None
 
 
 def get_package_data(modulename):
     """Returns parsed information about package from *.json file with
     passed file name via arguments.
     """
-    formula = import_formula_module(modulename)
+    formula = load_formula(modulename)
 
     if not formula:
         return None, None
@@ -150,59 +443,739 @@ def get_package_data(modulename):
         'info': formula.info,
         'formula_name': modulename,
         'version': formula.version,
+        'dependencies': list(formula.dependencies or []),
     }
 
     return name, data
 
 
-def install_package(name):
-    available = get_available_packages()
+def get_formula_to_install(name, available):
+    """Returns '(status, formula, formula_name)' tuple for package with
+    passed name, formula is 'None' if package can not be installed.
+    """
     if name not in available:
-        return InstallationStatuses.FORMULA_NOT_FOUND
+        return InstallationStatuses.FORMULA_NOT_FOUND, None, None
 
     packages = [package.name for package in Package.select().where(Package.name == name)]
     if len(packages) > 1:
-        return InstallationStatuses.INSTALL_ERROR
+        return InstallationStatuses.INSTALL_ERROR, None, None
     elif packages and packages[0] == name:
-        return InstallationStatuses.ALREADY_INSTALLED
+        return InstallationStatuses.ALREADY_INSTALLED, None, None
 
-    package = available.get(name)
-    formula = import_formula_module(package.get('formula_name'))
+    formula_name = available.get(name).get('formula_name')
+    formula = load_formula(formula_name)
     if not formula:
-        return InstallationStatuses.BAD_FORMULA
+        return InstallationStatuses.BAD_FORMULA, None, None
 
-    status = formula.install()
-    if status != InstallationStatuses.INSTALL_OK:
-        return status
+    return None, formula, formula_name
 
+
+def register_package(formula, formula_name, now=None):
     Package.create(
         name=formula.name,
-        formula_name=package.get('formula_name'),
+        formula_name=formula_name,
         version=formula.version
     )
+    register_version(formula, formula_name, now)
+    register_manifest(formula.name, formula.version, formula.manifest)
+
+
+def register_version(formula, formula_name, now=None):
+    """Records installed version of package, record is refreshed if version
+    was installed before.
+    """
+    PackageVersion.delete().where(
+        (PackageVersion.name == formula.name) & (PackageVersion.version == formula.version)).execute()
+    PackageVersion.create(
+        name=formula.name,
+        version=formula.version,
+        formula_name=formula_name,
+        installed_at=now or datetime.now(),
+        dependencies=json.dumps(list(formula.dependencies or []))
+    )
+
+
+def register_manifest(name, version, manifest):
+    """Replaces stored list of files installed by package version with passed
+    list of '(path, size, md5sum)' tuples.
+    """
+    InstalledFile.delete().where((InstalledFile.package == name) & (InstalledFile.version == version)).execute()
+    insert_many(InstalledFile, [{'package': name, 'version': version, 'path': path, 'size': size, 'md5sum': md5sum}
+        for path, size, md5sum in manifest or ()])
+
+
+def get_package_manifests(names, versions=None):
+    """Returns dictionary with lists of '(path, size, md5sum)' tuples of files
+    installed by packages with passed names, where versions is dictionary
+    with package versions, active versions are used if it is not passed.
+    Packages installed without manifest are missed.
+    """
+    manifests = {}
+    if not names:
+        return manifests
+
+    if versions is None:
+        versions = dict((entry.name, entry.version) for entry in Package.select().where(Package.name << list(names)))
+
+    for entry in InstalledFile.select().where(InstalledFile.package << list(names)):
+        if versions.get(entry.package) == entry.version:
+            manifests.setdefault(entry.package, []).append((entry.path, entry.size, entry.md5sum))
+
+    return manifests
+
+
+def get_package_versions(names):
+    """Returns dictionary with lists of recorded versions of packages with
+    passed names, latest installed versions go first.
+    """
+    versions = {}
+    if not names:
+        return versions
+
+    for entry in PackageVersion.select().where(PackageVersion.name << list(names)):
+        versions.setdefault(entry.name, []).append({
+            'version': entry.version,
+            'formula_name': entry.formula_name,
+            'installed_at': entry.installed_at,
+        })
+    for package_versions in versions.itervalues():
+        package_versions.sort(key=lambda package_version: package_version['installed_at'], reverse=True)
+
+    return versions
+
+
+def get_recorded_dependencies(installed):
+    """Returns dictionary with dependencies recorded at install time of
+    active versions of passed installed packages. Packages installed without
+    record are missed.
+    """
+    dependencies = {}
+    if not installed:
+        return dependencies
+
+    for entry in PackageVersion.select().where(PackageVersion.name << list(installed)):
+        if entry.dependencies is None or entry.version != installed[entry.name]['version']:
+            continue
+        try:
+            dependencies[entry.name] = json.loads(entry.dependencies)
+        except ValueError:
+            continue
+
+    return dependencies
+
+
+def register_packages(formulas):
+    """Registers all passed '(formula, formula_name)' tuples in one
+    transaction.
+    """
+    now = datetime.now()
+    with span('register', packages=len(formulas)):
+        with Package._meta.database.transaction():
+            for formula, formula_name in formulas:
+                register_package(formula, formula_name, now)
+
+
+def unregister_packages(names):
+    """Removes packages with passed names and all their versions in one
+    transaction. Returns list of md5sums of files of removed packages.
+    """
+    if not names:
+        return []
+
+    with span('unregister', packages=len(names)):
+        with Package._meta.database.transaction():
+            md5sums = [entry.md5sum for entry in InstalledFile.select().where(InstalledFile.package << list(names))]
+            Package.delete().where(Package.name << list(names)).execute()
+            PackageVersion.delete().where(PackageVersion.name << list(names)).execute()
+            InstalledFile.delete().where(InstalledFile.package << list(names)).execute()
+
+    return md5sums
+
+
+def update_registered_packages(formulas):
+    """Updates versions of all passed '(formula, formula_name)' tuples in one
+    transaction, previous versions are kept recorded.
+    """
+    now = datetime.now()
+    with span('register', packages=len(formulas)):
+        with Package._meta.database.transaction():
+            for formula, formula_name in formulas:
+                Package.update(
+                    formula_name=formula_name,
+                    version=formula.version,
+                    updated_at=now
+                ).where(Package.name == formula.name).execute()
+                register_version(formula, formula_name, now)
+                register_manifest(formula.name, formula.version, formula.manifest)
+
+
+def prune_package_versions(names):
+    """Removes directories and records of inactive versions of packages with
+    passed names which exceed 'KEEP_VERSIONS' count, active version is always
+    kept. Returns list of md5sums of files of removed versions.
+    """
+    keep = max(1, int(procyon_settings.KEEP_VERSIONS))
+    active = dict((entry.name, entry.version) for entry in Package.select().where(Package.name << list(names)))
+
+    pruned = []
+    for name, versions in get_package_versions(names).iteritems():
+        inactive = [package_version['version'] for package_version in versions
+            if package_version['version'] != active.get(name)]
+        pruned.extend((name, version) for version in inactive[keep - 1:])
+    if not pruned:
+        return []
+
+    md5sums = []
+    with span('prune', versions=len(pruned)):
+        with Package._meta.database.transaction():
+            for name, version in pruned:
+                query = (InstalledFile.package == name) & (InstalledFile.version == version)
+                md5sums.extend(entry.md5sum for entry in InstalledFile.select().where(query))
+                InstalledFile.delete().where(query).execute()
+                PackageVersion.delete().where((PackageVersion.name == name) & (PackageVersion.version == version)).execute()
+    for name, version in pruned:
+        remove_version_dir(name, version)
+
+    return md5sums
+
+
+def install_package(name):
+    status, formula, formula_name = get_formula_to_install(name, get_available_packages())
+    if not formula:
+        return status
+
+    status = formula.install()
+    if status != InstallationStatuses.INSTALL_OK:
+        return status
+
+    register_package(formula, formula_name)
 
     return status
 
 
-def uninstall_package(name):
+def install_formula(name, formula, archive=None):
+    try:
+        if archive is None:
+            return name, formula.install()
+        return name, formula.install(archive)
+    except Exception:
+        return name, InstallationStatuses.INSTALL_ERROR
+
+
+def install_graph(formulas, graph, archives=None):
+    """Installs packages from passed graph using pool of threads, where
+    formulas is dictionary with '(formula, formula_name)' tuples and graph is
+    dictionary with sets of dependencies for every package. Archives of
+    packages are downloaded unless they are passed in archives dictionary.
+    Package is installed as soon as all its dependencies are installed, so
+    independent packages are installed in parallel. Packages are not
+    registered here. Yields '(name, status)' tuples.
+    """
+    if not graph:
+        return
+
+    pending = dict((name, set(deps)) for name, deps in graph.items())
+    dependents = {}
+    for name, deps in graph.items():
+        for dep_name in deps:
+            dependents.setdefault(dep_name, set()).add(name)
+
+    workers = max(1, min(int(procyon_settings.DOWNLOAD_WORKERS), len(graph)))
+    pool = ThreadPool(workers)
+    results = Queue()
+    running = [0]
+
+    def submit(name):
+        del pending[name]
+        running[0] += 1
+        archive = archives.get(name) if archives else None
+        pool.apply_async(install_formula, (name, formulas[name][0], archive), callback=results.put)
+
+    def fail_dependents(name):
+        for dependent in dependents.get(name, ()):
+            if dependent in pending:
+                del pending[dependent]
+                yield dependent, InstallationStatuses.DEPENDENCY_ERROR
+                for result in fail_dependents(dependent):
+                    yield result
+
+    try:
+        for name in [name for name, deps in pending.items() if not deps]:
+            submit(name)
+
+        while running[0]:
+            name, status = results.get()
+            running[0] -= 1
+
+            if status != InstallationStatuses.INSTALL_OK:
+                yield name, status
+                for result in fail_dependents(name):
+                    yield result
+                continue
+
+            yield name, status
+
+            for dependent in dependents.get(name, ()):
+                if dependent in pending:
+                    pending[dependent].discard(name)
+                    if not pending[dependent]:
+                        submit(dependent)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def prepare_install(names, available=None, load=None):
+    """Returns statuses of passed packages which can not be installed,
+    dictionary with '(formula, formula_name)' tuples and graph of packages to
+    install. Packages are taken from passed available packages and formulas
+    are loaded by passed function instead of repo if they are passed.
+    """
+    if available is None:
+        available = get_available_packages()
+    load = load or load_formula
     installed = get_installed_packages()
-    if name not in installed:
-        return InstallationStatuses.NOT_INSTALLED
+    statuses = {}
+
+    for name in names:
+        if name not in available:
+            statuses[name] = InstallationStatuses.FORMULA_NOT_FOUND
+        elif name in installed:
+            statuses[name] = InstallationStatuses.ALREADY_INSTALLED
+
+    graph, failed = resolve_install(names, available, installed)
+
+    formulas = {}
+    for name in graph:
+        formula_name = available[name].get('formula_name')
+        formula = load(formula_name)
+        if formula:
+            formulas[name] = (formula, formula_name)
+        else:
+            failed[name] = InstallationStatuses.BAD_FORMULA
+    drop_failed(graph, failed)
+
+    statuses.update((name, status) for name, status in failed.items() if name in names)
+
+    return statuses, formulas, graph
+
+
+def get_install_result(names, statuses, dependencies):
+    result = []
+    for name in names:
+        status = statuses[name]
+        if (name, InstallationStatuses.INSTALL_OK) in result:
+            status = InstallationStatuses.ALREADY_INSTALLED
+        result.append((name, status))
+
+    return result + [(name, statuses[name]) for name in dependencies]
+
+
+def install_packages(names):
+    """Installs packages with passed names and their dependencies. Archives
+    are downloaded and extracted in parallel respecting dependencies order,
+    all installed packages are registered in one transaction. Returns list of
+    '(name, status)' tuples in passed order followed by tuples for installed
+    dependencies.
+    """
+    statuses, formulas, graph = prepare_install(names)
+
+    dependencies = []
+    registered = []
+    for name, status in install_graph(formulas, graph):
+        statuses[name] = status
+        if name not in names:
+            dependencies.append(name)
+        if status == InstallationStatuses.INSTALL_OK:
+            registered.append(formulas[name])
+    register_packages(registered)
+
+    return get_install_result(names, statuses, dependencies)
+
+
+def pipeline_install_packages(names):
+    """Installs packages like 'install_packages', but download, verification,
+    extraction and registration of different packages overlap. Packages
+    extracted at the same time are registered in one transaction.
+    """
+    # NOTE: pipeline is imported only when it is used
+    from procyon.pkg.pipeline import InstallPipeline
+
+    statuses, formulas, graph = prepare_install(names)
+
+    def register(installed):
+        register_packages([formulas[name] for name in installed])
+
+    pipeline = InstallPipeline(dict((name, formulas[name][0]) for name in graph), graph, register)
+
+    dependencies = []
+    for name, status in pipeline.run():
+        statuses[name] = status
+        if name not in names:
+            dependencies.append(name)
+
+    return get_install_result(names, statuses, dependencies)
+
+
+def install_packages_async(names):
+    """Installs packages through pipeline in background thread. Returns
+    'InstallFuture' of result of 'pipeline_install_packages'.
+    """
+    from procyon.pkg.pipeline import run_async
+
+    return run_async(pipeline_install_packages, names)
+
+
+def download_formula(name, formula):
+    try:
+        return name, formula._download()
+    except Exception:
+        return name, (InstallationStatuses.INSTALL_ERROR, None)
+
+
+def create_bundle(names, path):
+    """Writes bundle file with passed packages, all their dependencies,
+    formula files and archives, so packages can be installed by
+    'install_bundle' without network access. Returns list of '(name, status)'
+    tuples in passed order followed by tuples for dependencies.
+    """
+    from procyon.pkg.archives import release_archive
+    from procyon.pkg.bundle import write_bundle
+
+    available = get_available_packages()
+    statuses = dict((name, InstallationStatuses.FORMULA_NOT_FOUND) for name in names if name not in available)
+
+    # NOTE: installed packages are bundled too, bundle is installed on other machines
+    graph, failed = resolve_install(names, available, {})
+    formulas = {}
+    for name in graph:
+        formula = load_formula(available[name].get('formula_name'))
+        if formula:
+            formulas[name] = formula
+        else:
+            failed[name] = InstallationStatuses.BAD_FORMULA
+    drop_failed(graph, failed)
+
+    archives = {}
+    if graph:
+        workers = max(1, min(int(procyon_settings.DOWNLOAD_WORKERS), len(graph)))
+        pool = ThreadPool(workers)
+        try:
+            downloaded = pool.map(lambda name: download_formula(name, formulas[name]), sorted(graph))
+        finally:
+            pool.close()
+            pool.join()
+
+        for name, (status, archive) in downloaded:
+            if status == InstallationStatuses.DOWNLOAD_OK:
+                archives[name] = archive
+            else:
+                failed[name] = status
+        drop_failed(graph, failed)
+
+    try:
+        if graph:
+            packages = dict((name, available[name]) for name in graph)
+            formula_paths = dict((data['formula_name'],
+                os.path.join(get_formula_dir(data['formula_name']) or procyon_settings.REPO_PATH, data['formula_name']))
+                for data in packages.values())
+            with span('bundle', packages=len(graph)):
+                write_bundle(path, [name for name in names if name in graph], packages, formula_paths,
+                    dict((name, archives[name]) for name in graph))
+    finally:
+        for archive in archives.values():
+            release_archive(archive)
+
+    statuses.update(failed)
+    statuses.update((name, InstallationStatuses.BUNDLE_OK) for name in graph)
+
+    dependencies = sorted(name for name in statuses if name not in names)
+    return [(name, statuses[name]) for name in names] + [(name, statuses[name]) for name in dependencies]
 
-    package = installed.get(name)
-    formula = import_formula_module(package.get('formula_name'))
+
+def install_bundle(path):
+    """Installs packages from bundle file created by 'create_bundle' without
+    network access, archives are read from memory mapped bundle file. Formula
+    files are added to bundle formulas directory, so bundled packages are
+    managed like packages installed by 'install_packages'. Returns list of
+    '(name, status)' tuples like 'install_packages'.
+    """
+    from procyon.pkg.bundle import Bundle, BundleError
+
+    try:
+        bundle = Bundle(path)
+    except BundleError:
+        return [(path, InstallationStatuses.BAD_BUNDLE)]
+
+    formulas_path = tempfile.mkdtemp()
+    try:
+        with bundle:
+            bundle.extract_formulas(formulas_path)
+            names = bundle.names
+            statuses, formulas, graph = prepare_install(names, bundle.get_available_packages(),
+                lambda formula_name: load_formula(formula_name, formulas_path))
+
+            archives = dict((name, bundle.get_archive(name)) for name in graph)
+            failed = dict((name, InstallationStatuses.BAD_BUNDLE) for name, archive in archives.items()
+                if archive is None)
+            drop_failed(graph, failed)
+            statuses.update((name, status) for name, status in failed.items() if name in names)
+
+            dependencies = []
+            registered = []
+            for name, status in install_graph(formulas, graph, archives):
+                statuses[name] = status
+                if name not in names:
+                    dependencies.append(name)
+                if status == InstallationStatuses.INSTALL_OK:
+                    registered.append(formulas[name])
+            register_packages(registered)
+
+            if registered:
+                # NOTE: git checkout of repo is not changed, catalog is keyed by formulas added here
+                bundle_formulas_path = get_bundle_formulas_path()
+                if not os.path.exists(bundle_formulas_path):
+                    os.makedirs(bundle_formulas_path)
+                bundle.extract_formulas(bundle_formulas_path)
+    finally:
+        shutil.rmtree(formulas_path, ignore_errors=True)
+
+    return get_install_result(names, statuses, dependencies)
+
+
+def collect_store_garbage(md5sums, full=False):
+    """Removes store objects with passed md5sums which are not referenced
+    anymore, whole store is checked if 'full' is passed. Does nothing if
+    store mode is disabled.
+    """
+    if not procyon_settings.STORE_MODE:
+        return 0
+
+    # NOTE: store is imported only when it is enabled
+    from procyon.pkg.store import collect_garbage
+
+    with span('collect_garbage', full=full):
+        if full:
+            return collect_garbage()
+        return collect_garbage(md5sums)
+
+
+def uninstall_formula(package_data, manifest=None):
+    formula = load_formula(package_data.get('formula_name'))
     if not formula:
         return InstallationStatuses.BAD_FORMULA
 
-    status = formula.uninstall()
+    return formula.uninstall(get_manifest_paths(manifest))
+
+
+def get_manifest_paths(manifest):
+    if manifest is None:
+        return None
+
+    return [path for path, size, md5sum in manifest]
+
+
+def uninstall_package(name):
+    installed = get_installed_packages()
+    if name not in installed:
+        return InstallationStatuses.NOT_INSTALLED
+
+    manifest = get_package_manifests([name]).get(name)
+    status = uninstall_formula(installed.get(name), manifest)
     if status != InstallationStatuses.UNINSTALL_OK:
         return status
 
-    package = Package.get(name=name)
-    package.delete_instance()
+    md5sums = unregister_packages([name])
+    collect_store_garbage(md5sums, full=manifest is None)
 
     return status
 
 
+def uninstall_packages(names):
+    """Uninstalls packages with passed names, packages required by other
+    installed packages are not uninstalled. Dependents are uninstalled before
+    their dependencies. Returns list of '(name, status)' tuples in passed
+    order. All uninstalled packages are unregistered in one transaction.
+    """
+    installed = get_installed_packages()
+    for name, dependencies in get_recorded_dependencies(installed).iteritems():
+        installed[name]['dependencies'] = dependencies
+    order, failed = resolve_uninstall(names, get_available_packages(), installed)
+
+    manifests = get_package_manifests(order)
+    statuses = dict(failed)
+    for name in order:
+        statuses[name] = uninstall_formula(installed[name], manifests.get(name))
+    uninstalled = [name for name in order if statuses[name] == InstallationStatuses.UNINSTALL_OK]
+    md5sums = unregister_packages(uninstalled)
+    collect_store_garbage(md5sums, full=any(name not in manifests for name in uninstalled))
+
+    return [(name, statuses.get(name, InstallationStatuses.NOT_INSTALLED)) for name in names]
+
+
 def upgrade_package(name):
-    raise NotImplementedError
+    return dict(upgrade_packages([name])).get(name)
+
+
+def upgrade_formula(name, formula, manifest, installed_version, kept_manifest=None):
+    """Upgrades package, if new version is kept from previous installs it is
+    made active without download.
+    """
+    try:
+        if kept_manifest is not None:
+            activate_version(name, formula.version, installed_version)
+            formula.manifest = kept_manifest
+            return name, InstallationStatuses.UPGRADE_OK
+        return name, formula.upgrade(manifest, installed_version)
+    except Exception:
+        return name, InstallationStatuses.INSTALL_ERROR
+
+
+def upgrade_packages(names=None):
+    """Upgrades installed packages with passed names or all outdated packages
+    if names are not passed. New version is installed to its own directory
+    next to installed version: installed files are linked, only added and
+    changed files are written. Package link is switched to new version when
+    it is ready, kept versions are switched without download. Packages are
+    upgraded in parallel. Versions and manifests of all upgraded packages are
+    updated in one transaction, packages failed to upgrade keep their active
+    version. Versions exceeding 'KEEP_VERSIONS' are removed. Returns list of
+    '(name, status)' tuples.
+    """
+    available = get_available_packages()
+    installed = get_installed_packages()
+    if not names:
+        names = sorted(
+            name for name, package_data in installed.iteritems()
+            if name in available and is_outdated(available[name]['version'], package_data['version'])
+        )
+
+    statuses = {}
+    formulas = {}
+    for name in names:
+        if name in statuses or name in formulas:
+            continue
+        if name not in installed:
+            statuses[name] = InstallationStatuses.NOT_INSTALLED
+        elif name not in available:
+            statuses[name] = InstallationStatuses.FORMULA_NOT_FOUND
+        elif not is_outdated(available[name]['version'], installed[name]['version']):
+            statuses[name] = InstallationStatuses.UP_TO_DATE
+        else:
+            formula_name = available[name].get('formula_name')
+            formula = load_formula(formula_name)
+            if formula:
+                formulas[name] = (formula, formula_name)
+            else:
+                statuses[name] = InstallationStatuses.BAD_FORMULA
+
+    upgraded = []
+    if formulas:
+        manifests = get_package_manifests(formulas.keys())
+        kept_manifests = get_package_manifests(formulas.keys(), dict(
+            (name, formula.version) for name, (formula, formula_name) in formulas.iteritems()
+            if os.path.isdir(get_version_dir(name, formula.version))))
+
+        workers = max(1, min(int(procyon_settings.DOWNLOAD_WORKERS), len(formulas)))
+        pool = ThreadPool(workers)
+        try:
+            results = pool.map(lambda name: upgrade_formula(name, formulas[name][0], manifests.get(name),
+                installed[name]['version'], kept_manifests.get(name)), sorted(formulas))
+        finally:
+            pool.close()
+            pool.join()
+
+        for name, status in results:
+            if status == InstallationStatuses.UPGRADE_OK:
+                upgraded.append(formulas[name])
+            statuses[name] = status
+    update_registered_packages(upgraded)
+    if upgraded:
+        collect_store_garbage(prune_package_versions([formula.name for formula, formula_name in upgraded]))
+
+    return [(name, statuses[name]) for name in names]
+
+
+def rollback_package(name):
+    return dict(rollback_packages([name])).get(name)
+
+
+def rollback_packages(names):
+    """Switches installed packages with passed names back to latest kept
+    version other than active one, only package link is switched. Versions
+    of all switched packages are updated in one transaction. Returns list of
+    '(name, status)' tuples.
+    """
+    installed = get_installed_packages()
+    versions = get_package_versions([name for name in names if name in installed])
+
+    statuses = {}
+    switched = []
+    for name in names:
+        if name in statuses:
+            continue
+        if name not in installed:
+            statuses[name] = InstallationStatuses.NOT_INSTALLED
+            continue
+
+        active_version = installed[name]['version']
+        previous = [package_version for package_version in versions.get(name, ())
+            if package_version['version'] != active_version and
+            os.path.isdir(get_version_dir(name, package_version['version']))]
+        if not previous:
+            statuses[name] = InstallationStatuses.NO_PREVIOUS_VERSION
+            continue
+
+        try:
+            activate_version(name, previous[0]['version'], active_version)
+        except OSError:
+            statuses[name] = InstallationStatuses.INSTALL_ERROR
+            continue
+        statuses[name] = InstallationStatuses.ROLLBACK_OK
+        switched.append((name, previous[0]))
+
+    now = datetime.now()
+    with span('register', packages=len(switched)):
+        with Package._meta.database.transaction():
+            for name, package_version in switched:
+                Package.update(
+                    formula_name=package_version['formula_name'],
+                    version=package_version['version'],
+                    updated_at=now
+                ).where(Package.name == name).execute()
+
+    return [(name, statuses[name]) for name in names]
+
+
+def verify_packages(names=None):
+    """Checks files of installed packages with passed names or of all
+    installed packages against manifests recorded on install. Files are
+    hashed in pool of processes. Returns list of '(name, status, report)'
+    tuples, where report is dictionary with lists of 'missing', 'modified'
+    and 'unexpected' paths. Packages installed before manifests were recorded
+    have 'NO_MANIFEST' status and are not checked.
+    """
+    installed = get_installed_packages()
+    if not names:
+        names = sorted(installed)
+
+    manifests = get_package_manifests([name for name in names if name in installed])
+    with span('verify', packages=len(names)):
+        reports = verify_manifests(
+            dict((name, (get_install_dir(name), manifests[name])) for name in names if name in manifests),
+            procyon_settings.VERIFY_WORKERS)
+
+    result = []
+    for name in names:
+        report = reports.get(name)
+        if name not in installed:
+            status = InstallationStatuses.NOT_INSTALLED
+        elif report is None:
+            status = InstallationStatuses.NO_MANIFEST
+        elif any(report.values()):
+            status = InstallationStatuses.VERIFY_FAILED
+        else:
+            status = InstallationStatuses.VERIFY_OK
+        result.append((name, status, report))
+
+    return result
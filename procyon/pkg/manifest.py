@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+from multiprocessing import Pool, cpu_count
+import os
+import shutil
+
+
+__all__ = (
+    'hash_installed_file',
+    'iter_tree_files',
+    'build_manifest',
+    'remove_manifest_files',
+    'link_tree',
+    'verify_manifests',
+)
+
+
+CHUNK_SIZE = 64 * 1024
+# NOTE: process pool is not started for small packages, forking costs more than hashing
+MIN_POOL_FILES = 64
+
+
+def hash_installed_file(path):
+    """Returns '(size, md5sum)' tuple for file with passed path or 'None' if
+    file does not exist. Symbolic links are hashed by their target.
+    """
+    md5 = hashlib.md5()
+    try:
+        if os.path.islink(path):
+            target = os.readlink(path)
+            md5.update(target.encode('utf-8') if isinstance(target, unicode) else target)
+            return 0, md5.hexdigest()
+
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                md5.update(chunk)
+                size += len(chunk)
+        return size, md5.hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def iter_tree_files(root):
+    """Yields paths of all files and symbolic links in passed directory
+    relative to it, path parts are separated by '/'.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        relpath = os.path.relpath(dirpath, root)
+        prefix = '' if relpath == '.' else relpath.replace(os.sep, '/') + '/'
+        for name in filenames:
+            yield prefix + name
+        for name in dirnames:
+            if os.path.islink(os.path.join(dirpath, name)):
+                yield prefix + name
+
+
+def get_file_path(root, path):
+    return os.path.join(root, *path.split('/'))
+
+
+def build_manifest(root):
+    """Returns list of '(path, size, md5sum)' tuples for all files in passed
+    directory.
+    """
+    manifest = []
+    for path in sorted(iter_tree_files(root)):
+        size, md5sum = hash_installed_file(get_file_path(root, path))
+        manifest.append((path, size, md5sum))
+    return manifest
+
+
+def remove_manifest_files(root, paths):
+    """Removes files with passed relative paths from directory and all
+    directories left empty, directory itself is removed if it is empty.
+    Files which are not in passed paths are kept.
+    """
+    dirs = set()
+    for path in paths:
+        file_path = get_file_path(root, path)
+        if os.path.islink(file_path) or os.path.isfile(file_path):
+            os.remove(file_path)
+        parent = os.path.dirname(path)
+        while parent:
+            dirs.add(parent)
+            parent = os.path.dirname(parent)
+
+    for path in sorted(dirs, key=lambda path: path.count('/'), reverse=True):
+        dir_path = get_file_path(root, path)
+        if os.path.isdir(dir_path) and not os.path.islink(dir_path) and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+
+    if os.path.isdir(root) and not os.listdir(root):
+        os.rmdir(root)
+
+
+def link_tree(src, dst, paths):
+    """Hard links files with passed relative paths from source directory to
+    destination directory, symbolic links are recreated. File is copied if it
+    can not be linked. Missed files are skipped.
+    """
+    for path in paths:
+        src_path = get_file_path(src, path)
+        dst_path = get_file_path(dst, path)
+        if not os.path.lexists(src_path) or os.path.isdir(src_path) and not os.path.islink(src_path):
+            continue
+
+        if not os.path.exists(os.path.dirname(dst_path)):
+            os.makedirs(os.path.dirname(dst_path))
+        if os.path.islink(src_path):
+            os.symlink(os.readlink(src_path), dst_path)
+            continue
+
+        try:
+            os.link(src_path, dst_path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                raise
+            shutil.copy2(src_path, dst_path)
+
+
+def hash_files(paths, processes=None):
+    """Returns list of 'hash_installed_file' results for passed paths, files
+    are hashed by pool of processes if there are many of them.
+    """
+    processes = processes or cpu_count()
+    if processes == 1 or len(paths) < MIN_POOL_FILES:
+        return [hash_installed_file(path) for path in paths]
+
+    pool = Pool(processes)
+    try:
+        return pool.map(hash_installed_file, paths, chunksize=max(1, len(paths) // (processes * 4)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def verify_manifests(manifests, processes=None):
+    """Checks installed files against manifests, where manifests is
+    dictionary with '(root, manifest)' tuples. Files of all packages are
+    hashed together in pool of processes. Returns dictionary with lists of
+    'missing', 'modified' and 'unexpected' paths for every package.
+    """
+    tasks = []
+    for name, (root, manifest) in manifests.iteritems():
+        for path, size, md5sum in manifest:
+            tasks.append((name, path, size, md5sum, get_file_path(root, path)))
+
+    reports = dict((name, {'missing': [], 'modified': [], 'unexpected': []}) for name in manifests)
+
+    results = hash_files([task[-1] for task in tasks], processes)
+    for (name, path, size, md5sum, file_path), result in zip(tasks, results):
+        if result is None:
+            reports[name]['missing'].append(path)
+        elif result != (size, md5sum):
+            reports[name]['modified'].append(path)
+
+    for name, (root, manifest) in manifests.iteritems():
+        expected = set(path for path, size, md5sum in manifest)
+        if os.path.isdir(root):
+            reports[name]['unexpected'] = sorted(path for path in iter_tree_files(root) if path not in expected)
+        reports[name]['missing'].sort()
+        reports[name]['modified'].sort()
+
+    return reports
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import json
+import math
+import os
+import threading
+import time
+from urlparse import urlsplit
+
+from procyon import settings as procyon_settings
+
+
+__all__ = (
+    'MirrorStats',
+    'get_mirror_stats',
+)
+
+
+LATENCY_SAMPLES = 32
+MIN_HEDGE_SAMPLES = 8
+THROUGHPUT_WEIGHT = 0.3
+FAILURE_TIMEOUT = 5 * 60
+# NOTE: mirrors are compared by estimated time of download of this size
+RANK_SIZE = 1024 * 1024
+
+
+def get_host(url):
+    parts = urlsplit(url)
+    return '%s://%s' % (parts.scheme, parts.netloc)
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    index = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+class MirrorStats(object):
+    """Latency (time to response headers) and throughput of mirror hosts
+    observed by downloads. Stats are persisted to file with passed path, so
+    mirrors are ranked with history of previous runs.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hosts = self.load()
+        self.changed = False
+
+    def load(self):
+        if not self.path:
+            return {}
+
+        try:
+            with open(self.path, 'rb') as f:
+                hosts = json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+        if not isinstance(hosts, dict):
+            return {}
+        return dict((host, stats) for host, stats in hosts.items() if isinstance(stats, dict))
+
+    def save(self):
+        """Writes changed stats to file atomically.
+        """
+        if not self.path:
+            return
+
+        with self.lock:
+            if not self.changed:
+                return
+            data = json.dumps(self.hosts)
+            self.changed = False
+
+        tmp_path = '%s.%d.%d.tmp' % (self.path, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data.encode('utf-8'))
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
+
+    def update(self, url):
+        self.changed = True
+        return self.hosts.setdefault(get_host(url), {})
+
+    def record_latency(self, url, seconds):
+        with self.lock:
+            stats = self.update(url)
+            latencies = stats.setdefault('latencies', [])
+            latencies.append(seconds)
+            del latencies[:-LATENCY_SAMPLES]
+            stats['failed_at'] = None
+
+    def record_transfer(self, url, size, seconds):
+        if size <= 0 or seconds <= 0:
+            return
+
+        throughput = float(size) / seconds
+        with self.lock:
+            stats = self.update(url)
+            previous = stats.get('throughput')
+            if previous:
+                throughput = previous + THROUGHPUT_WEIGHT * (throughput - previous)
+            stats['throughput'] = throughput
+
+    def record_failure(self, url):
+        with self.lock:
+            self.update(url)['failed_at'] = time.time()
+
+    def get(self, url):
+        with self.lock:
+            stats = self.hosts.get(get_host(url), {})
+            return {
+                'latencies': list(stats.get('latencies') or []),
+                'throughput': stats.get('throughput'),
+                'failed_at': stats.get('failed_at'),
+            }
+
+    def get_latency(self, url, percent=50):
+        """Returns passed percentile of latency of mirror host or 'None' if
+        host was not requested yet.
+        """
+        latencies = self.get(url)['latencies']
+        if not latencies:
+            return None
+        return get_percentile(latencies, percent)
+
+    def get_hedge_delay(self, url):
+        """Returns time after which hedged request should be sent if request
+        to passed url is not answered, it is 'HEDGE_PERCENTILE' of latency of
+        host. Returns 'None' if there are not enough samples.
+        """
+        latencies = self.get(url)['latencies']
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return get_percentile(latencies, float(procyon_settings.HEDGE_PERCENTILE))
+
+    def get_score(self, url):
+        """Returns estimated time of download of 'RANK_SIZE' bytes from
+        passed url, unknown values are counted as zero so new mirrors are
+        tried.
+        """
+        stats = self.get(url)
+        score = get_percentile(stats['latencies'], 50) if stats['latencies'] else 0
+        if stats['throughput']:
+            score += RANK_SIZE / stats['throughput']
+        return score
+
+    def rank(self, urls, now=None):
+        """Returns passed urls sorted from fastest to slowest mirror. Mirrors
+        which failed recently are moved to the end, mirrors with the same
+        score keep passed order.
+        """
+        if len(urls) < 2:
+            return list(urls)
+
+        now = time.time() if now is None else now
+
+        def key(item):
+            index, url = item
+            failed_at = self.get(url)['failed_at']
+            if not failed_at or now - failed_at > FAILURE_TIMEOUT:
+                failed_at = 0
+            return failed_at, self.get_score(url), index
+
+        return [url for index, url in sorted(enumerate(urls), key=key)]
+
+
+stats = None
+stats_lock = threading.Lock()
+
+
+def get_mirror_stats():
+    """Returns mirror stats shared by all downloads, they are loaded from
+    file in procyon directory.
+    """
+    global stats
+    path = os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.MIRRORS_STATS_NAME)
+    with stats_lock:
+        if stats is None or stats.path != path:
+            stats = MirrorStats(path)
+        return stats
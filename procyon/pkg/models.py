@@ -26,29 +26,72 @@
 from __future__ import unicode_literals
 
 from datetime import datetime
-import hashlib
 import os
 import shutil
-import tarfile
-from urllib import urlretrieve
 from urlparse import urlparse
-import zipfile
 
 import peewee
 
 from procyon import settings as procyon_settings
+from procyon.tracing import span
 
 
 __all__ = (
     'Package',
+    'PackageVersion',
+    'InstalledFile',
     'InstallationStatuses',
     'Formula',
 )
 
 
-database = os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.PACKAGES_DB_NAME)
-database = peewee.SqliteDatabase(database)
-database.connect()
+DATABASE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('temp_store', 'MEMORY'),
+    ('cache_size', -8000),
+    ('busy_timeout', 5000),
+)
+
+
+class SqliteAdapter(peewee.SqliteAdapter):
+    """Sqlite adapter which applies 'DATABASE_PRAGMAS' to every new
+    connection. Write ahead log lets readers work while packages are
+    registered, relaxed sync makes commits cheap and still safe in WAL mode.
+    """
+    def connect(self, database, **kwargs):
+        conn = super(SqliteAdapter, self).connect(database, **kwargs)
+        for pragma, value in DATABASE_PRAGMAS:
+            conn.execute('PRAGMA %s = %s' % (pragma, value))
+        return conn
+
+
+class SqliteDatabase(peewee.SqliteDatabase):
+    """Packages database which is opened on first query, database path is
+    taken from settings if it is not passed. Missing tables are created on
+    first connection. Connection is shared between threads, callers do not
+    write to database from different threads at the same time.
+    """
+    def __init__(self, database=None, **connect_kwargs):
+        peewee.Database.__init__(self, SqliteAdapter(), database, **connect_kwargs)
+        self.tables_created = False
+
+    def connect(self):
+        if self.deferred:
+            self.init(get_database_path(), **self.connect_kwargs)
+
+        super(SqliteDatabase, self).connect()
+
+        if not self.tables_created:
+            self.tables_created = True
+            create_tables()
+
+
+def get_database_path():
+    return os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.PACKAGES_DB_NAME)
+
+
+database = SqliteDatabase(check_same_thread=False)
 
 
 class Package(peewee.Model):
@@ -61,8 +104,77 @@ class Package(peewee.Model):
         database = database
 
 
-if not Package.table_exists():
-    Package.create_table()
+class PackageVersion(peewee.Model):
+    name = peewee.CharField(db_index=True)
+    version = peewee.CharField()
+    formula_name = peewee.CharField()
+    installed_at = peewee.DateTimeField(default=datetime.now)
+    # NOTE: JSON list of requirements recorded at install time, 'NULL' for versions installed before
+    dependencies = peewee.TextField(null=True)
+
+    class Meta:
+        database = database
+
+
+class InstalledFile(peewee.Model):
+    package = peewee.CharField(db_index=True)
+    version = peewee.CharField(default='')
+    path = peewee.CharField()
+    size = peewee.IntegerField()
+    md5sum = peewee.CharField()
+
+    class Meta:
+        database = database
+
+
+def insert_many(model, rows):
+    """Inserts passed list of dictionaries with field values by one
+    'executemany' call, every dictionary has the same fields.
+    """
+    if not rows:
+        return
+
+    db = model._meta.database
+    fields = [model._meta.fields[name] for name in sorted(rows[0])]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        db.quote_name(model._meta.db_table),
+        ', '.join(db.quote_name(field.db_column) for field in fields),
+        ', '.join([db.adapter.interpolation] * len(fields)))
+    db.get_cursor().executemany(sql, [[field.db_value(row[field.name]) for field in fields] for row in rows])
+    if db.get_autocommit():
+        db.commit()
+
+
+def create_tables():
+    created = set()
+    for model in (Package, PackageVersion, InstalledFile):
+        if not model.table_exists():
+            model.create_table()
+            created.add(model)
+    migrate_tables(created)
+
+
+def migrate_tables(created):
+    """Updates tables created by previous versions, where created is set of
+    models which tables were just created.
+    """
+    db = Package._meta.database
+    tables = dict((model, model._meta.db_table) for model in (Package, PackageVersion, InstalledFile))
+
+    columns = [row[1] for row in db.execute('PRAGMA table_info(%s)' % tables[InstalledFile]).fetchall()]
+    if 'version' not in columns:
+        db.execute("%s DEFAULT ''" % db.add_column_sql(InstalledFile, 'version'))
+        db.execute('UPDATE %(files)s SET version = (SELECT version FROM %(packages)s '
+            'WHERE %(packages)s.name = %(files)s.package)' % {
+                'files': tables[InstalledFile], 'packages': tables[Package]})
+
+    columns = [row[1] for row in db.execute('PRAGMA table_info(%s)' % tables[PackageVersion]).fetchall()]
+    if 'dependencies' not in columns:
+        db.execute(db.add_column_sql(PackageVersion, 'dependencies'))
+
+    if PackageVersion in created and Package not in created:
+        db.execute('INSERT INTO %s (name, version, formula_name, installed_at) '
+            'SELECT name, version, formula_name, updated_at FROM %s' % (tables[PackageVersion], tables[Package]))
 
 
 class InstallationStatuses:
@@ -81,6 +193,105 @@ class InstallationStatuses:
     NOT_INSTALLED = 12
     UNINSTALL_OK = 13
     UNINSTALL_ERROR = 14
+    DEPENDENCY_NOT_FOUND = 15
+    DEPENDENCY_CONFLICT = 16
+    DEPENDENCY_CYCLE = 17
+    DEPENDENCY_ERROR = 18
+    HAS_DEPENDENTS = 19
+    UPGRADE_OK = 20
+    UP_TO_DATE = 21
+    VERIFY_OK = 22
+    VERIFY_FAILED = 23
+    ROLLBACK_OK = 24
+    NO_PREVIOUS_VERSION = 25
+    BUNDLE_OK = 26
+    BAD_BUNDLE = 27
+    NO_MANIFEST = 28
+
+
+# NOTE: package versions are installed side by side to this directory, every
+# package directory in install path is link to active version
+VERSIONS_DIR_NAME = '.versions'
+LEGACY_VERSION = 'legacy'
+
+
+def get_install_dir(name):
+    return os.path.join(procyon_settings.INSTALL_PATH, name)
+
+
+def get_versions_dir(name):
+    return os.path.join(procyon_settings.INSTALL_PATH, VERSIONS_DIR_NAME, name)
+
+
+def get_version_dir(name, version):
+    dirname = version.replace('/', '_').replace(os.sep, '_')
+    return os.path.join(get_versions_dir(name), '_' + dirname if dirname.startswith('.') else dirname)
+
+
+def activate_version(name, version, previous_version=None):
+    """Switches package link to directory of passed version, link is replaced
+    atomically. Package directory installed before versioned installs is
+    moved to directory of previous version first.
+    """
+    link_install_dir(name, get_version_dir(name, version), previous_version)
+
+
+def link_install_dir(name, target_dir, previous_version=None):
+    install_dir = get_install_dir(name)
+    if os.path.isdir(install_dir) and not os.path.islink(install_dir):
+        legacy_dir = get_version_dir(name, previous_version or LEGACY_VERSION)
+        if os.path.exists(legacy_dir):
+            shutil.rmtree(legacy_dir)
+        if not os.path.exists(os.path.dirname(legacy_dir)):
+            os.makedirs(os.path.dirname(legacy_dir))
+        os.rename(install_dir, legacy_dir)
+
+    link_path = os.path.join(os.path.dirname(install_dir), '.%s.link' % name)
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.relpath(target_dir, os.path.dirname(install_dir)), link_path)
+    os.rename(link_path, install_dir)
+
+
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def install_version_dir(staging_dir, name, version, previous_version=None):
+    """Moves staging directory to directory of passed version and makes it
+    active. Staging directory gets default permissions, not permissions of
+    temporary directory. If passed version is installed already, package link
+    points to new directory while old one is replaced, so link is never
+    dangling.
+    """
+    import tempfile
+
+    os.chmod(staging_dir, 0o777 & ~get_umask())
+    version_dir = get_version_dir(name, version)
+    if not os.path.exists(os.path.dirname(version_dir)):
+        os.makedirs(os.path.dirname(version_dir))
+
+    if not os.path.exists(version_dir):
+        os.rename(staging_dir, version_dir)
+        activate_version(name, version, previous_version)
+        return
+
+    # NOTE: names of version directories never start with dot
+    swap_dir = tempfile.mkdtemp(prefix='.%s-' % os.path.basename(version_dir), dir=os.path.dirname(version_dir))
+    os.rename(staging_dir, swap_dir)
+    link_install_dir(name, swap_dir, previous_version)
+    shutil.rmtree(version_dir)
+    os.rename(swap_dir, version_dir)
+    activate_version(name, version)
+
+
+def remove_version_dir(name, version):
+    shutil.rmtree(get_version_dir(name, version), ignore_errors=True)
+    versions_dir = get_versions_dir(name)
+    if os.path.isdir(versions_dir) and not os.listdir(versions_dir):
+        os.rmdir(versions_dir)
 
 
 class Formula(object):
@@ -91,6 +302,13 @@ class Formula(object):
 
     url = None
     md5sum = None
+    # NOTE: urls of the same archive on other hosts
+    mirrors = ()
+
+    dependencies = ()
+
+    # NOTE: list of '(path, size, md5sum)' tuples of files written by last install
+    manifest = None
 
     def check_items(self):
         if self.name and self.info and self.version and self.url:
@@ -98,82 +316,316 @@ class Formula(object):
 
         return False
 
-    def _check_md5sub(self, tmp_file):
-        md5 = hashlib.md5()
-
-        with open(tmp_file, 'rb') as f:
-            for chunk in iter(lambda: f.read(128 * md5.block_size), b''):
-                md5.update(chunk)
-
-        return md5.hexdigest() == self.md5sum
-
-    def _download(self):
+    def _check_url(self):
         allowed_schemes = [
             'http',
             'https',
         ]
-        scheme = urlparse(self.url).scheme
-        if scheme not in allowed_schemes:
+        urls = [self.url] + list(self.mirrors or [])
+        return all(urlparse(url).scheme in allowed_schemes for url in urls)
+
+    def _download(self):
+        from procyon.pkg.download import get_archive_size
+
+        with span('download', package=self.name) as download_span:
+            status, archive = self._download_archive()
+            download_span.set(status=status, bytes=get_archive_size(archive) if archive else 0)
+        return status, archive
+
+    def _download_archive(self):
+        from procyon.pkg.archives import get_download_path, get_cached_archive, cache_archive
+        from procyon.pkg.download import fetch, DownloadError, BadFileTypeError, ChecksumError
+
+        if not self._check_url():
             return InstallationStatuses.BAD_URL, None
 
+        archive = get_cached_archive(self.url, self.md5sum)
+        if archive is not None:
+            return InstallationStatuses.DOWNLOAD_OK, archive
+
         try:
-            tmp_file, info = urlretrieve(self.url)
-        except IOError:
+            archive = fetch(self.url, self.md5sum, get_download_path(self.md5sum), self.mirrors or ())
+        except BadFileTypeError:
+            return InstallationStatuses.BAD_FILE_TYPE, None
+        except ChecksumError:
+            return InstallationStatuses.MD5SUM_CHECK_ERROR, None
+        except DownloadError:
             return InstallationStatuses.DOWNLOAD_ERROR, None
 
-        if not zipfile.is_zipfile(tmp_file) and not tarfile.is_tarfile(tmp_file):
-            return InstallationStatuses.BAD_FILE_TYPE, None
+        return InstallationStatuses.DOWNLOAD_OK, cache_archive(self.url, archive, self.md5sum)
+
+    def _verify(self, archive):
+        """Checks type and md5sum of downloaded archive before extraction.
+        Returns 'DOWNLOAD_OK' status if archive may be extracted.
+        """
+        from procyon.pkg.archives import verify_archive
+        from procyon.pkg.download import ZIP_ARCHIVE, TAR_ARCHIVE
+
+        with span('verify', package=self.name) as verify_span:
+            if archive.type not in (ZIP_ARCHIVE, TAR_ARCHIVE):
+                status = InstallationStatuses.BAD_FILE_TYPE
+            elif self.md5sum and archive.md5sum != self.md5sum or not verify_archive(archive):
+                status = InstallationStatuses.MD5SUM_CHECK_ERROR
+            else:
+                status = InstallationStatuses.DOWNLOAD_OK
+            verify_span.set(status=status)
+        return status
+
+    def _extract(self, archive):
+        from procyon.pkg.download import get_archive_size
+
+        with span('extract', package=self.name, bytes=get_archive_size(archive)) as extract_span:
+            status = self._extract_archive(archive)
+            extract_span.set(status=status)
+        return status
+
+    def _extract_archive(self, archive):
+        import tempfile
+        from procyon.pkg.delta import apply_delta, staging_writer
+        from procyon.pkg.download import BadFileTypeError, ExtractError
+
+        if procyon_settings.STORE_MODE:
+            return self._extract_to_store(archive)
+
+        if procyon_settings.INSTALL_PATH and not os.path.exists(procyon_settings.INSTALL_PATH):
+            os.makedirs(procyon_settings.INSTALL_PATH)
+        staging_dir = tempfile.mkdtemp(prefix='.%s-' % self.name, dir=procyon_settings.INSTALL_PATH)
+        tree_dir = os.path.join(staging_dir, 'tree')
 
-        if self.md5sum and not self._check_md5sub(tmp_file):
-            return InstallationStatuses.MD5SUM_CHECK_ERROR, None
+        try:
+            # NOTE: every member is written to empty tree, manifest is hashed while members are written
+            self.manifest = apply_delta(archive, tree_dir, [], staging_writer(staging_dir),
+                max_size=procyon_settings.MAX_EXTRACT_SIZE,
+                max_members=procyon_settings.MAX_EXTRACT_MEMBERS)[0]
+            install_version_dir(tree_dir, self.name, self.version)
+        except BadFileTypeError:
+            return InstallationStatuses.BAD_FILE_TYPE
+        except ExtractError:
+            return InstallationStatuses.EXTRACT_ERROR
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
 
-        return InstallationStatuses.DOWNLOAD_OK, tmp_file
+        return InstallationStatuses.EXTRACT_OK
 
-    def _extract(self, tmp_file):
-        if zipfile.is_zipfile(tmp_file):
-            arc = zipfile.ZipFile(tmp_file)
-        elif tarfile.is_tarfile(tmp_file):
-            arc = tarfile.TarFile(tmp_file)
-        else:
+    def _extract_to_store(self, archive):
+        """Extracts archive through content addressed store, files which are
+        already stored are not written again, they are hard linked.
+        """
+        import tempfile
+        from procyon.pkg.download import BadFileTypeError, ExtractError
+        from procyon.pkg.store import extract_to_store
+
+        if procyon_settings.INSTALL_PATH and not os.path.exists(procyon_settings.INSTALL_PATH):
+            os.makedirs(procyon_settings.INSTALL_PATH)
+        staging_dir = tempfile.mkdtemp(prefix='.%s-' % self.name, dir=procyon_settings.INSTALL_PATH)
+
+        try:
+            self.manifest = extract_to_store(archive, staging_dir,
+                max_size=procyon_settings.MAX_EXTRACT_SIZE,
+                max_members=procyon_settings.MAX_EXTRACT_MEMBERS)
+            install_version_dir(staging_dir, self.name, self.version)
+        except BadFileTypeError:
             return InstallationStatuses.BAD_FILE_TYPE
+        except ExtractError:
+            return InstallationStatuses.EXTRACT_ERROR
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
 
-        install_dir = os.path.join(procyon_settings.INSTALL_PATH, self.name)
-        if not os.path.exists(install_dir):
-            os.makedirs(install_dir)
+        return InstallationStatuses.EXTRACT_OK
+
+    def _stream_extract(self):
+        """Extracts tar archive while it is downloaded. Returns 'None' if
+        archive can not be extracted from stream.
+        """
+        with span('stream_extract', package=self.name) as extract_span:
+            status = self._stream_extract_archive()
+            extract_span.set(status=status)
+        return status
+
+    def _stream_extract_archive(self):
+        import tempfile
+        from procyon.pkg.download import stream_extract
+        from procyon.pkg.download import DownloadError, BadFileTypeError, ChecksumError, NotStreamableError
+        from procyon.pkg.download import ExtractError
+        from procyon.pkg.mirrors import get_mirror_stats
+        from procyon.pkg.store import store_tree
+
+        if not self._check_url():
+            return InstallationStatuses.BAD_URL
+
+        if procyon_settings.INSTALL_PATH and not os.path.exists(procyon_settings.INSTALL_PATH):
+            os.makedirs(procyon_settings.INSTALL_PATH)
+        staging_dir = tempfile.mkdtemp(prefix='.%s-' % self.name, dir=procyon_settings.INSTALL_PATH)
+
+        mirrors = list(self.mirrors or [])
+        url = get_mirror_stats().rank([self.url] + mirrors)[0]
 
         try:
-            arc.extractall(path=install_dir)
-        except (zipfile.BadZipfile, zipfile.LargeZipFile, tarfile.ReadError, tarfile.ExtractError):
+            md5sum, manifest = stream_extract(url, staging_dir, self.md5sum,
+                max_size=procyon_settings.MAX_EXTRACT_SIZE,
+                max_members=procyon_settings.MAX_EXTRACT_MEMBERS)
+        except NotStreamableError:
+            return None
+        except BadFileTypeError:
+            return InstallationStatuses.BAD_FILE_TYPE
+        except ChecksumError:
+            return InstallationStatuses.MD5SUM_CHECK_ERROR
+        except DownloadError:
+            if mirrors:
+                # NOTE: regular download fails over to other mirrors
+                return None
+            return InstallationStatuses.DOWNLOAD_ERROR
+        except ExtractError:
             return InstallationStatuses.EXTRACT_ERROR
+        else:
+            self.manifest = manifest
+            if procyon_settings.STORE_MODE:
+                store_tree(staging_dir, self.manifest)
+            install_version_dir(staging_dir, self.name, self.version)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
 
         return InstallationStatuses.EXTRACT_OK
 
-    def install(self):
+    def install(self, archive=None):
+        with span('install', package=self.name) as install_span:
+            status = self._install(archive)
+            install_span.set(status=status)
+        return status
+
+    def _install(self, archive):
+        # NOTE: archive modules are imported only when packages are installed
+        from procyon.pkg.archives import get_cached_archive, release_archive
+
         if not self.check_items():
             return InstallationStatuses.BAD_FORMULA
 
-        status, tmp_file = self._download()
+        if archive is None and procyon_settings.STREAM_EXTRACT:
+            archive = get_cached_archive(self.url, self.md5sum)
+            if archive is None:
+                status = self._stream_extract()
+                if status is not None:
+                    return InstallationStatuses.INSTALL_OK if status == InstallationStatuses.EXTRACT_OK else status
+
+        if archive is None:
+            status, archive = self._download()
+        else:
+            # NOTE: passed archive is not checked by download
+            status = self._verify(archive)
         if status != InstallationStatuses.DOWNLOAD_OK:
+            if archive is not None:
+                release_archive(archive)
             return status
 
-        # TODO: install dependencies
-
-        status = self._extract(tmp_file)
+        status = self._extract(archive)
+        release_archive(archive)
         if status != InstallationStatuses.EXTRACT_OK:
             return status
 
         return InstallationStatuses.INSTALL_OK
 
-    def uninstall(self):
+    def upgrade(self, manifest=None, installed_version=None):
+        """Installs new version next to installed version and makes it active,
+        where manifest is list of '(path, size, md5sum)' tuples of installed
+        files. Installed version is kept for rollback.
+        """
+        with span('upgrade', package=self.name) as upgrade_span:
+            status = self._upgrade(manifest, installed_version)
+            upgrade_span.set(status=status)
+        return status
+
+    def _upgrade(self, manifest, installed_version):
+        from procyon.pkg.archives import release_archive
+
         if not self.check_items():
             return InstallationStatuses.BAD_FORMULA
 
-        install_dir = os.path.join(procyon_settings.INSTALL_PATH, self.name)
-        if not os.path.exists(install_dir):
+        status, archive = self._download()
+        if status != InstallationStatuses.DOWNLOAD_OK:
+            return status
+
+        status = self._patch(archive, manifest, installed_version)
+        release_archive(archive)
+        if status != InstallationStatuses.EXTRACT_OK:
+            return status
+
+        return InstallationStatuses.UPGRADE_OK
+
+    def _patch(self, archive, manifest, installed_version=None):
+        """Builds directory of new version from installed files and archive,
+        where manifest is list of '(path, size, md5sum)' tuples of installed
+        files. Installed files are hard linked to new directory, then only
+        added and changed files are written and removed files are unlinked.
+        """
+        from procyon.pkg.download import get_archive_size
+
+        with span('patch', package=self.name, bytes=get_archive_size(archive)) as patch_span:
+            status = self._patch_archive(archive, manifest, installed_version, patch_span)
+            patch_span.set(status=status)
+        return status
+
+    def _patch_archive(self, archive, manifest, installed_version, patch_span):
+        import tempfile
+        from procyon.pkg.delta import apply_delta, staging_writer
+        from procyon.pkg.download import BadFileTypeError, ExtractError
+        from procyon.pkg.manifest import iter_tree_files, link_tree
+        from procyon.pkg.store import link_member
+
+        if procyon_settings.INSTALL_PATH and not os.path.exists(procyon_settings.INSTALL_PATH):
+            os.makedirs(procyon_settings.INSTALL_PATH)
+        staging_dir = tempfile.mkdtemp(prefix='.%s-' % self.name, dir=procyon_settings.INSTALL_PATH)
+        tree_dir = os.path.join(staging_dir, 'tree')
+        write = link_member if procyon_settings.STORE_MODE else staging_writer(staging_dir)
+
+        try:
+            installed_dir = get_install_dir(self.name)
+            if os.path.isdir(installed_dir):
+                link_tree(installed_dir, tree_dir, list(iter_tree_files(installed_dir)))
+
+            self.manifest, written, removed = apply_delta(archive, tree_dir, manifest, write,
+                max_size=procyon_settings.MAX_EXTRACT_SIZE,
+                max_members=procyon_settings.MAX_EXTRACT_MEMBERS)
+            install_version_dir(tree_dir, self.name, self.version, installed_version)
+        except BadFileTypeError:
+            return InstallationStatuses.BAD_FILE_TYPE
+        except ExtractError:
+            return InstallationStatuses.EXTRACT_ERROR
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        patch_span.set(written=written, removed=removed)
+        return InstallationStatuses.EXTRACT_OK
+
+    def uninstall(self, manifest=None):
+        """Removes installed package with all its kept versions. If manifest
+        with installed paths is passed only these files are removed from
+        active version, otherwise whole package directory is removed.
+        """
+        from procyon.pkg.manifest import remove_manifest_files
+
+        if not self.check_items():
+            return InstallationStatuses.BAD_FORMULA
+
+        install_dir = get_install_dir(self.name)
+        versions_dir = get_versions_dir(self.name)
+        if not os.path.lexists(install_dir) and not os.path.isdir(versions_dir):
             return InstallationStatuses.NOT_INSTALLED
 
-        shutil.rmtree(install_dir)
+        active_dir = os.path.realpath(install_dir)
+        if os.path.islink(install_dir):
+            os.remove(install_dir)
 
-        # TODO: uninstall dependencies
+        if manifest is None:
+            shutil.rmtree(active_dir, ignore_errors=True)
+        else:
+            remove_manifest_files(active_dir, manifest)
+
+        if os.path.isdir(versions_dir):
+            for dirname in os.listdir(versions_dir):
+                version_dir = os.path.join(versions_dir, dirname)
+                if os.path.realpath(version_dir) != active_dir:
+                    shutil.rmtree(version_dir)
+            if not os.listdir(versions_dir):
+                os.rmdir(versions_dir)
 
         return InstallationStatuses.UNINSTALL_OK
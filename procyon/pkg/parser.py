@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import ast
+
+
+__all__ = (
+    'parse_formula',
+)
+
+
+BASE_FORMULA_MODULE = 'procyon.pkg.models'
+BASE_FORMULA_NAME = 'Formula'
+FORMULA_CLASS_NAME = 'Formula'
+
+
+def get_base_formula_aliases(tree):
+    aliases = set()
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module == BASE_FORMULA_MODULE:
+            for alias in node.names:
+                if alias.name == BASE_FORMULA_NAME:
+                    aliases.add(alias.asname or alias.name)
+    return aliases
+
+
+def is_docstring(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Str)
+
+
+def parse_class_body(node):
+    attrs = {}
+    for item in node.body:
+        if is_docstring(item):
+            continue
+
+        if not isinstance(item, ast.Assign) or len(item.targets) != 1:
+            return None
+
+        target = item.targets[0]
+        if not isinstance(target, ast.Name):
+            return None
+
+        try:
+            attrs[target.id] = ast.literal_eval(item.value)
+        except ValueError:
+            return None
+
+    return attrs
+
+
+def parse_formula(path):
+    """Returns dictionary with formula attributes parsed from formula file
+    without its execution. Returns 'None' if formula is dynamic (formula class
+    contains something except literal attributes or module does something
+    except imports) and should be imported.
+    """
+    try:
+        with open(path, 'rb') as f:
+            source = f.read()
+        tree = ast.parse(source, path)
+    except (IOError, SyntaxError, TypeError):
+        return None
+
+    aliases = get_base_formula_aliases(tree)
+    attrs = None
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)) or is_docstring(node):
+            continue
+
+        if not isinstance(node, ast.ClassDef) or node.name != FORMULA_CLASS_NAME or attrs is not None:
+            return None
+
+        bases = [base.id for base in node.bases if isinstance(base, ast.Name)]
+        if len(node.bases) != 1 or len(bases) != 1 or bases[0] not in aliases or node.decorator_list:
+            return None
+
+        attrs = parse_class_body(node)
+        if attrs is None:
+            return None
+
+    return attrs
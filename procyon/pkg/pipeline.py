@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+from Queue import Queue, Empty
+import threading
+
+from procyon import settings as procyon_settings
+from procyon.pkg.archives import release_archive
+from procyon.pkg.models import InstallationStatuses
+
+
+__all__ = (
+    'PipelineTimeout',
+    'InstallFuture',
+    'InstallPipeline',
+    'run_async',
+)
+
+
+STOP = object()
+
+VERIFIED = 'verified'
+EXTRACTED = 'extracted'
+REGISTERED = 'registered'
+
+
+class PipelineTimeout(Exception):
+    pass
+
+
+class InstallFuture(object):
+    """Result of installation running in background thread, result is waited
+    with 'result' method like result of Python 3 futures.
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._error = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Returns result of installation, exception raised by installation
+        is raised again. Raises 'PipelineTimeout' if installation is not
+        finished in passed timeout.
+        """
+        # NOTE: 'Event.wait' returns 'None' on Python 2.6, flag is checked after wait
+        self._done.wait(timeout)
+        if not self._done.is_set():
+            raise PipelineTimeout()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def add_done_callback(self, callback):
+        """Calls passed callback with future when installation is finished,
+        callback is called immediately if installation is already finished.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            self._result = result
+            self._error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+def run_async(function, *args):
+    """Calls function with passed arguments in background thread. Returns
+    'InstallFuture' of its result.
+    """
+    future = InstallFuture()
+
+    def run():
+        try:
+            result = function(*args)
+        except Exception as e:
+            future._finish(error=e)
+        else:
+            future._finish(result)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def get_install_order(graph):
+    """Returns names from passed graph where dependencies are before their
+    dependents.
+    """
+    pending = dict((name, set(deps) & set(graph)) for name, deps in graph.items())
+    order = []
+    while pending:
+        # NOTE: cycles are rejected by resolver, they are just flattened here
+        ready = sorted(name for name, deps in pending.items() if not deps) or sorted(pending)
+        for name in ready:
+            del pending[name]
+        for deps in pending.values():
+            deps.difference_update(ready)
+        order.extend(ready)
+    return order
+
+
+class InstallPipeline(object):
+    """Installs packages from passed graph in stages connected with bounded
+    queues: archives are downloaded, verified, extracted and registered by
+    separate threads, so different packages are in different stages at the
+    same time. Formulas is dictionary with formula of every package, graph is
+    dictionary with sets of dependencies, register is called with list of
+    extracted packages names. Package is extracted only after all its
+    dependencies are extracted, its archive is downloaded and verified
+    earlier.
+    """
+    def __init__(self, formulas, graph, register):
+        self.formulas = formulas
+        self.graph = graph
+        self.register = register
+
+        size = max(1, int(procyon_settings.PIPELINE_QUEUE_SIZE))
+        self.download_queue = Queue(size)
+        self.verify_queue = Queue(size)
+        self.extract_queue = Queue(size)
+        self.register_queue = Queue(size)
+        # NOTE: events are not bounded, so stages never wait for coordinator
+        self.events = Queue()
+
+        self.pending = dict((name, set(deps)) for name, deps in graph.items())
+        self.dependents = {}
+        for name, deps in graph.items():
+            for dep_name in deps:
+                self.dependents.setdefault(dep_name, set()).add(name)
+        self.unfinished = set(graph)
+        self.cancelled = set()
+        # NOTE: cached archives are not evicted until they are released
+        self.verified = {}
+
+        self.download_workers = max(1, min(int(procyon_settings.DOWNLOAD_WORKERS), len(graph)))
+        self.extract_workers = max(1, min(int(procyon_settings.EXTRACT_WORKERS), len(graph)))
+        self.feeder = None
+        self.stages = []
+
+    def start_thread(self, target):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def start(self):
+        self.feeder = self.start_thread(self.feed)
+        self.stages = [
+            [self.start_thread(self.download_stage) for i in range(self.download_workers)],
+            [self.start_thread(self.verify_stage)],
+            [self.start_thread(self.extract_stage) for i in range(self.extract_workers)],
+            [self.start_thread(self.register_stage)],
+        ]
+
+    def stop(self):
+        """Waits until every stage processes its queue, packages which are
+        not finished are not installed.
+        """
+        self.cancelled.update(self.unfinished)
+        self.feeder.join()
+        queues = [None, self.verify_queue, self.extract_queue, self.register_queue]
+        for queue, threads in zip(queues, self.stages):
+            if queue is not None:
+                for thread in threads:
+                    queue.put(STOP)
+            for thread in threads:
+                thread.join()
+
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except Empty:
+                break
+            if event[0] == VERIFIED and event[3] is not None:
+                release_archive(event[3])
+        for archive in self.verified.values():
+            release_archive(archive)
+        self.verified.clear()
+
+    def feed(self):
+        for name in get_install_order(self.graph):
+            if name not in self.cancelled:
+                self.download_queue.put(name)
+        for i in range(self.download_workers):
+            self.download_queue.put(STOP)
+
+    def download_stage(self):
+        for name in iter(self.download_queue.get, STOP):
+            if name in self.cancelled:
+                continue
+            try:
+                status, archive = self.formulas[name]._download()
+            except Exception:
+                status, archive = InstallationStatuses.INSTALL_ERROR, None
+            self.verify_queue.put((name, status, archive))
+
+    def verify_stage(self):
+        for name, status, archive in iter(self.verify_queue.get, STOP):
+            if status == InstallationStatuses.DOWNLOAD_OK and name not in self.cancelled:
+                try:
+                    status = self.formulas[name]._verify(archive)
+                except Exception:
+                    status = InstallationStatuses.INSTALL_ERROR
+            self.events.put((VERIFIED, name, status, archive))
+
+    def extract_stage(self):
+        for name, archive in iter(self.extract_queue.get, STOP):
+            status = InstallationStatuses.INSTALL_ERROR
+            if name not in self.cancelled:
+                try:
+                    status = self.formulas[name]._extract(archive)
+                except Exception:
+                    pass
+            release_archive(archive)
+
+            # NOTE: package is queued for registration before its dependents
+            if status == InstallationStatuses.EXTRACT_OK:
+                self.register_queue.put(name)
+            self.events.put((EXTRACTED, name, status))
+
+    def register_stage(self):
+        stopped = False
+        while not stopped:
+            names = [self.register_queue.get()]
+            # NOTE: packages extracted meanwhile are registered in one transaction
+            while names[-1] is not STOP:
+                try:
+                    names.append(self.register_queue.get_nowait())
+                except Empty:
+                    break
+            if names[-1] is STOP:
+                stopped = True
+                names.pop()
+            if not names:
+                continue
+
+            try:
+                self.register(names)
+            except Exception:
+                status = InstallationStatuses.INSTALL_ERROR
+            else:
+                status = InstallationStatuses.INSTALL_OK
+            self.events.put((REGISTERED, names, status))
+
+    def fail(self, name, status):
+        self.unfinished.discard(name)
+        self.cancelled.add(name)
+        yield name, status
+
+        for dependent in self.dependents.get(name, ()):
+            if dependent in self.unfinished:
+                archive = self.verified.pop(dependent, None)
+                if archive is not None:
+                    release_archive(archive)
+                for result in self.fail(dependent, InstallationStatuses.DEPENDENCY_ERROR):
+                    yield result
+
+    def extract_ready(self, name):
+        if name in self.verified and not self.pending[name]:
+            self.extract_queue.put((name, self.verified.pop(name)))
+
+    def run(self):
+        """Yields '(name, status)' tuples as soon as packages are registered
+        or failed.
+        """
+        if not self.graph:
+            return
+
+        self.start()
+        try:
+            while self.unfinished:
+                event = self.events.get()
+                kind = event[0]
+
+                if kind == REGISTERED:
+                    names, status = event[1:]
+                    for name in names:
+                        if name in self.unfinished:
+                            self.unfinished.discard(name)
+                            yield name, status
+                    continue
+
+                name, status = event[1:3]
+                if kind == EXTRACTED and status == InstallationStatuses.EXTRACT_OK:
+                    # NOTE: package may be already registered here
+                    for dependent in self.dependents.get(name, ()):
+                        if dependent in self.unfinished:
+                            self.pending[dependent].discard(name)
+                            self.extract_ready(dependent)
+                    continue
+
+                archive = event[3] if kind == VERIFIED else None
+                if name not in self.unfinished:
+                    if archive is not None:
+                        release_archive(archive)
+                    continue
+
+                if status == InstallationStatuses.DOWNLOAD_OK:
+                    self.verified[name] = archive
+                    self.extract_ready(name)
+                    continue
+                if archive is not None:
+                    release_archive(archive)
+
+                for result in self.fail(name, status):
+                    yield result
+        finally:
+            self.stop()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import re
+
+from procyon.pkg.models import InstallationStatuses
+from procyon.pkg.versions import compare_versions
+
+
+__all__ = (
+    'parse_requirement',
+    'is_satisfied',
+    'resolve_install',
+    'resolve_uninstall',
+    'drop_failed',
+)
+
+
+REQUIREMENT_RE = re.compile(r'^\s*([^<>=!\s]+)\s*(.*?)\s*$')
+CONSTRAINT_RE = re.compile(r'^(==|!=|>=|<=|>|<)\s*(\S+)$')
+
+
+def parse_requirement(requirement):
+    """Returns '(name, constraints)' tuple for passed requirement string like
+    'name>=1.0,<2.0', where constraints is list of '(operator, version)'
+    tuples. Raises 'ValueError' if requirement is malformed.
+    """
+    match = REQUIREMENT_RE.match(requirement)
+    if not match:
+        raise ValueError('Bad requirement: %s' % requirement)
+
+    name, rest = match.groups()
+    constraints = []
+    for constraint in filter(None, [c.strip() for c in rest.split(',')]):
+        constraint_match = CONSTRAINT_RE.match(constraint)
+        if not constraint_match:
+            raise ValueError('Bad requirement: %s' % requirement)
+        constraints.append(constraint_match.groups())
+
+    return name, constraints
+
+
+def is_satisfied(version, constraints):
+    """Returns 'True' if passed version satisfies all passed constraints.
+    """
+    for operator, required in constraints:
+        result = compare_versions(version, required)
+        if not {
+            '==': result == 0,
+            '!=': result != 0,
+            '>=': result >= 0,
+            '<=': result <= 0,
+            '>': result > 0,
+            '<': result < 0,
+        }[operator]:
+            return False
+
+    return True
+
+
+def get_requirements(package_data):
+    requirements = []
+    for requirement in package_data.get('dependencies') or []:
+        requirements.append(parse_requirement(requirement))
+    return requirements
+
+
+def resolve_install(names, available, installed):
+    """Returns '(graph, failed)' tuple for packages which should be installed
+    to install packages with passed names. Graph is dictionary where keys are
+    names of packages to install and values are sets of its dependencies to
+    install. Failed is dictionary with statuses of packages which can not be
+    installed, packages depending on failed packages are failed too.
+    """
+    graph = {}
+    failed = {}
+    visiting = set()
+
+    def fail(name, status):
+        failed.setdefault(name, status)
+        return False
+
+    def visit(name):
+        """Returns 'True' if package and all its dependencies can be
+        installed.
+        """
+        if name in failed:
+            return False
+        if name in graph:
+            return True
+        if name in visiting:
+            return fail(name, InstallationStatuses.DEPENDENCY_CYCLE)
+
+        try:
+            requirements = get_requirements(available[name])
+        except ValueError:
+            return fail(name, InstallationStatuses.BAD_FORMULA)
+
+        visiting.add(name)
+        deps = set()
+        status = None
+        for dep_name, dep_constraints in requirements:
+            if dep_name in installed:
+                if not is_satisfied(installed[dep_name]['version'], dep_constraints):
+                    status = status or InstallationStatuses.DEPENDENCY_CONFLICT
+                continue
+            if dep_name not in available:
+                status = status or InstallationStatuses.DEPENDENCY_NOT_FOUND
+                continue
+            if not is_satisfied(available[dep_name]['version'], dep_constraints):
+                status = status or InstallationStatuses.DEPENDENCY_CONFLICT
+                continue
+
+            if not visit(dep_name):
+                dep_status = failed[dep_name]
+                if dep_status == InstallationStatuses.DEPENDENCY_CYCLE and dep_name in visiting:
+                    status = status or InstallationStatuses.DEPENDENCY_CYCLE
+                else:
+                    status = status or InstallationStatuses.DEPENDENCY_ERROR
+                continue
+            deps.add(dep_name)
+        visiting.discard(name)
+
+        if status is not None:
+            return fail(name, status)
+        if name in failed:
+            return False
+
+        graph[name] = deps
+        return True
+
+    for name in names:
+        if name in installed or name not in available:
+            continue
+        visit(name)
+
+    drop_failed(graph, failed)
+
+    return graph, failed
+
+
+def drop_failed(graph, failed):
+    """Removes failed packages and packages depending on them from passed
+    graph, dependent packages are marked as failed.
+    """
+    changed = True
+    while changed:
+        changed = False
+        for name, deps in graph.items():
+            if name in failed:
+                del graph[name]
+                changed = True
+            elif deps & set(failed):
+                failed[name] = InstallationStatuses.DEPENDENCY_ERROR
+                del graph[name]
+                changed = True
+
+
+def resolve_uninstall(names, available, installed):
+    """Returns '(order, failed)' tuple for packages with passed names, where
+    order is list of packages which can be uninstalled in order dependents
+    first. Packages required by installed packages which are not uninstalled
+    are failed. Dependencies recorded for installed packages are used,
+    dependencies of available packages are used for packages installed
+    without record.
+    """
+    requested = set(name for name in names if name in installed)
+
+    dependents = {}
+    for name, package_data in installed.iteritems():
+        if package_data.get('dependencies') is None:
+            package_data = available.get(name, {})
+        try:
+            requirements = get_requirements(package_data)
+        except ValueError:
+            continue
+        for dep_name, dep_constraints in requirements:
+            dependents.setdefault(dep_name, set()).add(name)
+
+    removable = set(requested)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(removable):
+            if not dependents.get(name, set()) <= removable:
+                removable.discard(name)
+                changed = True
+
+    failed = dict((name, InstallationStatuses.HAS_DEPENDENTS) for name in requested - removable)
+
+    order = []
+    visited = set()
+
+    def visit(name):
+        if name in visited:
+            return
+        visited.add(name)
+        for dependent in sorted(dependents.get(name, set()) & removable):
+            visit(dependent)
+        order.append(name)
+
+    for name in names:
+        if name in removable:
+            visit(name)
+
+    return order, failed
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import base64
+import httplib
+import socket
+import threading
+import urllib
+from urlparse import urljoin, urlsplit
+
+from procyon import settings as procyon_settings
+from procyon.tracing import span
+
+
+__all__ = (
+    'Session',
+    'get_session',
+)
+
+
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+CONNECTION_CLASSES = {
+    'http': httplib.HTTPConnection,
+    'https': httplib.HTTPSConnection,
+}
+
+
+class Response(object):
+    """Wrapper for response which returns its persistent connection to
+    session pool when response is closed after it was read completely.
+    """
+    def __init__(self, session, key, connection, response, url):
+        self.session = session
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.closed = False
+
+    def getcode(self):
+        return self.response.status
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        reusable = self.response.isclosed() and not self.response.will_close
+        if not reusable:
+            self.response.close()
+        self.session.release(self.key, self.connection, reusable)
+
+
+def parse_proxy(url):
+    """Returns '(scheme, host, port, authorization)' tuple for passed proxy
+    url like urllib2 proxy handler does.
+    """
+    parts = urlsplit(url if '://' in url else 'http://' + url)
+    if parts.scheme not in CONNECTION_CLASSES or not parts.hostname:
+        raise ValueError('Unsupported proxy: %s' % url)
+
+    authorization = None
+    if parts.username is not None:
+        credentials = '%s:%s' % (urllib.unquote(parts.username), urllib.unquote(parts.password or ''))
+        authorization = 'Basic %s' % base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+    return parts.scheme, parts.hostname, parts.port, authorization
+
+
+class Session(object):
+    """Pool of persistent HTTP connections. Connections are reused for
+    requests to the same host, count of simultaneous connections to one host
+    is limited. Proxies is dictionary with proxy urls by url scheme, proxies
+    are taken from 'http_proxy' and 'https_proxy' environment variables if it
+    is not passed, https requests are tunneled through proxy with CONNECT.
+    """
+    def __init__(self, max_host_connections=4, timeout=None, proxies=None):
+        self.max_host_connections = max_host_connections
+        self.timeout = timeout
+        self.proxies = urllib.getproxies() if proxies is None else proxies
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.semaphores = {}
+        self.stats = {
+            'requests': 0,
+            'connections': 0,
+            'reused': 0,
+        }
+
+    def get_semaphore(self, key):
+        with self.lock:
+            return self.semaphores.setdefault(key, threading.BoundedSemaphore(self.max_host_connections))
+
+    def acquire(self, key):
+        """Returns '(connection, reused)' tuple for passed host key, waits if
+        all connections to the host are in use.
+        """
+        self.get_semaphore(key).acquire()
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                self.stats['reused'] += 1
+                return idle.pop(), True
+            self.stats['connections'] += 1
+
+        scheme, host, port, proxy = key
+        if proxy is None:
+            return CONNECTION_CLASSES[scheme](host, port, timeout=self.timeout), False
+
+        proxy_scheme, proxy_host, proxy_port, authorization = proxy
+        connection = CONNECTION_CLASSES[proxy_scheme](proxy_host, proxy_port, timeout=self.timeout)
+        if scheme == 'https':
+            headers = {'Proxy-Authorization': authorization} if authorization else None
+            connection.set_tunnel(host, port, headers)
+        return connection, False
+
+    def release(self, key, connection, reusable):
+        if reusable:
+            with self.lock:
+                self.idle.setdefault(key, []).append(connection)
+        else:
+            connection.close()
+        self.get_semaphore(key).release()
+
+    def get_stats(self):
+        """Returns dictionary with count of requests, created connections and
+        requests sent through reused connections.
+        """
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def get_proxy(self, scheme, host):
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.proxy_bypass(host):
+            return None
+        return parse_proxy(proxy)
+
+    def send(self, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in CONNECTION_CLASSES or not parts.hostname:
+            raise ValueError('Unsupported url: %s' % url)
+
+        proxy = self.get_proxy(parts.scheme, parts.hostname)
+        key = (parts.scheme, parts.hostname, parts.port, proxy)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        if proxy is not None and parts.scheme == 'http':
+            # NOTE: plain http requests are sent to proxy with absolute url
+            path = '%s://%s%s' % (parts.scheme, parts.netloc.rpartition('@')[2], path)
+            if proxy[3]:
+                headers = dict(headers)
+                headers['Proxy-Authorization'] = proxy[3]
+
+        with span('http', host=parts.hostname, proxy=proxy is not None) as http_span:
+            connection, reused = self.acquire(key)
+            try:
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                except (socket.error, httplib.HTTPException):
+                    if not reused:
+                        raise
+                    # NOTE: server may close idle persistent connection
+                    with self.lock:
+                        self.stats['reused'] -= 1
+                        self.stats['connections'] += 1
+                    reused = False
+                    connection.close()
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+            except:
+                self.release(key, connection, False)
+                raise
+
+            with self.lock:
+                self.stats['requests'] += 1
+                requests, connections = self.stats['requests'], self.stats['connections']
+            # NOTE: totals of session are reported with every request
+            http_span.set(status=response.status, reused=reused, requests=requests, connections=connections)
+
+        return Response(self, key, connection, response, url)
+
+    def get(self, url, headers=None):
+        """Sends GET request to passed url following redirects. Returns
+        response which must be closed to release its connection.
+        """
+        headers = dict(headers or {})
+        for i in range(MAX_REDIRECTS + 1):
+            response = self.send(url, headers)
+            location = response.getheader('Location')
+            if response.getcode() not in REDIRECT_CODES or not location:
+                return response
+
+            response.read()
+            response.close()
+            url = urljoin(url, location)
+
+        raise httplib.HTTPException('Too many redirects: %s' % url)
+
+
+session = None
+session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns session shared by all downloads.
+    """
+    global session
+    with session_lock:
+        if session is None:
+            session = Session(
+                max_host_connections=int(procyon_settings.MAX_HOST_CONNECTIONS),
+                timeout=procyon_settings.DOWNLOAD_TIMEOUT
+            )
+        return session
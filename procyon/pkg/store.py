@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import zipfile
+
+from procyon import settings as procyon_settings
+from procyon.pkg.delta import open_archive, iter_limited, prepare_target, write_link, hash_link, SPOOL_SIZE
+from procyon.pkg.download import CHUNK_SIZE, ExtractError
+from procyon.pkg.manifest import get_file_path
+
+
+__all__ = (
+    'get_store_path',
+    'get_object_path',
+    'link_member',
+    'extract_to_store',
+    'store_tree',
+    'collect_garbage',
+)
+
+
+STORE_TMP_NAME = 'tmp'
+EXECUTABLE_SUFFIX = '.x'
+
+OBJECT_MODE = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+EXECUTABLE_MODE = OBJECT_MODE | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+
+
+def get_store_path():
+    return os.path.join(procyon_settings.PROCYON_PATH, procyon_settings.STORE_NAME)
+
+
+def get_object_path(md5sum, executable=False):
+    """Returns path of store object with passed content md5sum, executable
+    files are kept apart from other files with the same content.
+    """
+    name = md5sum[2:] + (EXECUTABLE_SUFFIX if executable else '')
+    return os.path.join(get_store_path(), md5sum[:2], name)
+
+
+def is_executable(mode):
+    return bool(mode and mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))
+
+
+def makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def add_object(tmp_path, md5sum, executable):
+    """Moves temporary file to store unless object with the same content is
+    already there. Objects are read only, they are shared by many packages.
+    Returns object path.
+    """
+    object_path = get_object_path(md5sum, executable)
+    if not os.path.exists(object_path):
+        os.chmod(tmp_path, EXECUTABLE_MODE if executable else OBJECT_MODE)
+        makedirs(os.path.dirname(object_path))
+        os.rename(tmp_path, object_path)
+    return object_path
+
+
+def store_member(member, chunks=None):
+    """Writes member (or its passed content chunks) to store if there is no
+    object with the same content yet. Content of small members is kept in
+    memory until it is hashed, so already stored members are not written.
+    Returns '(md5sum, object_path)' tuple.
+    """
+    tmp_dir = os.path.join(get_store_path(), STORE_TMP_NAME)
+    makedirs(tmp_dir)
+
+    md5 = hashlib.md5()
+    buffered, size = [], 0
+    src = member.open() if chunks is None else None
+    dst, tmp_path = None, None
+    try:
+        if src is not None:
+            chunks = iter(lambda: src.read(CHUNK_SIZE), b'')
+        for chunk in chunks:
+            md5.update(chunk)
+            size += len(chunk)
+            if dst is not None:
+                dst.write(chunk)
+                continue
+
+            buffered.append(chunk)
+            if size > SPOOL_SIZE:
+                fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+                dst = os.fdopen(fd, 'wb')
+                for buffered_chunk in buffered:
+                    dst.write(buffered_chunk)
+                buffered = None
+
+        md5sum = md5.hexdigest()
+        executable = is_executable(member.mode)
+        object_path = get_object_path(md5sum, executable)
+        if not os.path.exists(object_path):
+            if dst is None:
+                fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+                dst = os.fdopen(fd, 'wb')
+                for buffered_chunk in buffered:
+                    dst.write(buffered_chunk)
+            dst.close()
+            add_object(tmp_path, md5sum, executable)
+    finally:
+        if src is not None:
+            src.close()
+        if dst is not None:
+            dst.close()
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return md5sum, object_path
+
+
+def link_object(object_path, target):
+    """Replaces target with hard link to store object. Object is copied if
+    it can not be linked, e.g. store is on other file system.
+    """
+    tmp_path = '%s.%s.tmp' % (target, os.getpid())
+    try:
+        os.link(object_path, tmp_path)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+            raise
+        shutil.copy2(object_path, tmp_path)
+    try:
+        os.rename(tmp_path, target)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+
+def link_member(member, target, chunks=None):
+    """Writes member to store and links it to passed target. Returns md5sum
+    of member content.
+    """
+    md5sum, object_path = store_member(member, chunks)
+    link_object(object_path, target)
+    return md5sum
+
+
+def extract_to_store(archive, root, max_size=None, max_members=None):
+    """Extracts archive to passed directory, every file is written to store
+    once and is hard linked to directory. Returns list of '(path, size,
+    md5sum)' tuples of extracted files.
+    """
+    arc, members = open_archive(archive)
+    manifest = {}
+    try:
+        for member in iter_limited(members, archive.path, max_size, max_members):
+            target = prepare_target(root, member.path)
+            if member.linkname is not None:
+                write_link(member, target, root)
+                manifest[member.path] = (0, hash_link(member.linkname))
+            else:
+                manifest[member.path] = (member.size, link_member(member, target))
+    except (zipfile.BadZipfile, zipfile.LargeZipFile, tarfile.TarError) as e:
+        raise ExtractError(str(e))
+    finally:
+        arc.close()
+
+    return sorted((path, size, md5sum) for path, (size, md5sum) in manifest.iteritems())
+
+
+def store_tree(root, manifest):
+    """Moves already extracted files from passed manifest to store, files
+    which are already stored are replaced with hard links.
+    """
+    for path, size, md5sum in manifest:
+        file_path = get_file_path(root, path)
+        if os.path.islink(file_path) or not os.path.isfile(file_path):
+            continue
+
+        executable = is_executable(os.stat(file_path).st_mode)
+        object_path = get_object_path(md5sum, executable)
+        if os.path.exists(object_path):
+            link_object(object_path, file_path)
+            continue
+
+        os.chmod(file_path, EXECUTABLE_MODE if executable else OBJECT_MODE)
+        makedirs(os.path.dirname(object_path))
+        try:
+            os.link(file_path, object_path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.EEXIST):
+                raise
+
+
+def iter_objects():
+    store_path = get_store_path()
+    if not os.path.isdir(store_path):
+        return
+
+    for dirname in os.listdir(store_path):
+        dirpath = os.path.join(store_path, dirname)
+        if dirname == STORE_TMP_NAME or not os.path.isdir(dirpath):
+            continue
+        for name in os.listdir(dirpath):
+            yield os.path.join(dirpath, name)
+
+
+def collect_garbage(md5sums=None):
+    """Removes store objects which are not linked to any installed file,
+    every installed file is hard link to object, so object is not referenced
+    if its links count is 1. Only objects with passed md5sums are checked,
+    whole store is checked if md5sums are not passed. Returns count of
+    removed objects.
+    """
+    if md5sums is None:
+        paths = iter_objects()
+    else:
+        paths = [get_object_path(md5sum, executable) for md5sum in set(md5sums) for executable in (False, True)]
+
+    removed = 0
+    for path in paths:
+        try:
+            if os.lstat(path).st_nlink == 1:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+
+    return removed
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import re
+
+
+__all__ = (
+    'version_key',
+    'compare_versions',
+    'iter_version_keys',
+    'merge_outdated',
+)
+
+
+VERSION_RE = re.compile(r'''
+    ^v?
+    (?P<release>\d+(?:\.\d+)*)
+    (?:[-_.]?(?P<pre>alpha|a|beta|b|c|rc|preview|pre)[-_.]?(?P<pre_number>\d*))?
+    (?:[-_.]?(?P<post>post|rev|r|p)[-_.]?(?P<post_number>\d*)|-(?P<implicit_post>\d+))?
+    (?:[-_.]?(?P<dev>dev)[-_.]?(?P<dev_number>\d*))?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    $''', re.VERBOSE)
+RELEASE_RE = re.compile(r'^v?(\d+(?:\.\d+)*)(.*)$')
+PART_RE = re.compile(r'\d+|[a-z]+')
+
+PRE_PHASES = {
+    'alpha': 0,
+    'a': 0,
+    'beta': 1,
+    'b': 1,
+    'c': 2,
+    'rc': 2,
+    'preview': 2,
+    'pre': 2,
+}
+UNKNOWN_PHASE = -2
+DEV_PHASE = -1
+FINAL_PHASE = 3
+
+VERSION_KEYS_CACHE_SIZE = 65536
+
+_version_keys = {}
+
+
+def get_release(release):
+    parts = [int(part) for part in release.split('.')]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def get_parts(string):
+    return tuple((1, int(part), '') if part.isdigit() else (0, 0, part) for part in PART_RE.findall(string))
+
+
+def parse_version(version):
+    """Returns sort key for passed version string. Versions are compared by
+    release numbers ignoring trailing zeros, then by pre-release tag (dev <
+    alpha < beta < rc < final), post-release number, dev number and local
+    part. Unknown tags are sorted before releases like pre-release tags.
+    """
+    version = ('%s' % (version if version is not None else '')).strip().lower()
+
+    match = VERSION_RE.match(version)
+    if not match:
+        release_match = RELEASE_RE.match(version)
+        if not release_match:
+            return (), (UNKNOWN_PHASE, get_parts(version)), -1, (1, 0), ()
+        release, rest = release_match.groups()
+        return get_release(release), (UNKNOWN_PHASE, get_parts(rest)), -1, (1, 0), ()
+
+    groups = match.groupdict()
+
+    if groups['pre']:
+        pre = (PRE_PHASES[groups['pre']], int(groups['pre_number'] or 0))
+    elif groups['dev'] and not (groups['post'] or groups['implicit_post']):
+        pre = (DEV_PHASE, 0)
+    else:
+        pre = (FINAL_PHASE, 0)
+
+    if groups['post']:
+        post = int(groups['post_number'] or 0)
+    elif groups['implicit_post']:
+        post = int(groups['implicit_post'])
+    else:
+        post = -1
+
+    dev = (0, int(groups['dev_number'] or 0)) if groups['dev'] else (1, 0)
+    local = get_parts(groups['local'] or '')
+
+    return get_release(groups['release']), pre, post, dev, local
+
+
+def version_key(version):
+    """Returns cached sort key for passed version string.
+    """
+    try:
+        return _version_keys[version]
+    except KeyError:
+        pass
+
+    key = parse_version(version)
+    if len(_version_keys) >= VERSION_KEYS_CACHE_SIZE:
+        _version_keys.clear()
+    _version_keys[version] = key
+    return key
+
+
+def compare_versions(first, second):
+    """Returns negative, zero or positive number if first version is less,
+    equal or greater than second one.
+    """
+    return cmp(version_key(first), version_key(second))
+
+
+def iter_version_keys(packages):
+    """Yields '(name, key)' tuples for passed packages dictionary sorted by
+    name, packages without version are skipped.
+    """
+    for name in sorted(packages):
+        version = packages[name].get('version')
+        if version is not None:
+            yield name, version_key(version)
+
+
+def merge_outdated(installed_keys, available_keys):
+    """Merges passed sequences of '(name, key)' tuples sorted by name and
+    yields names of installed packages with greater available key.
+    """
+    available_keys = iter(available_keys)
+    available = next(available_keys, None)
+
+    for name, key in installed_keys:
+        while available is not None and available[0] < name:
+            available = next(available_keys, None)
+        if available is None:
+            return
+        if available[0] == name and available[1] > key:
+            yield name
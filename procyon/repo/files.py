@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import os
+import re
+
+from procyon import settings as procyon_settings
+
+
+__all__ = (
+    'get_repo_hexsha',
+    'read_repo_hexsha',
+    'is_repo_configured',
+)
+
+
+FILE_ADDED = 'A'
+FILE_MODIFIED = 'M'
+FILE_DELETED = 'D'
+
+HEXSHA_RE = re.compile(r'^[0-9a-f]{40}$')
+SYMBOLIC_REF_PREFIX = 'ref:'
+GIT_DIR_PREFIX = 'gitdir:'
+MAX_SYMBOLIC_REFS = 5
+
+
+def read_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8').strip()
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+
+
+def get_git_dir(repo_path):
+    git_dir = os.path.join(repo_path, '.git')
+    if os.path.isfile(git_dir):
+        # NOTE: worktrees and submodules have file with path to git dir
+        content = read_file(git_dir) or ''
+        if content.startswith(GIT_DIR_PREFIX):
+            git_dir = os.path.join(repo_path, content[len(GIT_DIR_PREFIX):].strip())
+    return git_dir
+
+
+def read_packed_ref(git_dir, ref):
+    content = read_file(os.path.join(git_dir, 'packed-refs'))
+    for line in (content or '').splitlines():
+        if line.startswith('#') or line.startswith('^'):
+            continue
+        hexsha, _, name = line.partition(' ')
+        if name == ref:
+            return hexsha
+    return None
+
+
+def read_repo_hexsha(repo_path):
+    """Returns head commit hexsha of repo with passed path reading git files
+    directly, it is much faster than opening repo with GitPython. Returns
+    'None' if hexsha can not be read.
+    """
+    git_dir = get_git_dir(repo_path)
+    value = read_file(os.path.join(git_dir, 'HEAD'))
+
+    for _ in range(MAX_SYMBOLIC_REFS):
+        if not value or not value.startswith(SYMBOLIC_REF_PREFIX):
+            break
+        ref = value[len(SYMBOLIC_REF_PREFIX):].strip()
+        value = read_file(os.path.join(git_dir, ref)) or read_packed_ref(git_dir, ref)
+
+    if value and HEXSHA_RE.match(value):
+        return value
+    return None
+
+
+def is_repo_configured():
+    # NOTE: repo path is derived from remote repo if it is not set
+    return bool(procyon_settings.REMOTE_REPO) or 'REPO_PATH' in vars(procyon_settings)
+
+
+def get_repo_hexsha():
+    """Returns head commit hexsha of the local repo or 'None' if repo is not
+    configured or not cloned yet.
+    """
+    if not is_repo_configured():
+        return None
+    return read_repo_hexsha(procyon_settings.REPO_PATH)
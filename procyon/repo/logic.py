@@ -25,18 +25,105 @@
 
 from __future__ import unicode_literals
 
+import os
+import shutil
+
 from git.cmd import Git
 from git.exc import InvalidGitRepositoryError, GitCommandError, NoSuchPathError
 from git.repo.base import Repo as GitRepo
 
 from procyon import settings as procyon_settings
+from procyon.repo.files import read_repo_hexsha, FILE_ADDED, FILE_MODIFIED, FILE_DELETED
 
 
 __all__ = (
+    'get_changed_files',
+    'get_repo_hexsha',
     'update_repo',
 )
 
 
+SPARSE_CHECKOUT_PATTERNS = (
+    '/*.py',
+)
+
+
+def get_commit_hexsha(repo):
+    return repo.head.commit.hexsha
+
+
+def get_clone_depth():
+    return max(0, int(procyon_settings.REPO_CLONE_DEPTH or 0))
+
+
+def checkout_sparse(repo):
+    """Checks out formula files only.
+    """
+    sparse_checkout_path = os.path.join(repo.git_dir, 'info', 'sparse-checkout')
+    if not os.path.exists(os.path.dirname(sparse_checkout_path)):
+        os.makedirs(os.path.dirname(sparse_checkout_path))
+
+    with open(sparse_checkout_path, 'wb') as f:
+        f.write(''.join('%s\n' % pattern for pattern in SPARSE_CHECKOUT_PATTERNS).encode('utf-8'))
+
+    repo.git.config('core.sparseCheckout', 'true')
+    repo.git.read_tree('-mu', 'HEAD')
+
+
+def list_existing_files(path):
+    try:
+        return set(os.listdir(path))
+    except OSError:
+        return None
+
+
+def remove_clone(path, existing):
+    """Removes files written by failed clone, directory is removed only if it
+    did not exist before clone, where existing is set of names in directory
+    before clone or 'None'.
+    """
+    if existing is None:
+        shutil.rmtree(path, ignore_errors=True)
+        return
+
+    for name in set(list_existing_files(path) or ()) - existing:
+        file_path = os.path.join(path, name)
+        if os.path.isdir(file_path) and not os.path.islink(file_path):
+            shutil.rmtree(file_path, ignore_errors=True)
+        else:
+            os.remove(file_path)
+
+
+def clone_repo():
+    """Clones remote repo. Shallow clone of single branch and sparse checkout
+    of formula files are used if they are enabled in settings, full clone is
+    used if remote repo or git do not support them. Files which existed in
+    repo path before clone are never removed.
+    """
+    git = Git(procyon_settings.PROCYON_PATH)
+    existing = list_existing_files(procyon_settings.REPO_PATH)
+    depth = get_clone_depth()
+    sparse = procyon_settings.REPO_SPARSE_CHECKOUT
+
+    if depth or sparse:
+        kwargs = {}
+        if depth:
+            kwargs.update(depth=depth, single_branch=True)
+        if sparse:
+            kwargs.update(no_checkout=True, filter='blob:none')
+
+        try:
+            git.clone(procyon_settings.REMOTE_REPO, procyon_settings.REPO_PATH, **kwargs)
+            if sparse:
+                checkout_sparse(GitRepo(path=procyon_settings.REPO_PATH))
+            return
+        except GitCommandError:
+            # NOTE: dumb http remotes do not support shallow clones, old git does not support filters
+            remove_clone(procyon_settings.REPO_PATH, existing)
+
+    git.clone(procyon_settings.REMOTE_REPO, procyon_settings.REPO_PATH)
+
+
 def open_or_clone_repo():
     """Returns opened or cloned repo and 'True' flag if operation successful
     else 'None' object and 'False' flag.
@@ -47,13 +134,50 @@ def open_or_clone_repo():
         pass
 
     try:
-        Git(procyon_settings.PROCYON_PATH).clone(procyon_settings.REMOTE_REPO)
+        clone_repo()
     except GitCommandError:
         return None, False
 
     return GitRepo(path=procyon_settings.REPO_PATH), True
 
 
+def pull_repo(repo):
+    """Updates repo from remote. If clone depth is set only last commits of
+    current branch are fetched and working tree is reset to them, full fetch
+    is used if remote repo does not support it.
+    """
+    depth = get_clone_depth()
+    tracking_branch = repo.active_branch.tracking_branch() if depth and not repo.head.is_detached else None
+
+    if tracking_branch is None:
+        try:
+            repo.remotes.origin.pull()
+        except AssertionError:
+            pass
+        return
+
+    remote, branch = tracking_branch.remote_name, tracking_branch.remote_head
+    try:
+        repo.git.fetch(remote, branch, depth=depth)
+    except GitCommandError:
+        repo.git.fetch(remote, branch)
+    repo.git.reset('--hard', 'FETCH_HEAD')
+
+
+def get_repo_hexsha():
+    """Returns head commit hexsha of the local repo or 'None' if repo is not
+    cloned yet.
+    """
+    hexsha = read_repo_hexsha(procyon_settings.REPO_PATH)
+    if hexsha:
+        return hexsha
+
+    try:
+        return get_commit_hexsha(GitRepo(path=procyon_settings.REPO_PATH))
+    except (InvalidGitRepositoryError, NoSuchPathError, AttributeError, ValueError):
+        return None
+
+
 def update_repo():
     """Returns 'True' and hexshas if operation successful else 'False' and
     none-hexshas. If raises some erros when repo updating, return 'False',
@@ -64,16 +188,38 @@ def update_repo():
     if not successful:
         return False, None, None
 
-    hexsha = lambda r: r.heads.master.commit.tree.hexsha
-    before_up_hexhsha = hexsha(repo)
+    before_up_hexhsha = get_commit_hexsha(repo)
 
     try:
-        origin = repo.remotes.origin
-        origin.pull()
+        pull_repo(repo)
     except GitCommandError:
         return False, before_up_hexhsha, None
-    except AssertionError:
-        pass
 
-    after_up_hexsha = hexsha(repo)
+    after_up_hexsha = get_commit_hexsha(repo)
     return True, before_up_hexhsha, after_up_hexsha
+
+
+def get_changed_files(before_hexsha, after_hexsha):
+    """Returns list of '(status, path)' tuples with files changed between
+    passed repo hexshas, where status is one of 'A', 'M' or 'D'. Returns 'None'
+    if changes can not be computed.
+    """
+    try:
+        repo = GitRepo(path=procyon_settings.REPO_PATH)
+        output = repo.git.diff('--name-status', '--no-renames', before_hexsha, after_hexsha)
+    except (InvalidGitRepositoryError, NoSuchPathError, GitCommandError):
+        return None
+
+    changed = []
+    for line in output.splitlines():
+        status, _, path = line.partition('\t')
+        if not path:
+            continue
+
+        status = status[:1]
+        if status not in (FILE_ADDED, FILE_MODIFIED, FILE_DELETED):
+            # NOTE: type changes and other statuses are treated as modifications
+            status = FILE_MODIFIED
+        changed.append((status, path))
+
+    return changed
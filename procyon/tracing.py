@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2012 Procyon <https://github.com/Gr1N/procyon>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import unicode_literals
+
+import functools
+import os
+import thread
+import threading
+import time
+
+
+__all__ = (
+    'span',
+    'traced',
+    'get_sink',
+    'set_sink',
+    'ListSink',
+    'ChromeTraceSink',
+)
+
+
+sink = None
+
+
+def get_sink():
+    return sink
+
+
+def set_sink(new_sink):
+    """Sets sink which receives every finished span with 'add(span)' method,
+    spans are not created if sink is 'None'.
+    """
+    global sink
+    sink = new_sink
+
+
+class Span(object):
+    __slots__ = ('name', 'args', 'start', 'duration', 'thread_id')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = None
+        self.duration = None
+        self.thread_id = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.thread_id = thread.get_ident()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.time() - self.start
+        if exc_type is not None:
+            self.args.setdefault('error', exc_type.__name__)
+
+        current_sink = sink
+        if current_sink is not None:
+            current_sink.add(self)
+        return False
+
+
+class NullSpan(object):
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, **args):
+    """Returns context manager which measures its block as span with passed
+    name and arguments, more arguments may be set with 'set' method of
+    returned span. Shared no-op span is returned if sink is not set.
+    """
+    if sink is None:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def traced(name):
+    """Decorator which measures every call of function as span with passed
+    name, call arguments are span arguments.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if sink is None:
+                return function(*args, **kwargs)
+
+            span_args = dict(kwargs)
+            if args:
+                span_args['args'] = list(args)
+            with Span(name, span_args):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ListSink(object):
+    """Collects spans to list.
+    """
+    def __init__(self):
+        self.spans = []
+
+    def add(self, span):
+        self.spans.append(span)
+
+
+class ChromeTraceSink(object):
+    """Collects spans as Chrome trace events and writes them to file with
+    passed path on close. File can be opened in 'chrome://tracing' or
+    Perfetto UI.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def add(self, span):
+        event = {
+            'name': span.name,
+            'cat': span.name.split('.')[0],
+            'ph': 'X',
+            'ts': int(span.start * 1000000),
+            'dur': int(span.duration * 1000000),
+            'pid': self.pid,
+            'tid': span.thread_id,
+            'args': span.args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def close(self):
+        import json
+
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event['ts'])
+
+        tmp_path = '%s.%d.tmp' % (self.path, self.pid)
+        with open(tmp_path, 'wb') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=lambda value: '%s' % value)
+        os.rename(tmp_path, self.path)
@@ -26,14 +26,19 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import argparse
+import atexit
+import os
 import textwrap
 
-from procyon import core
+from procyon.daemon import get_core, serve, DaemonError
+from procyon.tracing import set_sink, ChromeTraceSink
 
 import test_client.message as msg
 import test_client.properties
 
 
+BUNDLE_FILE_NAME = 'procyon.bundle'
+
 command_accordance = {
     'installed': 'freeze',
     'available': 'cache',
@@ -48,14 +53,22 @@ parser = argparse.ArgumentParser(prog='procyon',
   update - Updates package list.
   install <packages> - Installs new package.
   remove <packages> - Removes installed package.
-  upgrade <packages> - Installs new version of all installed packages.
+  upgrade [packages] - Installs new version of selected or all outdated packages.
+  rollback <packages> - Switches selected packages back to previous installed version.
+  verify [packages] - Checks files of selected or all installed packages.
+  bundle create <packages> - Writes packages with dependencies and archives to procyon.bundle file.
+  bundle install <file> - Installs packages from bundle file without network access.
   search <package> - Searches packages with key word.
   list <list command> - Shows list of specified packages
+  cache clean - Removes downloaded archives from cache.
+  daemon - Runs daemon which keeps package lists in memory, other commands use it when it is running.
 
 Supported list commands:
   installed - Shows list of currently installed packages.
   available - Shows list of available to install packages.
   outdated - Shows list of outdated packages.
+
+Set PROCYON_TRACE environment variable to file path to write Chrome trace of command.
 '''))
 
 parser.add_argument('command', help='command name')
@@ -63,8 +76,21 @@ parser.add_argument('parameter', nargs='*', help='command parameter (file url or
 
 args = parser.parse_args()
 
+if os.environ.get('PROCYON_TRACE'):
+    trace_sink = ChromeTraceSink(os.environ['PROCYON_TRACE'])
+    set_sink(trace_sink)
+    atexit.register(trace_sink.close)
+
+core = get_core() if args.command != 'daemon' else None
+
 try:
-    if args.command == 'set':
+    if args.command == 'daemon':
+        try:
+            serve()
+        except DaemonError as e:
+            print(msg.get_daemon_status(e))
+
+    elif args.command == 'set':
         if args.parameter:
             result = test_client.properties.set_remote_repo_url(args.parameter[0])
             print(msg.get_repo_setting_status(result))
@@ -92,7 +118,37 @@ try:
             parser.print_help()
 
     elif args.command == 'upgrade':
-        core.upgrade()
+        result = core.upgrade(args.parameter)
+        for package in result:
+            print(msg.get_upgrade_status(package))
+
+    elif args.command == 'rollback':
+        if args.parameter:
+            result = core.rollback(args.parameter)
+            for package in result:
+                print(msg.get_rollback_status(package))
+        else:
+            parser.print_help()
+
+    elif args.command == 'verify':
+        result = core.verify(args.parameter)
+        for package in result:
+            print(msg.get_verify_status(package))
+
+    elif args.command == 'bundle':
+        if args.parameter[:1] == ['create'] and args.parameter[1:]:
+            path = os.path.abspath(BUNDLE_FILE_NAME)
+            result = core.bundle_create(path, args.parameter[1:])
+            for package in result:
+                print(msg.get_bundle_status(package))
+            if os.path.exists(path):
+                print('Bundle written to %s' % path)
+        elif args.parameter[:1] == ['install'] and len(args.parameter) == 2:
+            result = core.bundle_install(os.path.abspath(args.parameter[1]))
+            for package in result:
+                print(msg.get_installation_status(package))
+        else:
+            parser.print_help()
 
     elif args.command == 'search':
         if args.parameter:
@@ -104,6 +160,13 @@ try:
         else:
             parser.print_help()
 
+    elif args.command == 'cache':
+        if args.parameter == ['clean']:
+            result = core.clean()
+            print(msg.get_clean_status(result))
+        else:
+            parser.print_help()
+
     elif args.command == 'list':
         if not args.parameter:
             parser.print_help()
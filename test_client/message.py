@@ -30,7 +30,13 @@ from procyon.pkg.models import InstallationStatuses
 __all__ = (
     'get_installation_status',
     'get_uninstallation_status',
+    'get_upgrade_status',
+    'get_rollback_status',
+    'get_verify_status',
+    'get_bundle_status',
     'get_update_status',
+    'get_clean_status',
+    'get_daemon_status',
     'get_repo_setting_status',
     'get_package_list_info',
 )
@@ -47,6 +53,21 @@ installation_statuses = {
     InstallationStatuses.EXTRACT_ERROR: 'Error occured during %s package exctraction',
     InstallationStatuses.UNINSTALL_OK:'Package %s succesfully removed',
     InstallationStatuses.NOT_INSTALLED: 'Selected package %s is not installed',
+    InstallationStatuses.DEPENDENCY_NOT_FOUND: 'Dependency of package %s was not found',
+    InstallationStatuses.DEPENDENCY_CONFLICT: 'Dependencies of package %s have conflicting versions',
+    InstallationStatuses.DEPENDENCY_CYCLE: 'Dependencies of package %s are cyclic',
+    InstallationStatuses.DEPENDENCY_ERROR: 'Error occured during %s package dependencies installation',
+    InstallationStatuses.HAS_DEPENDENTS: 'Selected package %s is required by other installed packages',
+    InstallationStatuses.UPGRADE_OK: 'Package %s succesfully upgraded',
+    InstallationStatuses.UP_TO_DATE: 'Selected package %s is up to date',
+    InstallationStatuses.ROLLBACK_OK: 'Package %s succesfully rolled back',
+    InstallationStatuses.NO_PREVIOUS_VERSION: 'Selected package %s has no previous version',
+    InstallationStatuses.VERIFY_OK: 'Package %s files are intact',
+    InstallationStatuses.VERIFY_FAILED: 'Package %s files were changed',
+    InstallationStatuses.NO_MANIFEST: 'Package %s was installed without files list and can not be verified',
+    InstallationStatuses.BUNDLE_OK: 'Package %s succesfully bundled',
+    InstallationStatuses.BAD_BUNDLE: 'Selected bundle %s is broken',
+    InstallationStatuses.MD5SUM_CHECK_ERROR: 'Checksum of %s package archive does not match',
 }
 
 
@@ -64,13 +85,60 @@ def get_uninstallation_status(package):
     return 'Error occured during %s package removing' % package[0]
 
 
+def get_upgrade_status(package):
+    status = installation_statuses.get(package[1])
+    if status:
+        return status % package[0]
+    return 'Error occured during %s package upgrading' % package[0]
+
+
+def get_rollback_status(package):
+    status = installation_statuses.get(package[1])
+    if status:
+        return status % package[0]
+    return 'Error occured during %s package rolling back' % package[0]
+
+
+def get_verify_status(package):
+    status = installation_statuses.get(package[1])
+    if not status:
+        return 'Error occured during %s package verifying' % package[0]
+
+    info = [status % package[0]]
+    report = package[2] or {}
+    for kind in ('missing', 'modified', 'unexpected'):
+        for path in report.get(kind, ()):
+            info.append('  %s: %s' % (kind, path))
+    return '\n'.join(info)
+
+
+def get_bundle_status(package):
+    status = installation_statuses.get(package[1])
+    if status:
+        return status % package[0]
+    return 'Error occured during %s package bundling' % package[0]
+
+
 def get_update_status(result):
     if result[0]:
-        return 'Package list succesfully updated from %s to %s' % (str(result[1]), str(result[2]))
+        status = 'Package list succesfully updated from %s to %s' % (str(result[1]), str(result[2]))
+        changes = result[3]
+        if changes:
+            status += '\n%d added, %d removed, %d updated' % (
+                len(changes['added']), len(changes['removed']), len(changes['updated']))
+        return status
     else:
         return 'Update was not performed'
 
 
+def get_clean_status(result):
+    return '%d cached archives removed' % result
+
+
+def get_daemon_status(error):
+    return 'Daemon was not started. %s' % error
+
+
 def get_repo_setting_status(result):
     if result[0]:
         return 'Remote repo succesfully set'
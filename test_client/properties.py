@@ -45,7 +45,7 @@ def set_remote_repo_url(url):
     if not parse_result.path.endswith('.git'):
         return False, 'Only git repositories allowed'
 
-    settings_path = os.path.join(procyon_settings['PROCYON_PATH'], 'settings.json')
+    settings_path = os.path.join(procyon_settings.PROCYON_PATH, 'settings.json')
     f = open(settings_path, 'r')
     try:
         settings_from_file = json.load(f)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from procyon import core
+from procyon.daemon import DaemonServer, DaemonClient, DaemonError, get_core
+
+
+__all__ = (
+    'DaemonTests',
+)
+
+
+class DaemonTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.path, 'daemon.sock')
+        self.server = DaemonServer(self.socket_path)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        self.server_thread.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+        shutil.rmtree(self.path)
+
+    def connect(self):
+        client = DaemonClient(self.socket_path)
+        self.clients.append(client)
+        return client
+
+    def test_call(self):
+        installed = {'kb': {'version': '1.0', 'updated_at': datetime(2013, 1, 2, 3, 4, 5)}}
+        client = self.connect()
+
+        with patch('procyon.core.freeze', new=lambda: installed):
+            self.assertEqual(client.freeze(), installed)
+        with patch('procyon.core.install', new=lambda packages: [(name, 9) for name in packages]):
+            self.assertEqual(client.install(['kb', 'ui']), [('kb', 9), ('ui', 9)])
+
+    def test_wire_types(self):
+        result = (
+            True,
+            {'kb': set(['a', 'b']), 'ui': frozenset([('c', 1)])},
+            [datetime(2013, 1, 2, 3, 4, 5, 6), datetime(2013, 1, 2)],
+            {'__set__': 'plain', 'a': 1},
+        )
+        client = self.connect()
+
+        with patch('procyon.core.update', new=lambda: result):
+            self.assertEqual(client.update(), result)
+        with patch('procyon.core.search', new=lambda name: name):
+            self.assertEqual(client.search(('kb', 1)), ('kb', 1))
+
+    def test_socket_permissions(self):
+        umask = os.umask(0)
+        try:
+            server = DaemonServer(os.path.join(self.path, 'private.sock'))
+            server.server_close()
+        finally:
+            self.assertEqual(os.umask(umask), 0)
+
+        self.assertEqual(os.stat(os.path.join(self.path, 'private.sock')).st_mode & 0o777, 0o600)
+
+    def test_errors(self):
+        client = self.connect()
+
+        self.assertRaises(DaemonError, client.call, 'help')
+        self.assertRaises(AttributeError, getattr, client, 'help')
+        with patch('procyon.core.search', side_effect=ValueError('broken')):
+            self.assertRaises(DaemonError, client.search, 'kb')
+        self.assertEqual(self.server.coalescer.running, {})
+
+    def test_coalescing(self):
+        calls = []
+
+        def outdated():
+            calls.append(threading.current_thread())
+            time.sleep(0.2)
+            return {'kb': {'version': '1.0'}}
+
+        def search(name):
+            calls.append(name)
+            return {}
+
+        results = []
+        clients = [self.connect() for _ in range(3)]
+        threads = [threading.Thread(target=lambda client=client: results.append(client.outdated())) for client in clients]
+
+        with patch('procyon.core.outdated', new=outdated):
+            with patch('procyon.core.search', new=search):
+                for thread in threads:
+                    thread.start()
+                    time.sleep(0.02)
+                for thread in threads:
+                    thread.join()
+
+                clients[0].search('kb')
+                clients[1].search('ui')
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(results, [{'kb': {'version': '1.0'}}] * 3)
+
+    def test_get_core(self):
+        with patch('procyon.daemon.get_socket_path', new=lambda: self.socket_path):
+            client = get_core()
+            self.clients.append(client)
+            self.assertIsInstance(client, DaemonClient)
+
+        with patch('procyon.daemon.get_socket_path', new=lambda: os.path.join(self.path, 'missed.sock')):
+            self.assertIs(get_core(), core)
+
+
+if __name__ == '__main__':
+    unittest.main()
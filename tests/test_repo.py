@@ -3,16 +3,25 @@
 
 from __future__ import unicode_literals
 
+import os
+import shutil
+import subprocess
+import tempfile
 import unittest
 
-from git.exc import InvalidGitRepositoryError
+from git.cmd import Git
+from git.exc import InvalidGitRepositoryError, GitCommandError
 from mock import patch, MagicMock
 
-from procyon.repo.logic import update_repo
+from procyon import settings as procyon_settings
+from procyon.repo.files import read_repo_hexsha
+from procyon.repo.logic import get_changed_files, get_repo_hexsha, update_repo, open_or_clone_repo
 
 
 __all__ = (
     'LogicTests',
+    'FilesTests',
+    'CloneTests',
 )
 
 
@@ -21,6 +30,16 @@ def raise_invalid_git_repo_error(*args, **kwargs):
 
 
 class LogicTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.settings_patcher = patch.multiple(procyon_settings, PROCYON_PATH=self.path,
+            REPO_PATH=os.path.join(self.path, 'formulas'), REMOTE_REPO='file://' + os.path.join(self.path, 'missed'))
+        self.settings_patcher.start()
+
+    def tearDown(self):
+        self.settings_patcher.stop()
+        shutil.rmtree(self.path)
+
     @patch('procyon.repo.logic.GitRepo', new=MagicMock)
     def test_ok_update(self):
         result = update_repo()
@@ -35,6 +54,186 @@ class LogicTests(unittest.TestCase):
 
             self.assertEquals(result, (False, None, None))
 
+    def test_repo_hexsha(self):
+        with patch('procyon.repo.logic.GitRepo', new=MagicMock):
+            self.assertNotEquals(get_repo_hexsha(), None)
+
+        with patch('procyon.repo.logic.GitRepo', new=raise_invalid_git_repo_error):
+            self.assertEquals(get_repo_hexsha(), None)
+
+    def test_changed_files(self):
+        repo = MagicMock()
+        repo.git.diff.return_value = 'A\tnew.py\nM\tchanged.py\nD\tremoved.py\nT\tlink.py\n'
+
+        with patch('procyon.repo.logic.GitRepo', new=lambda path: repo):
+            result = get_changed_files('before', 'after')
+
+        self.assertEquals(result, [
+            ('A', 'new.py'),
+            ('M', 'changed.py'),
+            ('D', 'removed.py'),
+            ('M', 'link.py'),
+        ])
+
+    def test_changed_files_fail(self):
+        with patch('procyon.repo.logic.GitRepo', new=raise_invalid_git_repo_error):
+            self.assertEquals(get_changed_files('before', 'after'), None)
+
+
+class FilesTests(unittest.TestCase):
+    hexsha1 = 'a' * 40
+    hexsha2 = 'b' * 40
+
+    def setUp(self):
+        self.repo_path = tempfile.mkdtemp()
+        self.git_path = os.path.join(self.repo_path, '.git')
+        os.makedirs(os.path.join(self.git_path, 'refs', 'heads'))
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_path)
+
+    def write(self, path, content):
+        with open(os.path.join(self.git_path, path), 'wb') as f:
+            f.write(content.encode('utf-8'))
+
+    def test_loose_ref(self):
+        self.write('HEAD', 'ref: refs/heads/master\n')
+        self.write('refs/heads/master', self.hexsha1 + '\n')
+
+        self.assertEquals(read_repo_hexsha(self.repo_path), self.hexsha1)
+
+    def test_packed_ref(self):
+        self.write('HEAD', 'ref: refs/heads/master\n')
+        self.write('packed-refs', '# pack-refs with: peeled\n%s refs/heads/develop\n%s refs/heads/master\n' % (
+            self.hexsha1, self.hexsha2))
+
+        self.assertEquals(read_repo_hexsha(self.repo_path), self.hexsha2)
+
+    def test_detached_head(self):
+        self.write('HEAD', self.hexsha1)
+
+        self.assertEquals(read_repo_hexsha(self.repo_path), self.hexsha1)
+
+    def test_git_dir_file(self):
+        self.write('HEAD', self.hexsha1)
+        worktree_path = os.path.join(self.repo_path, 'worktree')
+        os.makedirs(worktree_path)
+        with open(os.path.join(worktree_path, '.git'), 'wb') as f:
+            f.write(b'gitdir: ../.git\n')
+
+        self.assertEquals(read_repo_hexsha(worktree_path), self.hexsha1)
+
+    def test_missed_ref(self):
+        self.assertEquals(read_repo_hexsha(self.repo_path), None)
+
+        self.write('HEAD', 'ref: refs/heads/master\n')
+        self.assertEquals(read_repo_hexsha(self.repo_path), None)
+
+        self.write('refs/heads/master', 'broken')
+        self.assertEquals(read_repo_hexsha(self.repo_path), None)
+
+
+class CloneTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.remote_path = os.path.join(self.path, 'remote')
+        os.makedirs(self.remote_path)
+        self.git('init', '-q')
+        for i in range(3):
+            self.commit({'formula%d.py' % i: 'version = %d' % i, 'data/readme.txt': 'commit %d' % i})
+
+        self.repo_path = os.path.join(self.path, 'formulas')
+        self.settings_patchers = [
+            patch.object(procyon_settings, 'PROCYON_PATH', self.path),
+            patch.object(procyon_settings, 'REPO_PATH', self.repo_path),
+            patch.object(procyon_settings, 'REMOTE_REPO', 'file://' + self.remote_path),
+            patch.object(procyon_settings, 'REPO_CLONE_DEPTH', 1),
+            patch.object(procyon_settings, 'REPO_SPARSE_CHECKOUT', False),
+        ]
+        for patcher in self.settings_patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.settings_patchers:
+            patcher.stop()
+        shutil.rmtree(self.path)
+
+    def git(self, *args):
+        env = dict(os.environ,
+            GIT_AUTHOR_NAME='procyon', GIT_AUTHOR_EMAIL='procyon@example.com',
+            GIT_COMMITTER_NAME='procyon', GIT_COMMITTER_EMAIL='procyon@example.com')
+        return subprocess.check_output(('git',) + args, cwd=self.remote_path, env=env).decode('utf-8').strip()
+
+    def commit(self, files):
+        for path, content in files.items():
+            path = os.path.join(self.remote_path, path)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(content.encode('utf-8'))
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', 'commit')
+        return self.git('rev-parse', 'HEAD')
+
+    def count_commits(self):
+        return int(Git(self.repo_path).rev_list('--count', 'HEAD'))
+
+    def test_failed_clone_keeps_existing_files(self):
+        os.makedirs(self.repo_path)
+        with open(os.path.join(self.repo_path, 'user.txt'), 'wb') as f:
+            f.write(b'user')
+
+        with patch.object(procyon_settings, 'REMOTE_REPO', 'file://' + os.path.join(self.path, 'missed')):
+            self.assertEqual(update_repo(), (False, None, None))
+
+        self.assertEqual(os.listdir(self.repo_path), ['user.txt'])
+
+    def test_shallow_clone(self):
+        result = update_repo()
+
+        self.assertEqual(result[0], True)
+        self.assertEqual(result[2], self.git('rev-parse', 'HEAD'))
+        self.assertEqual(self.count_commits(), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.repo_path, 'data', 'readme.txt')))
+
+    def test_shallow_fetch(self):
+        before = update_repo()[2]
+        after = self.commit({'formula3.py': 'version = 3', 'formula0.py': 'version = 4'})
+
+        self.assertEqual(update_repo(), (True, before, after))
+        self.assertEqual(get_repo_hexsha(), after)
+        self.assertEqual(sorted(get_changed_files(before, after)), [('A', 'formula3.py'), ('M', 'formula0.py')])
+        self.assertTrue(self.count_commits() <= 2)
+
+    def test_sparse_checkout(self):
+        with patch.object(procyon_settings, 'REPO_SPARSE_CHECKOUT', True):
+            update_repo()
+            after = self.commit({'formula3.py': 'version = 3', 'data/other.txt': 'other'})
+            self.assertEqual(update_repo()[2], after)
+
+        self.assertEqual(sorted(os.listdir(self.repo_path)), [
+            '.git', 'formula0.py', 'formula1.py', 'formula2.py', 'formula3.py'])
+
+    def test_full_clone(self):
+        with patch.object(procyon_settings, 'REPO_CLONE_DEPTH', 0):
+            before = update_repo()[2]
+            after = self.commit({'formula3.py': 'version = 3'})
+            self.assertEqual(update_repo(), (True, before, after))
+
+        self.assertEqual(self.count_commits(), 4)
+
+    def test_shallow_clone_fallback(self):
+        class ShallowUnsupportedGit(Git):
+            def clone(self, *args, **kwargs):
+                if kwargs.get('depth'):
+                    raise GitCommandError(['git', 'clone'], 128)
+                return self._call_process('clone', *args, **kwargs)
+
+        with patch('procyon.repo.logic.Git', new=ShallowUnsupportedGit):
+            self.assertEqual(open_or_clone_repo()[1], True)
+
+        self.assertEqual(self.count_commits(), 3)
+
 
 if __name__ == '__main__':
     unittest.main()
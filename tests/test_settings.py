@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from mock import patch
+
+from procyon import Settings
+
+
+__all__ = (
+    'SettingsTests',
+)
+
+
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SettingsTests(unittest.TestCase):
+    def setUp(self):
+        self.procyon_path = os.path.join(tempfile.mkdtemp(), 'procyon')
+        self.environ_patcher = patch.dict(os.environ, {'PROCYON_PATH': self.procyon_path})
+        self.environ_patcher.start()
+
+    def tearDown(self):
+        self.environ_patcher.stop()
+        shutil.rmtree(os.path.dirname(self.procyon_path))
+
+    def write_settings(self, settings):
+        os.makedirs(self.procyon_path)
+        with open(os.path.join(self.procyon_path, 'settings.json'), 'wb') as f:
+            json.dump(settings, f)
+
+    def test_lazy_loading(self):
+        settings = Settings()
+        self.assertFalse(os.path.exists(self.procyon_path))
+
+        self.assertEqual(settings.PROCYON_PATH, self.procyon_path)
+        self.assertTrue(os.path.exists(os.path.join(self.procyon_path, 'settings.json')))
+
+    def test_settings_file(self):
+        self.write_settings({'REMOTE_REPO': 'https://example.com/formulas.git', 'DOWNLOAD_WORKERS': 8})
+        settings = Settings()
+
+        self.assertEqual(settings.DOWNLOAD_WORKERS, 8)
+        self.assertEqual(settings.REPO_PATH, os.path.join(self.procyon_path, 'formulas'))
+
+    def test_assigned_settings(self):
+        self.write_settings({'DOWNLOAD_WORKERS': 8})
+        settings = Settings()
+        settings.DOWNLOAD_WORKERS = 2
+
+        self.assertEqual(settings.DOWNLOAD_WORKERS, 2)
+        self.assertRaises(AttributeError, getattr, settings, 'MISSED')
+
+    def test_missed_remote_repo(self):
+        self.write_settings({})
+        settings = Settings()
+
+        self.assertEqual(settings.DOWNLOAD_WORKERS, 4)
+        with patch('procyon.warnings.showwarning'):
+            self.assertRaises(SystemExit, getattr, settings, 'REPO_PATH')
+
+    def test_import_without_side_effects(self):
+        code = 'import sys; import procyon.core; print(" ".join(sorted(sys.modules)))'
+        env = dict(os.environ, PYTHONPATH=PROJECT_PATH)
+        output = subprocess.check_output([sys.executable, '-c', code], env=env).decode('utf-8')
+
+        self.assertFalse(os.path.exists(self.procyon_path))
+        for module in ('git', 'tarfile', 'zipfile', 'httplib', 'procyon.pkg.download'):
+            self.assertNotIn(module, output.split())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from procyon.tracing import span, traced, get_sink, set_sink, ListSink, ChromeTraceSink, NULL_SPAN
+
+
+__all__ = (
+    'TracingTests',
+)
+
+
+@traced('test.function')
+def traced_function(value, other=None):
+    return value
+
+
+class TracingTests(unittest.TestCase):
+    def setUp(self):
+        self.sink = ListSink()
+        set_sink(self.sink)
+
+    def tearDown(self):
+        set_sink(None)
+
+    def test_span(self):
+        with span('outer', package='kb') as outer_span:
+            with span('inner'):
+                pass
+            outer_span.set(status=9)
+
+        self.assertEqual([s.name for s in self.sink.spans], ['inner', 'outer'])
+        outer, inner = self.sink.spans[1], self.sink.spans[0]
+        self.assertEqual(outer.args, {'package': 'kb', 'status': 9})
+        self.assertTrue(outer.start <= inner.start)
+        self.assertTrue(outer.duration >= inner.duration)
+
+    def test_span_error(self):
+        def fail():
+            with span('failed'):
+                raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(self.sink.spans[0].args, {'error': 'ValueError'})
+
+    def test_traced(self):
+        self.assertEqual(traced_function(1, other=2), 1)
+        self.assertEqual(traced_function.__name__, 'traced_function')
+
+        self.assertEqual(self.sink.spans[0].name, 'test.function')
+        self.assertEqual(self.sink.spans[0].args, {'args': [1], 'other': 2})
+
+    def test_without_sink(self):
+        set_sink(None)
+
+        self.assertIs(span('disabled', package='kb'), NULL_SPAN)
+        with span('disabled') as disabled_span:
+            disabled_span.set(status=9)
+        self.assertEqual(traced_function(1), 1)
+        self.assertEqual(self.sink.spans, [])
+        self.assertEqual(get_sink(), None)
+
+    def test_chrome_trace(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        trace_path = os.path.join(path, 'trace.json')
+        set_sink(ChromeTraceSink(trace_path))
+
+        def download():
+            with span('download', package='kb'):
+                pass
+
+        with span('core.install', packages=['kb']):
+            thread = threading.Thread(target=download)
+            thread.start()
+            thread.join()
+        get_sink().close()
+
+        with open(trace_path, 'rb') as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual([event['name'] for event in events], ['core.install', 'download'])
+        self.assertEqual(events[0]['cat'], 'core')
+        self.assertEqual(events[0]['ph'], 'X')
+        self.assertEqual(events[0]['args'], {'packages': ['kb']})
+        self.assertNotEqual(events[0]['tid'], events[1]['tid'])
+        self.assertTrue(events[0]['dur'] >= events[1]['dur'])
+        self.assertEqual(os.listdir(path), ['trace.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()